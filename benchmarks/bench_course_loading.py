@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Compares the course lookups of the Chat tab view: the full course from the modulestore
+(get_course_with_access + has_access) against the cached course overview and the cached
+staff check (get_course_overview_with_access + courses.is_course_staff).
+
+Reports the time and the peak memory allocated per view. Unlike the other benchmarks, it needs
+the LMS and a real course, so it runs in the LMS shell (of an LMS with this plugin installed):
+
+    COURSE_ID=course-v1:NAU+IT_IS+2022_SUMMER USERNAME=someuser ITERATIONS=50 \
+        ./manage.py lms shell < benchmarks/bench_course_loading.py
+"""
+
+import os, time, tracemalloc
+
+from django.contrib.auth import get_user_model
+from edx_django_utils.cache import RequestCache
+from opaque_keys.edx.keys import CourseKey
+
+from lms.djangoapps.courseware.access import has_access
+from lms.djangoapps.courseware.courses import get_course_overview_with_access, get_course_with_access
+from rocketchat_tab import courses
+
+
+def lookup_course(user, course_key):
+    """The lookups made before: the course is loaded from the modulestore"""
+
+    course = get_course_with_access(user, "load", course_key)
+    return course.display_name, bool(has_access(user, 'staff', course))
+
+
+def lookup_overview(user, course_key):
+    """The lookups made now: the cached course overview and the cached staff check"""
+
+    course = get_course_overview_with_access(user, "load", course_key)
+    return course.display_name, courses.is_course_staff(user, course_key)
+
+
+def measure(function, user, course_key, iterations):
+    """Runs function like one view per iteration (the per-request caches are cleared)
+
+    Returns:
+        tuple: (median milliseconds, peak KiB allocated) per view
+    """
+
+    timings = []
+    peak = 0
+
+    for iteration in range(iterations):
+        RequestCache.clear_all_namespaces()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        function(user, course_key)
+        timings.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, peak / 1024.0
+
+
+def main():
+    course_id = os.environ['COURSE_ID']
+    username = os.environ['USERNAME']
+    iterations = int(os.environ.get('ITERATIONS', 50))
+
+    course_key = CourseKey.from_string(course_id)
+    user = get_user_model().objects.get(username=username)
+
+    # Warm up the process-wide caches (modulestore, course overview, Django cache) once
+    lookup_course(user, course_key)
+    lookup_overview(user, course_key)
+
+    print('{0} for {1}, {2} views'.format(course_id, username, iterations))
+    print('{0:<34}{1:>14}{2:>16}'.format('', 'median (ms)', 'peak (KiB)'))
+
+    results = []
+    for name, function in (('course (get_course_with_access)', lookup_course),
+                           ('overview + cached staff check', lookup_overview)):
+        median, peak = measure(function, user, course_key, iterations)
+        results.append((median, peak))
+        print('{0:<34}{1:>14.2f}{2:>16.1f}'.format(name, median, peak))
+
+    (course_time, course_peak), (overview_time, overview_peak) = results
+    print('{0:<34}{1:>13.1f}x{2:>15.1f}x'.format('reduction', course_time / overview_time, course_peak / overview_peak))
+
+
+main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Micro-benchmark of the per-call CPU cost of decoding Rocket.Chat responses and
+building request bodies, before and after the ApiResponse decoding layer.
+
+Usage (from the repository root):
+    python benchmarks/bench_decoding.py [iterations]
+"""
+
+import json, os, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+
+settings.configure(
+    ROCKETCHAT_BASE_URL='https://chat.example.org/',
+    ROCKETCHAT_ADMIN_TOKEN='token',
+    ROCKETCHAT_ADMIN_USER_ID='admin',
+)
+
+from requests.models import Response
+
+from rocketchat_tab.ApiRequest import ApiRequest
+from rocketchat_tab.ApiResponse import dumps, orjson
+from rocketchat_tab.RocketChat import RocketChat
+
+URL = 'https://chat.example.org//api/v1/users.info?username=someuser'
+
+USER_INFO = {
+    "user": {
+        "_id": "nSYqWzZ4GsKTX4dyK", "type": "user", "status": "offline", "active": True,
+        "name": "Some User", "utcOffset": 0, "username": "someuser",
+        "emails": [{"address": "someuser@example.com", "verified": True}],
+        "roles": ["user"], "createdAt": "2022-08-01T12:00:00.000Z",
+    },
+    "success": True,
+}
+
+
+def make_response(body):
+    resp = Response()
+    resp.status_code = 200
+    resp._content = json.dumps(body).encode('utf-8')
+    return resp
+
+
+def decode_before(resp, url):
+    """The decoding used before ApiResponse: is_json() parse, then a second parse"""
+
+    try:
+        json.loads(resp.content)
+        valid = True
+    except ValueError:
+        valid = False
+
+    if (valid):
+        return json.loads(resp.content)
+
+    json_error = '{{"status": "Failure", \
+        "message": "The API returned invalid JSON. Verify the URL:\\n{0}"}}'.format(url)
+    return json.loads(json_error)
+
+
+def check_before(json_resp):
+    """The string-keyed success check used before ApiResponse"""
+
+    if (json_resp.get('success') == 'True' or json_resp.get('success') == True):
+        return json_resp.get('user', {}).get('_id')
+
+
+def body_before():
+    return '{{ "username": "{0}",  "email": "{1}", "password": "{2}", \
+            "name": "{3}", "active": true, "verified": true, "requirePasswordChange": false, \
+            "sendWelcomeEmail": false }}'.format(
+                'someuser', 'someuser@example.com', '0123456789abcdef', 'Some User')
+
+
+def body_after():
+    return dumps({
+        "username": 'someuser', "email": 'someuser@example.com', "password": '0123456789abcdef',
+        "name": 'Some User', "active": True, "verified": True, "requirePasswordChange": False,
+        "sendWelcomeEmail": False,
+    })
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    resp = make_response(USER_INFO)
+    api = ApiRequest(session=object())
+    rocket_chat = RocketChat.__new__(RocketChat)
+
+    def before():
+        check_before(decode_before(resp, URL))
+
+    def after():
+        api_resp = api.verify_api_request(resp, URL, False)
+        rocket_chat.check_json_for_success(api_resp)
+        api_resp.user_id
+
+    print('JSON backend: {0}'.format('orjson' if orjson is not None else 'json'))
+    print('{0:<28}{1:>14}{2:>14}{3:>10}'.format('', 'before (us)', 'after (us)', 'speedup'))
+
+    for name, old, new in (('decode + check response', before, after),
+                           ('build users.create body', body_before, body_after)):
+        old_time = min(timeit.repeat(old, number=iterations, repeat=3)) / iterations * 1e6
+        new_time = min(timeit.repeat(new, number=iterations, repeat=3)) / iterations * 1e6
+        print('{0:<28}{1:>14.2f}{2:>14.2f}{3:>9.2f}x'.format(name, old_time, new_time, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
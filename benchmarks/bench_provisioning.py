@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Load benchmark of the Chat tab provisioning (the work of RocketChatView.init_rocket_chat_room)
+against the fake Rocket.Chat server in fake_rocketchat.py, or a real test server.
+
+For each concurrency level, a new course is provisioned for new users (cold: the room, users
+and memberships are created), then again for the same users (warm: everything is cached).
+Reports the p50/p95/p99 latency, the throughput and the Rocket.Chat calls per view.
+
+Usage (from the repository root):
+    python benchmarks/bench_provisioning.py [--concurrency 1,8,32] [--users 200]
+                                            [--latency 0.02] [--error-rate 0.01] [--rate-limit 100]
+                                            [--async-client | --transport realtime] [--url https://test.chat.site/ --token ... --user-id ...]
+"""
+
+import argparse, collections, os, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+
+class CallCounter(object):
+    """A metrics sink (see rocketchat_tab.metrics) that counts the calls to Rocket.Chat"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.errors = collections.Counter()
+        self.views = collections.Counter()
+
+    def timing(self, name, seconds, labels):
+        with self.lock:
+            if (name == 'rocketchat_api_request_seconds'):
+                self.calls[labels['endpoint']] += 1
+            elif (name == 'rocketchat_provisioning_seconds'):
+                self.views[labels['path']] += 1
+
+    def increment(self, name, labels):
+        with self.lock:
+            self.errors[labels['error_type']] += 1
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors.clear()
+            self.views.clear()
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values"""
+
+    if (not values):
+        return 0.0
+
+    index = max(int(round(percent / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def make_edx_info(course, index, staff_ratio):
+    username = 'bench-{0}-{1}'.format(course.replace('+', '-'), index)
+    is_staff = staff_ratio > 0 and index % max(int(1 / staff_ratio), 1) == 0
+
+    return {
+        "user": {
+            "username": username,
+            "email": '{0}@example.org'.format(username),
+            "display_name": username,
+            "is_staff": is_staff,
+            "is_enrolled": True,
+        },
+        "course": {
+            "name": course,
+            "key": 'course-v1:Bench+{0}+2024'.format(course),
+        }
+    }
+
+
+def run_phase(provision, edx_infos, concurrency, counter):
+    """Provisions every user with 'concurrency' views at a time
+
+    Returns:
+        dict: The latencies (sorted), elapsed time, calls and failures of the phase
+    """
+
+    from rocketchat_tab.RocketChatError import RocketChatError
+
+    counter.reset()
+    failures = collections.Counter()
+
+    def view(edx_info):
+        started = time.monotonic()
+        try:
+            provision(edx_info)
+        except RocketChatError as e:
+            failures[str(e)[:60]] += 1
+        except Exception as e:
+            failures[type(e).__name__] += 1
+        return time.monotonic() - started
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(view, edx_infos))
+    elapsed = time.monotonic() - started
+
+    return {
+        "latencies": latencies,
+        "elapsed": elapsed,
+        "calls": sum(counter.calls.values()),
+        "endpoints": dict(counter.calls),
+        "errors": dict(counter.errors),
+        "warm": counter.views['warm'],
+        "failures": failures,
+    }
+
+
+def report(phase, concurrency, result):
+    latencies = result['latencies']
+    views = len(latencies)
+
+    print('{0:<6}{1:>6}{2:>7}{3:>10.1f}{4:>10.1f}{5:>10.1f}{6:>10.1f}{7:>11.2f}{8:>8.0%}{9:>8}'.format(
+        phase, concurrency, views,
+        percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000,
+        views / result['elapsed'], result['calls'] / float(views),
+        result['warm'] / float(views), sum(result['failures'].values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chat tab provisioning load benchmark')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma separated concurrency levels')
+    parser.add_argument('--users', type=int, default=200, help='Users provisioned at each level')
+    parser.add_argument('--staff-ratio', type=float, default=0.05, help='Share of users that are course staff (room owners)')
+    parser.add_argument('--async-client', action='store_true', help='Use the asyncio client (ROCKETCHAT_ASYNC_CLIENT)')
+    parser.add_argument('--transport', choices=('rest', 'realtime'), default='rest',
+                        help='Transport of the admin calls (ROCKETCHAT_TRANSPORT)')
+    parser.add_argument('--verbose', action='store_true', help='Print the calls per endpoint and the errors')
+
+    fake = parser.add_argument_group('fake server')
+    fake.add_argument('--latency', type=float, default=0.02, help='Seconds each call takes')
+    fake.add_argument('--jitter', type=float, default=0.005, help='+/- seconds added to the latency at random')
+    fake.add_argument('--error-rate', type=float, default=0.0, help='Share of calls (0 to 1) that fail with HTTP 500')
+    fake.add_argument('--rate-limit', type=int, default=0, help='Calls allowed per endpoint in each window (0: no limit)')
+    fake.add_argument('--rate-interval', type=float, default=60, help='Seconds of a rate limit window')
+
+    real = parser.add_argument_group('real server (instead of the fake server)')
+    real.add_argument('--url', help='Rocket.Chat base URL of a test server')
+    real.add_argument('--token', help='Admin X-Auth-Token')
+    real.add_argument('--user-id', help='Admin X-User-Id')
+
+    args = parser.parse_args()
+
+    server = None
+    if (args.url):
+        base_url, token, user_id = args.url, args.token, args.user_id
+    else:
+        import fake_rocketchat
+        server = fake_rocketchat.start(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                       rate_limit=args.rate_limit, rate_interval=args.rate_interval)
+        base_url, token, user_id = server.url, 'token', 'admin'
+
+    # One LMS worker process: in-process caches and a local memory Django cache
+    settings.configure(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+
+    from rocketchat_tab.settings.common import plugin_settings
+    plugin_settings(settings)
+    settings.ROCKETCHAT_BASE_URL = base_url
+    settings.ROCKETCHAT_ADMIN_TOKEN = token
+    settings.ROCKETCHAT_ADMIN_USER_ID = user_id
+    settings.ROCKETCHAT_ASYNC_CLIENT = args.async_client
+    settings.ROCKETCHAT_TRANSPORT = args.transport
+    # No database here: the IDs are only cached
+    settings.ROCKETCHAT_ID_STORE = False
+    django.setup()
+
+    from rocketchat_tab import metrics, provisioning
+
+    # Same choice as RocketChatView.init_rocket_chat_room
+    if (args.async_client):
+        provision = provisioning.provision_room_async
+    else:
+        provision = provisioning.provision_room
+
+    counter = CallCounter()
+    metrics.sink = counter
+    metrics.enabled = True
+
+    print('Rocket.Chat: {0}{1}'.format(base_url, '' if args.url else ' (fake, latency {0} ms)'.format(args.latency * 1000)))
+    print('Client: {0}, {1} transport'.format('asyncio' if args.async_client else 'threads', args.transport))
+    print('{0:<6}{1:>6}{2:>7}{3:>10}{4:>10}{5:>10}{6:>10}{7:>11}{8:>8}{9:>8}'.format(
+        'phase', 'conc', 'views', 'p50 ms', 'p95 ms', 'p99 ms', 'views/s', 'calls/view', 'warm', 'failed'))
+
+    for concurrency in [int(value) for value in args.concurrency.split(',')]:
+        course = 'C{0}x{1}'.format(concurrency, int(time.time()))
+        edx_infos = [make_edx_info(course, index, args.staff_ratio) for index in range(args.users)]
+
+        for phase in ('cold', 'warm'):
+            result = run_phase(provision, edx_infos, concurrency, counter)
+            report(phase, concurrency, result)
+
+            if (args.verbose):
+                print('      calls: {0}'.format(result['endpoints']))
+                if (result['errors']):
+                    print('      errors: {0}'.format(result['errors']))
+                if (result['failures']):
+                    print('      failures: {0}'.format(dict(result['failures'])))
+
+    if (server is not None):
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
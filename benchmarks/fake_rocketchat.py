@@ -0,0 +1,607 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+A local stand-in for the Rocket.Chat REST API, for benchmarks.
+
+Implements the groups.* and users.* endpoints used by the plugin, with the same success and
+error responses as Rocket.Chat. Each call can be slowed down (latency), fail with HTTP 500
+(error injection) or be rejected by a per-endpoint rate limit with the X-RateLimit headers.
+Rooms and users only live in memory. subscriptions.get is answered for the user of the login
+token sent (see users.createToken) and counts the unread messages of each room member.
+
+The realtime API (DDP over a WebSocket, at /websocket) answers the methods used by the
+realtime transport. Method calls get the same latency, but are answered concurrently and
+in any order, like Rocket.Chat does. They are counted by method name.
+
+Usage (from the repository root):
+    python benchmarks/fake_rocketchat.py [--port 3000] [--latency 0.02] [--error-rate 0.01]
+                                         [--rate-limit 100] [--rate-interval 60]
+
+Or from Python:
+    server = fake_rocketchat.start(latency=0.02)
+    ... ROCKETCHAT_BASE_URL = server.url ...
+    server.fake.calls['groups.create']
+    server.shutdown()
+"""
+
+import argparse, base64, collections, hashlib, json, random, struct, threading, time, uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+class FakeRocketChat(object):
+    """The rooms, users and memberships of the fake server, and the calls made to it
+
+    Attributes:
+        latency -- seconds each call takes (on average)
+        jitter -- +/- seconds added to the latency at random
+        error_rate -- share of calls (0 to 1) that fail with HTTP 500
+        rate_limit -- calls allowed per endpoint in each window (0: no limit)
+        rate_interval -- seconds of a rate limit window
+        calls -- number of calls per endpoint
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=0, rate_interval=60):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_interval = rate_interval
+
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.rooms = {}
+        self.users = {}
+        self.rooms_by_id = {}
+        self.users_by_id = {}
+        self.members = collections.defaultdict(set)
+        self.owners = collections.defaultdict(set)
+        self.messages = collections.defaultdict(list)
+        self.subscriptions = {}
+        self.removed_subscriptions = []
+        self.tokens = {}
+        self.windows = {}
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+
+    def take_rate_limit(self, endpoint):
+        """Counts a call in the endpoint's window
+
+        Returns:
+            tuple: (allowed, headers)
+        """
+
+        if (not self.rate_limit):
+            return True, {}
+
+        now = time.time()
+
+        with self.lock:
+            reset, used = self.windows.get(endpoint, (0, 0))
+            if (now >= reset):
+                reset, used = now + self.rate_interval, 0
+
+            used += 1
+            self.windows[endpoint] = (reset, used)
+
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(max(self.rate_limit - used, 0)),
+            "X-RateLimit-Reset": str(int(reset * 1000)),
+        }
+        return used <= self.rate_limit, headers
+
+    def handle(self, method, endpoint, query, data, auth=None):
+        """Runs an API call
+
+        Args:
+            auth (tuple): The (X-User-Id, X-Auth-Token) headers sent
+
+        Returns:
+            tuple: (HTTP status, JSON body)
+        """
+
+        handler = getattr(self, 'api_' + endpoint.replace('.', '_'), None)
+        if (handler is None):
+            return 404, {"success": False, "error": "Not found"}
+
+        with self.lock:
+            if (endpoint in USER_ENDPOINTS):
+                return handler(query if method == 'GET' else data, auth)
+            return handler(query if method == 'GET' else data)
+
+    # Rooms (private groups)
+
+    def api_groups_info(self, params):
+        room = self.rooms.get(params.get('roomName')) or self.find_room(params.get('roomId'))
+        if (room is None):
+            return 400, error('error-room-not-found', 'The required "roomId" or "roomName" param provided does not match any group')
+        return 200, {"group": room, "success": True}
+
+    def api_groups_create(self, params):
+        name = params.get('name')
+        if (name in self.rooms):
+            return 400, error('error-duplicate-channel-name', 'A channel with name \'{0}\' exists'.format(name))
+
+        room = {"_id": uuid.uuid4().hex[:17], "name": name, "fname": name, "t": "p", "msgs": 0, "usersCount": 0}
+        self.rooms[name] = self.rooms_by_id[room['_id']] = room
+        return 200, {"group": room, "success": True}
+
+    def api_groups_invite(self, params):
+        room, user = self.find_room(params.get('roomId')), self.find_user(params.get('userId'))
+        if (room is None):
+            return 400, error('error-room-not-found', 'The required "roomId" or "roomName" param provided does not match any group')
+        if (user is None):
+            return 400, error('error-invalid-user', 'Invalid user')
+
+        self.members[room['_id']].add(user['_id'])
+        room['usersCount'] = len(self.members[room['_id']])
+
+        if ((room['_id'], user['_id']) not in self.subscriptions):
+            self.subscriptions[(room['_id'], user['_id'])] = {
+                "_id": uuid.uuid4().hex[:17], "rid": room['_id'], "name": room['name'], "t": "p",
+                "u": {"_id": user['_id'], "username": user['username']}, "unread": 0, "_updatedAt": now()}
+
+        return 200, {"group": room, "success": True}
+
+    def api_groups_kick(self, params):
+        room = self.find_room(params.get('roomId'))
+        if (room is None):
+            return 400, error('error-room-not-found', 'The required "roomId" or "roomName" param provided does not match any group')
+        if (params.get('userId') not in self.members[room['_id']]):
+            return 400, error('error-user-not-in-room', 'User is not in this room')
+
+        self.members[room['_id']].discard(params.get('userId'))
+        self.owners[room['_id']].discard(params.get('userId'))
+        room['usersCount'] = len(self.members[room['_id']])
+
+        subscription = self.subscriptions.pop((room['_id'], params.get('userId')), None)
+        if (subscription is not None):
+            self.removed_subscriptions.append(
+                {"_id": subscription['_id'], "u": subscription['u'], "_deletedAt": now()})
+
+        return 200, {"group": room, "success": True}
+
+    def api_groups_addOwner(self, params):
+        room_id, user_id = params.get('roomId'), params.get('userId')
+        if (self.find_room(room_id) is None):
+            return 400, error('error-room-not-found', 'The required "roomId" or "roomName" param provided does not match any group')
+        if (user_id not in self.members[room_id]):
+            return 400, error('error-user-not-in-room', 'User is not in this room')
+        if (user_id in self.owners[room_id]):
+            return 400, error('error-user-already-owner', 'User is already an owner')
+
+        self.owners[room_id].add(user_id)
+        return 200, {"success": True}
+
+    def api_groups_removeOwner(self, params):
+        room_id, user_id = params.get('roomId'), params.get('userId')
+        if (user_id not in self.owners[room_id]):
+            return 400, error('error-user-not-owner', 'User is not an owner')
+
+        self.owners[room_id].discard(user_id)
+        return 200, {"success": True}
+
+    def api_groups_members(self, params):
+        room = self.find_room(params.get('roomId'))
+        if (room is None):
+            return 400, error('error-room-not-found', 'The required "roomId" or "roomName" param provided does not match any group')
+
+        offset, count = int(params.get('offset', 0)), int(params.get('count', 50))
+        members = sorted((self.users_by_id[user_id] for user_id in self.members[room['_id']]),
+                         key=lambda user: user['username'])
+        page = [{"_id": user['_id'], "username": user['username'], "name": user['name'], "status": "offline"}
+                for user in members[offset:offset + count]]
+        return 200, {"members": page, "count": len(page), "offset": offset, "total": len(members), "success": True}
+
+    def api_groups_roles(self, params):
+        room = self.find_room(params.get('roomId'))
+        if (room is None):
+            return 400, error('error-room-not-found', 'The required "roomId" or "roomName" param provided does not match any group')
+
+        roles = [{"rid": room['_id'], "u": {"_id": user_id, "username": self.users_by_id[user_id]['username']},
+                  "roles": ["owner"]} for user_id in self.owners[room['_id']]]
+        return 200, {"roles": roles, "success": True}
+
+    def api_groups_history(self, params):
+        room = self.find_room(params.get('roomId'))
+        if (room is None):
+            return 400, error('error-room-not-found', 'The required "roomId" or "roomName" param provided does not match any group')
+
+        # ISO 8601 times in UTC with milliseconds compare in time order
+        oldest, latest = params.get('oldest', ''), params.get('latest', '9999')
+        inclusive = params.get('inclusive') == 'true'
+        offset, count = int(params.get('offset', 0)), int(params.get('count', 20))
+
+        messages = [message for message in reversed(self.messages[room['_id']])
+                    if (oldest <= message['ts'] <= latest if inclusive else oldest < message['ts'] < latest)]
+        return 200, {"messages": messages[offset:offset + count], "success": True}
+
+    def add_message(self, room_id, username, text='Hello', ts=None, message_type=None):
+        """Posts a message in a room (messages are kept in time order). For tests and benchmarks
+
+        Args:
+            room_id (string): The room ID
+            username (string): The sender
+            ts (string): The ISO 8601 time in UTC, e.g. '2024-01-31T12:00:00.000Z' (now if None)
+            message_type (string): The type of a system message, e.g. 'uj' (user joined)
+        """
+
+        if (ts is None):
+            ts = now()
+
+        with self.lock:
+            user = self.users[username]
+            message = {"_id": uuid.uuid4().hex[:17], "rid": room_id, "msg": text, "ts": ts,
+                       "u": {"_id": user['_id'], "username": username, "name": user['name']}}
+            if (message_type):
+                message['t'] = message_type
+
+            self.messages[room_id].append(message)
+            self.messages[room_id].sort(key=lambda message: message['ts'])
+            self.rooms_by_id[room_id]['msgs'] = len(self.messages[room_id])
+
+            if (not message_type):
+                # Unread by the other members until they read the room
+                for member in self.members[room_id] - {user['_id']}:
+                    subscription = self.subscriptions.get((room_id, member))
+                    if (subscription is not None):
+                        subscription['unread'] += 1
+                        subscription['_updatedAt'] = now()
+
+        return message
+
+    def read_room(self, room_id, username):
+        """Marks the messages of a room as read by a user. For tests and benchmarks"""
+
+        with self.lock:
+            subscription = self.subscriptions.get((room_id, self.users[username]['_id']))
+            if (subscription is not None and subscription['unread']):
+                subscription['unread'] = 0
+                subscription['_updatedAt'] = now()
+
+    # Subscriptions (the rooms of the user of the login token)
+
+    def api_subscriptions_get(self, params, auth):
+        user_id, token = auth or (None, None)
+        if (user_id is None or self.tokens.get(token) != user_id):
+            return 401, {"status": "error", "message": "You must be logged in to do this."}
+
+        updated_since = params.get('updatedSince', '')
+        update = [subscription for subscription in self.subscriptions.values()
+                  if subscription['u']['_id'] == user_id and subscription['_updatedAt'] > updated_since]
+        remove = [{"_id": subscription['_id'], "_deletedAt": subscription['_deletedAt']}
+                  for subscription in self.removed_subscriptions
+                  if subscription['u']['_id'] == user_id and updated_since and subscription['_deletedAt'] > updated_since]
+
+        return 200, {"update": update, "remove": remove, "success": True}
+
+    def api_groups_listAll(self, params):
+        offset, count = int(params.get('offset', 0)), int(params.get('count', 50))
+        rooms = list(self.rooms.values())
+        page = rooms[offset:offset + count]
+        return 200, {"groups": page, "count": len(page), "offset": offset, "total": len(rooms), "success": True}
+
+    # Users
+
+    def api_users_info(self, params):
+        user = self.users.get(params.get('username')) or self.find_user(params.get('userId'))
+        if (user is None):
+            return 400, {"success": False, "error": "User not found."}
+        return 200, {"user": user, "success": True}
+
+    def api_users_create(self, params):
+        username = params.get('username')
+        if (username in self.users):
+            return 400, error('error-field-unavailable', '{0} is already in use :('.format(username))
+
+        user = {"_id": uuid.uuid4().hex[:17], "username": username, "name": params.get('name'),
+                "emails": [{"address": params.get('email'), "verified": True}],
+                "type": "user", "active": True, "roles": ["user"]}
+        self.users[username] = self.users_by_id[user['_id']] = user
+        return 200, {"user": user, "success": True}
+
+    def api_users_list(self, params):
+        offset, count = int(params.get('offset', 0)), int(params.get('count', 50))
+        users = list(self.users.values())
+        page = [{"_id": user['_id'], "username": user['username']} for user in users[offset:offset + count]]
+        return 200, {"users": page, "count": len(page), "offset": offset, "total": len(users), "success": True}
+
+    def api_users_createToken(self, params):
+        user = self.find_user(params.get('userId'))
+        if (user is None):
+            return 400, error('error-invalid-user', 'Invalid user')
+        token = uuid.uuid4().hex
+        self.tokens[token] = user['_id']
+        return 200, {"data": {"userId": user['_id'], "authToken": token}, "success": True}
+
+    def handle_method(self, method, params):
+        """Answers a realtime method call
+
+        Returns:
+            dict: The DDP 'result' or 'error' of the call
+        """
+
+        if (method == 'login'):
+            return {"result": {"id": "admin", "token": params[0].get('resume')}}
+
+        if (method in ('addUsersToRoom', 'removeUserFromRoom')):
+            options = params[0]
+            usernames = options.get('users') or [options.get('username')]
+
+            with self.lock:
+                users = [self.users.get(username) for username in usernames]
+
+            if (None in users):
+                return self.method_error('error-invalid-user', 'Invalid user')
+
+            endpoint = 'groups.invite' if method == 'addUsersToRoom' else 'groups.kick'
+            for user in users:
+                status, payload = self.handle('POST', endpoint, {}, {'roomId': options['rid'], 'userId': user['_id']})
+                if (not payload.get('success')):
+                    if (payload.get('errorType') == 'error-room-not-found'):
+                        return self.method_error('error-invalid-room', 'Invalid room')
+                    return self.method_error(payload.get('errorType'), payload.get('error'))
+
+            return {"result": True}
+
+        if (method not in DDP_METHODS):
+            return self.method_error('404', 'Method \'{0}\' not found'.format(method))
+
+        endpoint, build_params, build_result = DDP_METHODS[method]
+        request = build_params(params)
+        http_method = 'GET' if endpoint == 'groups.info' else 'POST'
+
+        status, payload = self.handle(http_method, endpoint, request if http_method == 'GET' else {}, request)
+        if (not payload.get('success')):
+            return self.method_error(payload.get('errorType') or 'error', payload.get('error'))
+
+        return {"result": build_result(payload)}
+
+    def method_error(self, error_type, reason):
+        # The REST errors end with the error type, the method errors do not
+        reason = str(reason).replace(' [{0}]'.format(error_type), '')
+        return {"error": {"isClientSafe": True, "error": error_type, "reason": reason,
+                          "message": '{0} [{1}]'.format(reason, error_type), "errorType": "Meteor.Error"}}
+
+    def find_room(self, room_id):
+        return self.rooms_by_id.get(room_id)
+
+    def find_user(self, user_id):
+        return self.users_by_id.get(user_id)
+
+
+# Endpoints answered for the user of the login token sent
+USER_ENDPOINTS = {'subscriptions.get'}
+
+# Realtime methods and the REST endpoint each one is answered by:
+#   method -> (endpoint, REST parameters from the method parameters, result from the REST response)
+DDP_METHODS = {
+    'getRoomByTypeAndName': ('groups.info', lambda params: {'roomName': params[1]},
+                             lambda payload: payload['group']),
+    'createPrivateGroup': ('groups.create', lambda params: {'name': params[0]},
+                           lambda payload: {'rid': payload['group']['_id'], 'name': payload['group']['name']}),
+    'addRoomOwner': ('groups.addOwner', lambda params: {'roomId': params[0], 'userId': params[1]},
+                     lambda payload: True),
+    'removeRoomOwner': ('groups.removeOwner', lambda params: {'roomId': params[0], 'userId': params[1]},
+                        lambda payload: True),
+    'insertOrUpdateUser': ('users.create', lambda params: params[0],
+                           lambda payload: payload['user']['_id']),
+    'createToken': ('users.createToken', lambda params: {'userId': params[0]},
+                    lambda payload: payload['data']),
+}
+
+# Sent after the key by the client to prove the handshake (RFC 6455)
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def now():
+    """Gets the current time like Rocket.Chat: ISO 8601 in UTC, with milliseconds"""
+
+    current = time.time()
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(current)) + '.{0:03d}Z'.format(int(current * 1000) % 1000)
+
+
+def error(error_type, message):
+    return {"success": False, "error": "{0} [{1}]".format(message, error_type), "errorType": error_type}
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    # Keep-alive connections, like Rocket.Chat. Headers and body are written separately, so
+    # Nagle's algorithm would add a delayed-ACK stall to every response
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if (self.headers.get('Upgrade', '').lower() == 'websocket'):
+            return self.websocket()
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        fake = self.server.fake
+        parts = urlsplit(self.path)
+        endpoint = parts.path.rsplit('/', 1)[-1]
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        with fake.lock:
+            fake.calls[endpoint] += 1
+
+        delay = fake.latency + random.uniform(-fake.jitter, fake.jitter)
+        if (delay > 0):
+            time.sleep(delay)
+
+        if (endpoint == 'info' and parts.path.endswith('/api/info')):
+            return self.reply(200, {"version": "fake", "success": True})
+
+        allowed, headers = fake.take_rate_limit(endpoint)
+        if (not allowed):
+            return self.reply(429, error('error-too-many-requests', 'Error, too many requests. Please slow down.'), headers)
+
+        if (fake.error_rate and random.random() < fake.error_rate):
+            return self.reply(500, {"success": False, "error": "Injected server error"}, headers)
+
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return self.reply(400, {"success": False, "error": "Invalid JSON"}, headers)
+
+        auth = (self.headers.get('X-User-Id'), self.headers.get('X-Auth-Token'))
+        status, payload = fake.handle(method, endpoint, query, data, auth)
+        self.reply(status, payload, headers)
+
+    def websocket(self):
+        """Serves a realtime (DDP) connection until the client closes it"""
+
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        fake = self.server.fake
+        write_lock = threading.Lock()
+
+        def send(message):
+            data = json.dumps(message).encode('utf-8')
+            if (len(data) < 126):
+                header = struct.pack('!BB', 0x81, len(data))
+            elif (len(data) < 65536):
+                header = struct.pack('!BBH', 0x81, 126, len(data))
+            else:
+                header = struct.pack('!BBQ', 0x81, 127, len(data))
+            with write_lock:
+                self.wfile.write(header + data)
+                self.wfile.flush()
+
+        def answer(message):
+            with fake.lock:
+                fake.calls[message.get('method')] += 1
+
+            delay = fake.latency + random.uniform(-fake.jitter, fake.jitter)
+            if (delay > 0):
+                time.sleep(delay)
+
+            send(dict(fake.handle_method(message.get('method'), message.get('params') or []),
+                      msg='result', id=message.get('id')))
+
+        while True:
+            frame = self.read_frame()
+            if (frame is None):
+                return
+
+            opcode, payload = frame
+            if (opcode == 0x8):
+                return
+            if (opcode != 0x1):
+                continue
+
+            message = json.loads(payload)
+            kind = message.get('msg')
+
+            if (kind == 'connect'):
+                send({"msg": "connected", "session": uuid.uuid4().hex})
+            elif (kind == 'ping'):
+                send({"msg": "pong"})
+            elif (kind == 'method'):
+                threading.Thread(target=answer, args=(message,), daemon=True).start()
+
+    def read_frame(self):
+        """Reads a (masked) client frame
+
+        Returns:
+            tuple: (opcode, payload) -OR- None if the connection was closed
+        """
+
+        header = self.rfile.read(2)
+        if (len(header) < 2):
+            return None
+
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if (length == 126):
+            length = struct.unpack('!H', self.rfile.read(2))[0]
+        elif (length == 127):
+            length = struct.unpack('!Q', self.rfile.read(8))[0]
+
+        mask = self.rfile.read(4) if header[1] & 0x80 else b'\x00\x00\x00\x00'
+        payload = bytearray(self.rfile.read(length))
+        for index in range(length):
+            payload[index] ^= mask[index % 4]
+
+        return opcode, bytes(payload)
+
+    def reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start(host='127.0.0.1', port=0, **options):
+    """Starts the fake server on a background thread
+
+    Args:
+        host (string): The interface to listen on
+        port (int): The port to listen on (0: any free port)
+        options: The FakeRocketChat options (latency, jitter, error_rate, rate_limit, rate_interval)
+
+    Returns:
+        ThreadingHTTPServer: The server. server.url is the base URL and server.fake its state
+    """
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.fake = FakeRocketChat(**options)
+    server.url = 'http://{0}:{1}/'.format(host, server.server_port)
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='A local stand-in for the Rocket.Chat REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each call takes')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds added to the latency at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls (0 to 1) that fail with HTTP 500')
+    parser.add_argument('--rate-limit', type=int, default=0, help='Calls allowed per endpoint in each window (0: no limit)')
+    parser.add_argument('--rate-interval', type=float, default=60, help='Seconds of a rate limit window')
+    args = parser.parse_args()
+
+    server = start(args.host, args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   rate_limit=args.rate_limit, rate_interval=args.rate_interval)
+    print('Fake Rocket.Chat listening on {0}'.format(server.url))
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,143 @@
 # -*- coding: utf-8 -*-
 
 
-import json, requests
+import json, os, random, threading, time, requests
+from requests.adapters import HTTPAdapter
 from requests.structures import CaseInsensitiveDict
 
 from django.conf import settings
 
+from . import backends, metrics
+from .ApiResponse import ApiResponse
+from .CircuitBreaker import get_circuit_breaker
+from .RateLimiter import get_endpoint, get_rate_limiter
+
+# Headers only sent with POST requests. The shared headers are set once on the session.
+POST_HEADERS = {"Content-type": "application/json"}
+
+# One pooled session per backend in each worker process. The PID is tracked so that sessions
+# created in a pre-forking master (e.g. gunicorn --preload) are never shared with the workers.
+_sessions = {}
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session(backend):
+    """Gets the process-wide pooled session of a backend, creating it on first use
+
+    Args:
+        backend (Backend): The Rocket.Chat server (see backends)
+
+    Returns:
+        requests.Session: A keep-alive session with the backend's admin headers already set
+    """
+
+    global _sessions, _session_pid
+
+    pid = os.getpid()
+    session = _sessions.get(backend.name) if _session_pid == pid else None
+    if (session is not None):
+        return session
+
+    with _session_lock:
+        if (_session_pid != pid):
+            _sessions = {}
+            _session_pid = pid
+
+        session = _sessions.get(backend.name)
+        if (session is None):
+            session = _sessions[backend.name] = build_session(backend)
+
+    return session
+
+
+def get_timeout():
+    """Gets the (connect, read) timeout in seconds for calls to Rocket.Chat"""
+
+    return (getattr(settings, 'ROCKETCHAT_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'ROCKETCHAT_READ_TIMEOUT', 10))
+
+
+def build_session(backend):
+    """Builds a keep-alive session with a connection pool sized from the settings
+
+    Args:
+        backend (Backend): The Rocket.Chat server whose admin credentials are sent
+
+    Returns:
+        requests.Session: The new session
+    """
+
+    pool_size = getattr(settings, 'ROCKETCHAT_HTTP_POOL_SIZE', 10)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    # Default headers are computed once instead of on every call
+    headers = CaseInsensitiveDict()
+    headers["Accept"] = "application/json"
+    headers["X-Auth-Token"] = backend.admin_token
+    headers["X-User-Id"] = backend.admin_user_id
+    session.headers.update(headers)
+
+    return session
+
+
 class ApiRequest(object):
 
+    def __init__(self, backend=None, session=None, auth=None):
+        """
+        :param backend: The Rocket.Chat server called (see backends.get_default_backend)
+        :param session: Optional requests.Session to use instead of the shared pooled session
+        :param auth: Optional (user ID, auth token) to call as that user instead of the admin
+        """
+        self.backend = backend or backends.get_default_backend()
+        self._session = session
+        self.auth_headers = {"X-User-Id": auth[0], "X-Auth-Token": auth[1]} if auth else None
+
+        # Number of calls made with this object (a warm provisioning makes none)
+        self.calls = 0
+
+    @property
+    def session(self):
+        return self._session or get_session(self.backend)
+
+    @staticmethod
+    def warm_up():
+        """
+        Creates the pooled session of each backend and, if ROCKETCHAT_HTTP_WARM_UP is set,
+        opens the first connection so the TLS handshake happens before the first Chat tab load.
+        Errors are ignored; the connection is simply opened on first use instead.
+        """
+
+        for backend in backends.get_backends().values():
+            session = get_session(backend)
+
+            if (not getattr(settings, 'ROCKETCHAT_HTTP_WARM_UP', False)):
+                continue
+
+            # https://developer.rocket.chat/reference/api/rest-api/endpoints/miscellaneous-endpoints/info
+            api_url = '{0}/api/info'.format(backend.base_url)
+
+            try:
+                session.get(api_url, timeout=get_timeout())
+            except requests.exceptions.RequestException:
+                pass
+
     def post(self, url, data, pretty_print=False):
         """
         Makes a POST API call to a Rocket Chat instance.
 
         :param url: The complete endpoint
             For example: https://my.chat.site/api/v1/groups.create
-        :param data: JSON data to send with the POST request
+        :param data: JSON data to send with the POST request (see ApiResponse.dumps)
             For example: { "name": "NAU_01-2021_2022" }
         :param pretty_print: Specifies that the JSON should return in a 
             human-readable string for display
         
-        :return: a json.loads() object; Type Dict -OR- string if used 'pretty_print'
+        :return: an ApiResponse object -OR- string if used 'pretty_print'
         """
 
         # curl -H "X-Auth-Token: some-token" \
@@ -30,21 +148,8 @@ class ApiRequest(object):
 
         # See https://reqbin.com/req/python/c-dwjszac0/curl-post-json-example
 
-        headers = CaseInsensitiveDict()
-        headers["Accept"] = "application/json"
-        headers["X-Auth-Token"] = settings.ROCKETCHAT_ADMIN_TOKEN
-        headers["X-User-Id"] = settings.ROCKETCHAT_ADMIN_USER_ID
-        headers["Content-type"] = "application/json"
-        
-        try:
-            # Make the call, handle the exception
-            resp = requests.post(url, headers=headers, data=data)
-            return self.verify_api_request(resp, url, pretty_print)
-            
-        except requests.exceptions.RequestException as e:
-            # Oops...the service is probably down
-            return self.handle_request_exception(e)
-
+        # POST calls create or change data: they are never retried
+        return self.send('POST', url, data=data, pretty_print=pretty_print, retries=0)
 
 
     def get(self, url, pretty_print=False):
@@ -56,30 +161,127 @@ class ApiRequest(object):
         :param pretty_print: Specifies that the JSON should return in a 
             human-readable string for display
         
-        :return: a json.loads() object; Type Dict -OR- string if used 'pretty_print'
+        :return: an ApiResponse object -OR- string if used 'pretty_print'
         """
 
         # curl -H "X-Auth-Token: some-token" \ 
         #      -H "X-User-Id: some-id" \ 
         #       https://my.chat.site//api/v1/groups.info?roomName=NAU_01-2021_2022
 
-        headers = CaseInsensitiveDict()
-        headers["Accept"] = "application/json"
-        headers["X-Auth-Token"] = settings.ROCKETCHAT_ADMIN_TOKEN
-        headers["X-User-Id"] = settings.ROCKETCHAT_ADMIN_USER_ID
-        
-        try:
-            # Make the call, handle the exception
-            resp = requests.get(url, headers=headers)
-            return self.verify_api_request(resp, url, pretty_print)
+        # GET calls (groups.info, users.info) are idempotent and can be retried safely
+        retries = getattr(settings, 'ROCKETCHAT_GET_RETRIES', 2)
+        return self.send('GET', url, pretty_print=pretty_print, retries=retries)
+
+    def send(self, method, url, data=None, pretty_print=False, retries=0):
+        """
+        Makes an API call (see send_request) and records its latency and errors (see metrics)
+
+        :return: an ApiResponse object -OR- string if used 'pretty_print'
+        """
+
+        self.calls += 1
+
+        if (not metrics.enabled):
+            return self.send_request(method, url, data, pretty_print, retries)
+
+        started = time.monotonic()
+        resp = self.send_request(method, url, data, pretty_print, retries)
+
+        if (not pretty_print):
+            metrics.record_api_call(get_endpoint(url), time.monotonic() - started, resp)
 
-        except requests.exceptions.RequestException as e:
-            # Oops...the service is probably down
-            return self.handle_request_exception(e)
+        return resp
+
+    def send_request(self, method, url, data=None, pretty_print=False, retries=0):
+        """
+        Makes an API call with timeouts, retries, rate limiting and the backend's shared circuit breaker.
+
+        Connection errors, timeouts and server errors (5xx) count as failures. They are
+        retried up to 'retries' times with a jittered exponential backoff. While the circuit
+        breaker is open, no call is made and a failure is returned right away.
+
+        Calls wait in line for the endpoint's rate limit budget and a free in-flight slot
+        (see RateLimiter) for up to ROCKETCHAT_QUEUE_TIMEOUT seconds. A call rejected with
+        HTTP 429 was not processed, so it is repeated once after the rate limit window resets.
+
+        :param method: 'GET' or 'POST'
+        :param url: The complete endpoint
+        :param data: JSON data to send with a POST request
+        :param pretty_print: Specifies that the JSON should return in a
+            human-readable string for display
+        :param retries: Number of times a failed call is repeated
+
+        :return: an ApiResponse object -OR- string if used 'pretty_print'
+        """
+
+        breaker = get_circuit_breaker(self.backend.name)
+        limiter = get_rate_limiter(self.backend.name)
+        endpoint = get_endpoint(url)
+        headers = POST_HEADERS if method == 'POST' else None
+        if (self.auth_headers):
+            headers = dict(headers or {}, **self.auth_headers)
+        backoff = getattr(settings, 'ROCKETCHAT_RETRY_BACKOFF', 0.2)
+        deadline = time.monotonic() + getattr(settings, 'ROCKETCHAT_QUEUE_TIMEOUT', 5)
+
+        attempt = 0
+        rate_limited = False
+
+        while True:
+
+            if (breaker.is_open()):
+                # Fail fast instead of queuing more doomed requests
+                return ApiResponse.failure("The Chat server is temporarily unavailable")
+
+            if (not limiter.acquire(endpoint, deadline)):
+                # The burst did not clear in time
+                breaker.release_probe()
+                return ApiResponse.failure("The Chat server is busy. Please try again in a moment")
+
+            try:
+                # Make the call on the pooled session, handle the exception
+                resp = self.session.request(method, url, headers=headers, data=data, timeout=get_timeout())
+
+            except requests.exceptions.RequestException as e:
+                resp = None
+                error = e
+
+            finally:
+                limiter.release()
+
+            if (resp is not None):
+                limiter.update(endpoint, resp)
+
+                # error-too-many-requests: wait for the window to reset and try once more.
+                # The server answered, so a half-open circuit closes
+                if (resp.status_code == 429 and not rate_limited):
+                    rate_limited = True
+                    breaker.record_success()
+                    continue
+
+            failed = resp is None or resp.status_code >= 500
+
+            if (not failed):
+                breaker.record_success()
+                return self.verify_api_request(resp, url, pretty_print)
+
+            breaker.record_failure()
+
+            if (attempt >= retries):
+                if (resp is None):
+                    # Oops...the service is probably down
+                    return self.handle_request_exception(error)
+                return self.verify_api_request(resp, url, pretty_print)
+
+            # Full jitter: wait a random time up to the exponential backoff
+            attempt += 1
+            time.sleep(random.uniform(0, backoff * (2 ** (attempt - 1))))
 
     def verify_api_request(self, resp, url, pretty_print):
         """Verfies the response the request and returns a verified JSON object
 
+        The body is parsed once (see ApiResponse). A body that is not JSON becomes a
+        {"status": "Failure"} response.
+
         Args:
             resp (requests.Response object): HTTP response object of the request 
             url (string): The URL of the request
@@ -87,46 +289,16 @@ class ApiRequest(object):
                 human-readable string for display
         
         Returns:
-            :return: a json.loads() object; Type Dict -OR- string if used 'pretty_print'
+            :return: an ApiResponse object -OR- string if used 'pretty_print'
         """
 
-        # If response is valid JSON, return object
-        if (self.is_json(resp.content)):
-            # Convert the JSON string to a dictionary
-            json_object = json.loads(resp.content)
-
-            if (pretty_print):
-                # Return human readable output
-                return json.dumps(json_object, indent=2)
-            else:
-                # Return the dictionary object if not for display
-                return json_object
-        else:
-            # The response was valid, but did not sent back a JSON object
-            json_error = '{{"status": "Failure", \
-                "message": "The API returned invalid JSON. Verify the URL:\\n{0}"}}'.format(url)
-
-            # Note: Must use double {{ }} when using .format with a JSON string
-            # https://stackoverflow.com/questions/16356810/string-format-a-json-string-gives-keyerror
-                
-            return json.loads(json_error)
-
-
-    def is_json(self, json_string):
-        """
-        Returns true or false if the text string is valid JSON.
+        api_resp = ApiResponse.from_http(resp, url)
 
-        :param json_string: A text string to test for valid JSON
+        if (pretty_print):
+            # Return human readable output
+            return json.dumps(api_resp.data, indent=2)
 
-        :return: 
-            bool: True if valid JSON. Otherwise, returns False
-            https://stackoverflow.com/questions/5508509/how-do-i-check-if-a-string-is-valid-json-in-python#answer-20725965
-        """
-        try:
-            json.loads(json_string)
-        except ValueError as e:
-            return False
-        return True
+        return api_resp
 
 
     def handle_request_exception(self, e):
@@ -137,17 +309,7 @@ class ApiRequest(object):
             e (exception): The exception to display the message for
 
         Returns:
-            dict: JSON object describing the error
+            ApiResponse: {"status": "Failure", "message": ..., "exception": ...} describing the error
         """
 
-        json_error = '{{"status": "Failure", \
-            "message": "Error connecting to the Chat server", \
-            "exception": "{0}"}}'.format(str(e))
-
-        if(self.is_json(json_error)):
-            return json.loads(json_error)
-        else:
-            json_error = '{"status": "Failure", \
-                "message": "Error connecting to the Chat server"}'
-            
-            return json.loads(json_error)
+        return ApiResponse.failure("Error connecting to the Chat server", exception=e)
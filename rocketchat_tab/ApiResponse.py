@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+
+import json
+
+# orjson is optional. It parses and serializes several times faster when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    """Parses a JSON document (bytes or string)
+
+    Raises:
+        ValueError: If the content is not valid JSON
+    """
+
+    if (orjson is not None):
+        return orjson.loads(content)
+
+    return json.loads(content)
+
+
+def dumps(obj):
+    """Serializes a request body. Use this instead of formatting JSON strings by hand
+
+    Returns:
+        bytes: The UTF-8 encoded JSON document
+    """
+
+    if (orjson is not None):
+        return orjson.dumps(obj)
+
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+class ApiResponse(object):
+    """A decoded Rocket.Chat API response.
+
+    The body is parsed once. The fields used to evaluate a response are extracted up front,
+    and the parsed body stays available as 'data'. get(), [] and 'in' read from 'data', so a
+    response can be used wherever the JSON dict was used before.
+
+    Attributes:
+        status_code -- the HTTP status code (None if no response was received)
+        success -- the 'success' field of the body (None if missing)
+        error -- the error message, if any
+        error_type -- the Rocket.Chat 'errorType', if any
+        room_id -- the '_id' of the 'group' in the body, if any
+        user_id -- the '_id' of the 'user' in the body, if any
+        data -- the parsed body (dict)
+    """
+
+    __slots__ = ('status_code', 'success', 'error', 'error_type', 'room_id', 'user_id', 'data')
+
+    def __init__(self, data, status_code=None):
+
+        if (not isinstance(data, dict)):
+            data = {"status": "Failure", "message": "The API returned an unexpected JSON document"}
+
+        self.data = data
+        self.status_code = status_code
+
+        success = data.get('success')
+        self.success = True if success == 'True' else success
+        self.error = data.get('error')
+        self.error_type = data.get('errorType')
+
+        group = data.get('group')
+        self.room_id = group.get('_id') if isinstance(group, dict) else None
+
+        user = data.get('user')
+        self.user_id = user.get('_id') if isinstance(user, dict) else None
+
+    @classmethod
+    def from_http(cls, resp, url):
+        """Decodes a requests.Response
+
+        Args:
+            resp (requests.Response): HTTP response object of the request
+            url (string): The URL of the request (used in the error message)
+
+        Returns:
+            ApiResponse: The decoded response
+        """
+
+        try:
+            return cls(loads(resp.content), resp.status_code)
+        except ValueError:
+            # The response was valid, but did not sent back a JSON object
+            return cls.failure(
+                "The API returned invalid JSON. Verify the URL:\n{0}".format(url),
+                status_code=resp.status_code)
+
+    @classmethod
+    def failure(cls, message, exception=None, status_code=None):
+        """Builds the response used when no valid answer was received
+
+        Args:
+            message (string): Explanation of the error
+            exception (Exception): The exception raised by the request, if any
+
+        Returns:
+            ApiResponse: {"status": "Failure", "message": ..., "exception": ...}
+        """
+
+        data = {"status": "Failure", "message": message}
+        if (exception is not None):
+            data["exception"] = str(exception)
+
+        return cls(data, status_code)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __repr__(self):
+        return 'ApiResponse({0!r})'.format(self.data)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio, random, time, weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import backends, metrics
+from .ApiResponse import ApiResponse
+from .ApiRequest import POST_HEADERS, get_timeout
+from .CircuitBreaker import get_circuit_breaker
+from .RateLimiter import get_endpoint, get_rate_limiter
+
+# httpx is optional. It is only needed for the asyncio client (pip install rocketchat-tab[async])
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def in_thread(function):
+    """Wraps a function that uses the Django cache, to await it without blocking the event loop"""
+
+    return sync_to_async(function, thread_sensitive=False)
+
+
+# The clients of each event loop, by backend name. An httpx.AsyncClient is bound to the loop it
+# is used on: it is kept for the life of the loop (see get_client)
+_clients = weakref.WeakKeyDictionary()
+
+
+def build_client(backend):
+    """Builds a keep-alive client with the backend's admin headers already set
+
+    Args:
+        backend (Backend): The Rocket.Chat server (see backends)
+
+    Returns:
+        httpx.AsyncClient: The new client
+    """
+
+    pool_size = getattr(settings, 'ROCKETCHAT_HTTP_POOL_SIZE', 10)
+    connect, read = get_timeout()
+
+    return httpx.AsyncClient(
+        headers={
+            "Accept": "application/json",
+            "X-Auth-Token": backend.admin_token,
+            "X-User-Id": backend.admin_user_id,
+        },
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        timeout=httpx.Timeout(read, connect=connect),
+    )
+
+
+async def close_on_shutdown(client):
+    """Keeps a client open until its event loop shuts down
+
+    Once started, this async generator is closed by the loop's shutdown_asyncgens()
+    (asyncio.run, ASGI servers), which closes the client with it.
+    """
+
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def get_client(backend):
+    """Gets the client of the running event loop for a backend
+
+    All the calls made on one loop share its connections: under ASGI (or on the worker loop
+    of provisioning.provision_room_async), they are kept from one Chat tab view to the next.
+
+    Args:
+        backend (Backend): The Rocket.Chat server (see backends)
+
+    Returns:
+        httpx.AsyncClient: The client, closed when the loop shuts down
+    """
+
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+
+    if (backend.name not in clients):
+        client = build_client(backend)
+        closer = close_on_shutdown(client)
+        clients[backend.name] = client, closer
+        await closer.__anext__()
+
+    return clients[backend.name][0]
+
+
+class AsyncApiRequest(object):
+    """The asyncio counterpart of ApiRequest.
+
+    Calls share the circuit breaker and the rate limit budget with ApiRequest, and lookups
+    (GET) are retried the same way. Waiting never blocks the event loop: the breaker and the
+    rate limiter read the Django cache in a thread.
+
+    The connections belong to the event loop, not to this object (see get_client).
+    """
+
+    def __init__(self, backend=None):
+        """
+        :param backend: The Rocket.Chat server called (see backends.get_default_backend)
+        """
+        self.backend = backend or backends.get_default_backend()
+        self.client = None
+
+        # Number of calls made with this object (a warm provisioning makes none)
+        self.calls = 0
+
+    async def post(self, url, data):
+        """
+        Makes a POST API call to a Rocket Chat instance.
+
+        :param url: The complete endpoint
+        :param data: JSON data to send with the POST request (see ApiResponse.dumps)
+
+        :return: an ApiResponse object
+        """
+
+        return await self.send('POST', url, data=data, retries=0)
+
+    async def get(self, url):
+        """
+        Makes a GET API call to a Rocket Chat instance.
+
+        :param url: The complete endpoint
+
+        :return: an ApiResponse object
+        """
+
+        retries = getattr(settings, 'ROCKETCHAT_GET_RETRIES', 2)
+        return await self.send('GET', url, retries=retries)
+
+    async def send(self, method, url, data=None, retries=0):
+        """
+        Makes an API call (see send_request) and records its latency and errors (see metrics)
+
+        :return: an ApiResponse object
+        """
+
+        self.calls += 1
+
+        if (not metrics.enabled):
+            return await self.send_request(method, url, data, retries)
+
+        started = time.monotonic()
+        resp = await self.send_request(method, url, data, retries)
+        metrics.record_api_call(get_endpoint(url), time.monotonic() - started, resp)
+        return resp
+
+    async def send_request(self, method, url, data=None, retries=0):
+        """
+        Makes an API call with timeouts, retries, rate limiting and the backend's shared circuit
+        breaker (see ApiRequest.send_request)
+
+        :return: an ApiResponse object
+        """
+
+        if (httpx is None):
+            raise ImproperlyConfigured("The asyncio Rocket.Chat client requires httpx: pip install httpx")
+
+        if (self.client is None):
+            self.client = await get_client(self.backend)
+
+        breaker = get_circuit_breaker(self.backend.name)
+        limiter = get_rate_limiter(self.backend.name)
+        endpoint = get_endpoint(url)
+        headers = POST_HEADERS if method == 'POST' else None
+        backoff = getattr(settings, 'ROCKETCHAT_RETRY_BACKOFF', 0.2)
+        deadline = time.monotonic() + getattr(settings, 'ROCKETCHAT_QUEUE_TIMEOUT', 5)
+
+        attempt = 0
+        rate_limited = False
+
+        while True:
+
+            if (await in_thread(breaker.is_open)()):
+                # Fail fast instead of queuing more doomed requests
+                return ApiResponse.failure("The Chat server is temporarily unavailable")
+
+            if (not await limiter.aacquire(endpoint, deadline)):
+                # The burst did not clear in time
+                await in_thread(breaker.release_probe)()
+                return ApiResponse.failure("The Chat server is busy. Please try again in a moment")
+
+            try:
+                resp = await self.client.request(method, url, headers=headers, content=data)
+
+            except httpx.HTTPError as e:
+                resp = None
+                error = e
+
+            finally:
+                limiter.release()
+
+            if (resp is not None):
+                await in_thread(limiter.update)(endpoint, resp)
+
+                # error-too-many-requests: wait for the window to reset and try once more.
+                # The server answered, so a half-open circuit closes
+                if (resp.status_code == 429 and not rate_limited):
+                    rate_limited = True
+                    await in_thread(breaker.record_success)()
+                    continue
+
+            failed = resp is None or resp.status_code >= 500
+
+            if (not failed):
+                await in_thread(breaker.record_success)()
+                return ApiResponse.from_http(resp, url)
+
+            await in_thread(breaker.record_failure)()
+
+            if (attempt >= retries):
+                if (resp is None):
+                    # Oops...the service is probably down
+                    return ApiResponse.failure("Error connecting to the Chat server", exception=error)
+                return ApiResponse.from_http(resp, url)
+
+            # Full jitter: wait a random time up to the exponential backoff
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, backoff * (2 ** (attempt - 1))))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+
+from asgiref.sync import sync_to_async
+
+from .ApiResponse import ApiResponse, dumps
+from .AsyncApiRequest import AsyncApiRequest
+from .RocketChat import RocketChat
+from .RocketChatCache import MEMBER, OWNER
+
+
+class AsyncRocketChat(RocketChat):
+    """The asyncio counterpart of RocketChat.
+
+    The methods that call Rocket.Chat are coroutines with the same names, arguments and
+    results as in RocketChat. Everything else (room names, the ID cache, the membership
+    ledger, response checks) is shared with RocketChat.
+
+    Only the in-process tier of the ID cache and the ledger is read on the event loop. The
+    Django cache and the database (ROCKETCHAT_ID_STORE) are only queried in a thread
+    (sync_to_async).
+    """
+
+    def __init__(self, edx_info, require_enrollment=True, backend=None):
+        super().__init__(edx_info, require_enrollment, backend)
+        self.api_call = AsyncApiRequest(self.backend)
+
+
+    async def get_group_info(self, create=True):
+        """Gets group info from the RocketChat room name (see RocketChat.get_group_info)"""
+
+        room_id = (self.id_cache.get_room_id(self.backend.name, self.group_name, store=False)
+                   or await sync_to_async(self.id_cache.get_room_id)(self.backend.name, self.group_name))
+        if(room_id):
+            return ApiResponse({"success": True, "group": {"_id": room_id, "name": self.group_name}})
+
+        json_resp = await self.find_group()
+
+        if(json_resp.get('success') == False):
+            if(not create):
+                return json_resp
+
+            json_resp = await self.single_flight.ado(
+                'group:{0}:{1}'.format(self.backend.name, self.group_name), self.find_or_create_group)
+
+        self.check_json_for_success(json_resp)
+        await sync_to_async(self.id_cache.set_room_id)(
+            self.backend.name, self.group_name, json_resp.get('group', {}).get('_id'), self.course_id)
+        return json_resp
+
+
+    async def find_group(self):
+        api_url = '{0}/api/v1/groups.info?roomName={1}'.format \
+            (self.base_url, self.group_name)
+
+        return await self.api_call.get(api_url)
+
+
+    async def find_or_create_group(self):
+        # See RocketChat.find_or_create_group
+        room_id = await sync_to_async(self.id_cache.get_room_id)(self.backend.name, self.group_name)
+        if(room_id):
+            return ApiResponse({"success": True, "group": {"_id": room_id, "name": self.group_name}})
+
+        json_resp = await self.create_group()
+        await sync_to_async(self.id_cache.set_room_id)(
+            self.backend.name, self.group_name, json_resp.get('group', {}).get('_id'), self.course_id)
+        return json_resp
+
+
+    async def create_group(self):
+        """Creates a RocketChat group/room (see RocketChat.create_group)"""
+
+        json_string = dumps({"name": self.group_name})
+
+        api_url = '{0}/api/v1/groups.create'.format \
+            (self.base_url)
+
+        json_resp = await self.api_call.post(api_url, json_string)
+
+        if(json_resp.get('errorType') == 'error-duplicate-channel-name'):
+            json_resp = await self.find_group()
+
+        self.check_json_for_success(json_resp)
+        return json_resp
+
+
+    async def add_user_to_group(self, room_id, user_id, repair=True):
+        """Adds a user to the RocketChat group (see RocketChat.add_user_to_group)"""
+
+        is_staff = self.user_info['is_staff']
+        state = (self.membership.get_state(room_id, user_id, store=False)
+                 or await sync_to_async(self.membership.get_state)(room_id, user_id))
+
+        if(state == OWNER or (state == MEMBER and not is_staff)):
+            return ApiResponse({"success": True, "group": {"_id": room_id}})
+
+        json_string = dumps({"roomId": room_id, "userId": user_id})
+
+        if(state is None):
+            api_url = '{0}/api/v1/groups.invite'.format \
+                (self.base_url)
+
+            group_info = await self.api_call.post(api_url, json_string)
+
+            if(group_info.get('success') == False):
+                await sync_to_async(self.invalidate_ids)(group_info)
+            self.check_json_for_success(group_info)
+            await sync_to_async(self.membership.set_state)(room_id, user_id, MEMBER)
+        else:
+            group_info = ApiResponse({"success": True, "group": {"_id": room_id}})
+
+        if(is_staff):
+            api_url = '{0}/api/v1/groups.addOwner'.format \
+                (self.base_url)
+            owner_info = await self.api_call.post(api_url, json_string)
+
+            if(owner_info.get('success') == True or owner_info.get('errorType') == 'error-user-already-owner'):
+                await sync_to_async(self.membership.set_state)(room_id, user_id, OWNER)
+
+            elif(owner_info.get('errorType') == 'error-user-not-in-room' and repair):
+                await sync_to_async(self.membership.delete_state)(room_id, user_id)
+                return await self.add_user_to_group(room_id, user_id, repair=False)
+
+        return group_info
+
+
+    async def get_user_info(self, create=True):
+        """Gets the RocketChat user's info, creating the user if needed (see RocketChat.get_user_info)"""
+
+        username = self.user_info['username']
+
+        user_id = (self.id_cache.get_user_id(self.backend.name, username, store=False)
+                   or await sync_to_async(self.id_cache.get_user_id)(self.backend.name, username))
+        if(user_id):
+            return ApiResponse({"success": True, "user": {"_id": user_id, "username": username}})
+
+        json_resp = await self.find_user()
+
+        if(json_resp.get('success') == False):
+            if(not create):
+                return json_resp
+
+            json_resp = await self.single_flight.ado(
+                'user:{0}:{1}'.format(self.backend.name, username), self.find_or_create_user)
+
+        self.check_json_for_success(json_resp)
+        await sync_to_async(self.id_cache.set_user_id)(self.backend.name, username, json_resp.get('user', {}).get('_id'))
+        return json_resp
+
+
+    async def find_user(self):
+        api_url = '{0}/api/v1/users.info?username={1}'.format \
+            (self.base_url, self.user_info['username'])
+
+        return await self.api_call.get(api_url)
+
+
+    async def find_or_create_user(self):
+        # See RocketChat.find_or_create_user
+        username = self.user_info['username']
+
+        user_id = await sync_to_async(self.id_cache.get_user_id)(self.backend.name, username)
+        if(user_id):
+            return ApiResponse({"success": True, "user": {"_id": user_id, "username": username}})
+
+        json_resp = await self.create_user()
+        await sync_to_async(self.id_cache.set_user_id)(self.backend.name, username, json_resp.get('user', {}).get('_id'))
+        return json_resp
+
+
+    async def create_user(self):
+        """Creates a RocketChat user (see RocketChat.create_user)"""
+
+        api_url = '{0}/api/v1/users.create'.format \
+            (self.base_url)
+
+        json_resp = await self.api_call.post(api_url, self.build_user_data())
+
+        if(json_resp.get('errorType') == 'error-field-unavailable'):
+            existing = await self.find_user()
+            if(existing.get('success') == True):
+                json_resp = existing
+
+        self.check_json_for_success(json_resp)
+        return json_resp
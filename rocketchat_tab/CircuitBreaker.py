@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .RocketChatCache import KEY_PREFIX
+
+
+class CircuitBreaker(object):
+    """Stops calling Rocket.Chat for a while once it keeps failing.
+
+    The state is kept in the Django cache, so all LMS workers share it:
+        - Closed: calls go through. Failures are counted over 'window' seconds
+        - Open: after 'threshold' failures, calls fail right away for 'reset_timeout' seconds
+        - Half-open: once the open period ends, one call (the probe) goes through while the
+          others still fail right away. Its failure opens the circuit again, its success
+          closes it
+
+    Attributes:
+        name -- identifies the circuit in the cache keys
+    """
+
+    def __init__(self, name='default'):
+        self.name = name
+        self.threshold = getattr(settings, 'ROCKETCHAT_CIRCUIT_FAILURES', 5)
+        self.window = getattr(settings, 'ROCKETCHAT_CIRCUIT_WINDOW', 30)
+        self.reset_timeout = getattr(settings, 'ROCKETCHAT_CIRCUIT_RESET_TIMEOUT', 30)
+
+        self.failures_key = '{0}:circuit:{1}:failures'.format(KEY_PREFIX, name)
+        self.open_key = '{0}:circuit:{1}:open'.format(KEY_PREFIX, name)
+        self.tripped_key = '{0}:circuit:{1}:tripped'.format(KEY_PREFIX, name)
+        self.probe_key = '{0}:circuit:{1}:probe'.format(KEY_PREFIX, name)
+
+    def is_open(self):
+        """Checks if calls should fail right away
+
+        While half-open, the first caller claims the probe: it must then call record_success,
+        record_failure or release_probe. A probe lost with its worker is claimed again
+        after 'reset_timeout' seconds.
+
+        Returns:
+            bool: True while the circuit is open, or half-open with a probe under way
+        """
+
+        state = cache.get_many([self.open_key, self.tripped_key])
+
+        if (state.get(self.open_key)):
+            return True
+
+        if (not state.get(self.tripped_key)):
+            return False
+
+        return not cache.add(self.probe_key, True, self.reset_timeout)
+
+    def release_probe(self):
+        """Lets another call probe the half-open circuit, when the probe made no call"""
+
+        cache.delete(self.probe_key)
+
+    def record_failure(self):
+        """Counts a failed call (connection error, timeout or server error)"""
+
+        # The circuit opened before: a failure while half-open opens it again right away
+        if (cache.get(self.tripped_key)):
+            self.open()
+            return
+
+        # cache.add starts a new window. incr keeps the window's expiry
+        if (cache.add(self.failures_key, 1, self.window)):
+            failures = 1
+        else:
+            try:
+                failures = cache.incr(self.failures_key)
+            except ValueError:
+                # The window expired between add and incr
+                cache.add(self.failures_key, 1, self.window)
+                failures = 1
+
+        if (failures >= self.threshold):
+            self.open()
+
+    def record_success(self):
+        """Closes a half-open circuit
+
+        A call that started before the circuit opened may still succeed: that does not close
+        an open circuit.
+        """
+
+        state = cache.get_many([self.tripped_key, self.open_key])
+        if (state.get(self.tripped_key) and not state.get(self.open_key)):
+            cache.delete_many([self.tripped_key, self.failures_key, self.probe_key])
+
+    def open(self):
+        cache.set(self.open_key, True, self.reset_timeout)
+        # Remember the circuit opened until well after the open period ends (half-open)
+        cache.set(self.tripped_key, True, self.reset_timeout * 10)
+        cache.delete_many([self.failures_key, self.probe_key])
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name='default'):
+    """Gets the process-wide circuit breaker with the given name
+
+    Returns:
+        CircuitBreaker: The shared instance
+    """
+
+    breaker = _breakers.get(name)
+
+    if (breaker is None):
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+
+    return breaker
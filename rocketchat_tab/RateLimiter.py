@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio, threading, time
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .RocketChatCache import KEY_PREFIX
+
+# Rocket.Chat's rate limiter headers (X-RateLimit-Reset is a timestamp in milliseconds)
+# https://docs.rocket.chat/use-rocket.chat/workspace-administration/settings/rate-limiter
+LIMIT_HEADER = 'X-RateLimit-Limit'
+REMAINING_HEADER = 'X-RateLimit-Remaining'
+RESET_HEADER = 'X-RateLimit-Reset'
+
+# Longest wait used when a 429 response has no reset header
+DEFAULT_RESET_WAIT = 1.0
+
+# Seconds between two tries of a coroutine waiting for an in-flight slot
+IN_FLIGHT_POLL = 0.01
+
+# Seconds the learned limit and window length of an endpoint are remembered
+LEARNED_TIMEOUT = 60 * 60
+
+
+def get_endpoint(url):
+    """Gets the endpoint name of an API URL
+
+    Args:
+        url (string): For example: https://my.chat.site//api/v1/groups.info?roomName=NAU_01-2021_2022
+
+    Returns:
+        string: For example: groups.info
+    """
+
+    return urlsplit(url).path.rsplit('/', 1)[-1]
+
+
+class RateLimiter(object):
+    """Smooths bursts of calls made with the shared admin token.
+
+    Rocket.Chat limits the calls per endpoint and per token in fixed windows, and reports the
+    calls left in the window in its response headers. Those headers refill a token bucket per
+    endpoint kept in the Django cache, so all LMS workers spend the same budget. Once a bucket
+    is empty, callers wait for the window to reset instead of getting error-too-many-requests.
+
+    Each worker also caps its calls in flight. Callers wait in line until a deadline.
+    Coroutines wait the same way (aacquire) without blocking the event loop.
+
+    Attributes:
+        name -- identifies the admin token (backend) in the cache keys
+    """
+
+    def __init__(self, name='default'):
+        self.name = name
+        self.in_flight = threading.BoundedSemaphore(getattr(settings, 'ROCKETCHAT_MAX_IN_FLIGHT', 10))
+
+    def make_key(self, endpoint, suffix):
+        return '{0}:ratelimit:{1}:{2}:{3}'.format(KEY_PREFIX, self.name, endpoint, suffix)
+
+    def acquire(self, endpoint, deadline):
+        """Waits for a token of the endpoint's bucket and a free in-flight slot
+
+        Args:
+            endpoint (string): The endpoint name, e.g. groups.info
+            deadline (float): time.monotonic() value after which the caller gives up
+
+        Returns:
+            bool: True if the call can be made. release() must then be called
+        """
+
+        if (not self.take_token(endpoint, deadline)):
+            return False
+
+        timeout = deadline - time.monotonic()
+        return timeout > 0 and self.in_flight.acquire(timeout=timeout)
+
+    async def aacquire(self, endpoint, deadline):
+        """Same as acquire() for a coroutine. Waiting does not block the event loop
+
+        Returns:
+            bool: True if the call can be made. release() must then be called
+        """
+
+        if (not await self.atake_token(endpoint, deadline)):
+            return False
+
+        # Polled rather than awaited in a thread: a cancelled caller can never hold a slot
+        while (not self.in_flight.acquire(blocking=False)):
+            if (time.monotonic() + IN_FLIGHT_POLL > deadline):
+                return False
+            await asyncio.sleep(IN_FLIGHT_POLL)
+
+        return True
+
+    def release(self):
+        self.in_flight.release()
+
+    def take_token(self, endpoint, deadline):
+        """Takes a token from the endpoint's bucket, waiting for the window reset if empty
+
+        Returns:
+            bool: False if the bucket will not refill before the deadline
+        """
+
+        while True:
+            wait = self.try_take_token(endpoint)
+            if (wait is None):
+                return True
+
+            if (time.monotonic() + max(wait, 0) > deadline):
+                return False
+
+            time.sleep(max(min(wait, DEFAULT_RESET_WAIT), 0.05))
+
+    async def atake_token(self, endpoint, deadline):
+        """Same as take_token() for a coroutine. The cache is only read in a thread"""
+
+        while True:
+            wait = await sync_to_async(self.try_take_token, thread_sensitive=False)(endpoint)
+            if (wait is None):
+                return True
+
+            if (time.monotonic() + max(wait, 0) > deadline):
+                return False
+
+            await asyncio.sleep(max(min(wait, DEFAULT_RESET_WAIT), 0.05))
+
+    def try_take_token(self, endpoint):
+        """Takes a token from the endpoint's bucket if there is one left
+
+        The bucket is the budget of the window ('limit') and the calls made from it ('used').
+        Only 'used' changes, with cache.incr: memcached never decrements below 0, so a
+        counter going down could never tell an empty bucket.
+
+        Returns:
+            float: None if a token was taken -OR- the seconds until the window resets
+        """
+
+        limit_key = self.make_key(endpoint, 'limit')
+        used_key = self.make_key(endpoint, 'used')
+        reset_key = self.make_key(endpoint, 'reset')
+
+        while True:
+            try:
+                used = cache.incr(used_key)
+                limit = cache.get(limit_key)
+            except ValueError:
+                used = limit = None
+
+            if (limit is None):
+                # No bucket: the window is over, or the budget of this endpoint is unknown
+                learned = cache.get(self.make_key(endpoint, 'learned'))
+                if (learned is None):
+                    return None
+
+                # Start the new window with the learned limit, so waiting callers do not
+                # all rush in at once. The next response corrects it from the headers
+                limit, interval = learned
+                timeout = max(int(interval), 1)
+                cache.add(limit_key, limit, timeout)
+                cache.add(used_key, 0, timeout)
+                cache.add(reset_key, time.time() + interval, timeout)
+                continue
+
+            if (used <= limit):
+                return None
+
+            # Empty bucket. Wait until the window resets
+            reset = cache.get(reset_key)
+            wait = (reset - time.time()) if reset else DEFAULT_RESET_WAIT
+
+            if (wait <= 0):
+                # The window is over, but the bucket can outlive it by up to a second
+                # (cache timeouts are whole seconds)
+                cache.delete_many([limit_key, used_key, reset_key])
+                continue
+
+            return wait
+
+    def update(self, endpoint, resp):
+        """Refills the endpoint's bucket from the rate limit headers of a response
+
+        Args:
+            endpoint (string): The endpoint name, e.g. groups.info
+            resp (requests.Response): The response of the call
+        """
+
+        limit = resp.headers.get(LIMIT_HEADER)
+        remaining = resp.headers.get(REMAINING_HEADER)
+        reset = resp.headers.get(RESET_HEADER)
+
+        if (resp.status_code == 429 and remaining is None):
+            remaining = 0
+
+        if (remaining is None):
+            return
+
+        try:
+            remaining = int(remaining)
+            reset = float(reset) / 1000 if reset else time.time() + DEFAULT_RESET_WAIT
+        except ValueError:
+            return
+
+        # The bucket expires when the window resets: calls are then allowed again
+        interval = reset - time.time()
+        timeout = max(int(interval + 1), 1)
+        cache.set_many({
+            self.make_key(endpoint, 'limit'): remaining,
+            self.make_key(endpoint, 'used'): 0,
+            self.make_key(endpoint, 'reset'): reset,
+        }, timeout)
+
+        # Remember the limit and the window length (the longest time to reset seen so far)
+        if (limit is not None and limit.isdigit()):
+            learned_key = self.make_key(endpoint, 'learned')
+            learned = cache.get(learned_key)
+            if (learned is not None):
+                interval = max(interval, learned[1])
+            cache.set(learned_key, (int(limit), interval), LEARNED_TIMEOUT)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name='default'):
+    """Gets the process-wide rate limiter with the given name
+
+    Returns:
+        RateLimiter: The shared instance
+    """
+
+    limiter = _limiters.get(name)
+
+    if (limiter is None):
+        with _limiters_lock:
+            limiter = _limiters.setdefault(name, RateLimiter(name))
+
+    return limiter
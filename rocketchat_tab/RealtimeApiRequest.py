@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+A transport that sends the provisioning calls over the Rocket.Chat realtime API (DDP over a
+WebSocket) instead of one REST request each (ROCKETCHAT_TRANSPORT = 'realtime').
+
+Each worker process keeps one long-lived connection per backend, logged in once with the
+admin token. Calls from all threads are multiplexed on it: each method call has an ID, is
+sent as soon as it is made (without waiting for the previous answers) and is answered by
+the reader thread when its result arrives.
+
+RealtimeApiRequest has the same interface as ApiRequest and returns the same REST-shaped
+responses, so RocketChat does not know which transport it uses. The endpoints that have no
+equivalent method (users.info, the paginated lists) and any call made while the connection
+is down go through REST. A call that timed out may still have been applied: it is repeated
+over REST, which is safe because RocketChat already handles the "already exists" errors.
+"""
+
+import itertools, json, os, threading, time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .ApiRequest import ApiRequest, get_timeout
+from .ApiResponse import ApiResponse, loads
+from .CircuitBreaker import get_circuit_breaker
+from .RateLimiter import get_endpoint
+from .RocketChatCache import LocalLRUCache
+
+# websocket-client is optional. It is only needed for this transport (pip install rocketchat-tab[realtime])
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+# Longest wait before reconnecting after the connection failed (doubles from 1 second)
+MAX_RECONNECT_DELAY = 30
+
+# Usernames remembered per backend (the invite and kick methods take a username, not a user ID)
+USERNAME_CACHE_SIZE = 10000
+USERNAME_TIMEOUT = 24 * 60 * 60
+
+# Lookups whose errors do not tell why (e.g. not found or not allowed): they are repeated over REST
+LOOKUP_METHODS = {'getRoomByTypeAndName'}
+
+# Method errors renamed to the errorType of the REST endpoint, which RocketChat checks for
+ERROR_TYPES = {
+    'error-invalid-room': 'error-room-not-found',
+}
+
+# One connection per backend in each worker process (see ApiRequest.get_session)
+_connections = {}
+_connection_pid = None
+_connection_lock = threading.Lock()
+
+
+class RealtimeError(Exception):
+    """A method call that Rocket.Chat answered with an error"""
+
+    def __init__(self, error):
+        self.error_type = str(error.get('error', 'error'))
+        self.reason = error.get('reason') or error.get('message') or self.error_type
+        super().__init__('{0} [{1}]'.format(self.reason, self.error_type))
+
+
+class RealtimeConnectionError(Exception):
+    """The connection is down, or a call was not answered in time"""
+
+
+def get_connection(backend):
+    """Gets the process-wide realtime connection of a backend, creating it on first use
+
+    Args:
+        backend (Backend): The Rocket.Chat server (see backends)
+
+    Returns:
+        RealtimeConnection: The connection (it connects on the first call)
+    """
+
+    global _connections, _connection_pid
+
+    pid = os.getpid()
+    connection = _connections.get(backend.name) if _connection_pid == pid else None
+    if (connection is not None):
+        return connection
+
+    with _connection_lock:
+        if (_connection_pid != pid):
+            _connections = {}
+            _connection_pid = pid
+
+        connection = _connections.get(backend.name)
+        if (connection is None):
+            connection = _connections[backend.name] = RealtimeConnection(backend)
+
+    return connection
+
+
+def build_websocket_url(base_url):
+    """Builds the realtime API URL from the server URL
+
+    Args:
+        base_url (string): For example https://my.chat.site/
+
+    Returns:
+        string: For example wss://my.chat.site/websocket
+    """
+
+    parts = urlsplit(base_url)
+    scheme = 'wss' if parts.scheme == 'https' else 'ws'
+    return '{0}://{1}{2}/websocket'.format(scheme, parts.netloc, parts.path.rstrip('/'))
+
+
+class RealtimeConnection(object):
+    """One authenticated realtime connection to a backend, shared by the threads of a worker.
+
+    The connection is opened and logged in on the first call, and again on the first call
+    after it dropped (waiting at least 1, then 2, 4... up to MAX_RECONNECT_DELAY seconds
+    between failed attempts). Calls pending when it drops fail with RealtimeConnectionError.
+
+    A call that is not answered in time only fails itself. The connection is closed on a
+    transport error, or when the server does not answer a ping either (see check_alive).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.url = build_websocket_url(backend.base_url)
+
+        # Held to connect and to send. Answers are read by the reader thread without it
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.ws = None
+
+        # Monotonic times of the last message read and of the ping still waiting for an answer
+        self.received_at = 0
+        self.ping_at = None
+
+        self.reconnect_delay = 0
+        self.reconnect_at = 0
+
+    def call(self, method, params, timeout):
+        """Calls a method and waits for its result
+
+        Args:
+            method (string): The method name, e.g. 'createPrivateGroup'
+            params (list): The method parameters
+            timeout (float): Seconds to wait for the result
+
+        Returns:
+            The method result
+
+        Raises:
+            RealtimeError: If Rocket.Chat answered with an error
+            RealtimeConnectionError: If the call could not be sent or was not answered in time
+        """
+
+        future = Future()
+
+        with self.lock:
+            ws = self.connect()
+            call_id = str(next(self.ids))
+            self.pending[call_id] = future
+
+            try:
+                ws.send(json.dumps({"msg": "method", "id": call_id, "method": method, "params": params}))
+            except Exception as e:
+                self.close(ws, e)
+                raise RealtimeConnectionError(str(e))
+
+        try:
+            return future.result(timeout)
+
+        except FutureTimeoutError:
+            # Only this call gives up: the other calls on the connection keep waiting
+            self.pending.pop(call_id, None)
+            self.check_alive(ws, timeout)
+            raise RealtimeConnectionError('{0} timed out'.format(method))
+
+    def check_alive(self, ws, timeout):
+        """Checks the connection after a call timed out, since the method may just be slow
+
+        The server is pinged. If the previous ping is still unanswered after 'timeout'
+        seconds, the connection is dead: it is closed and the next call opens a new one.
+        """
+
+        with self.lock:
+            if (self.ws is not ws):
+                return
+
+            now = time.monotonic()
+
+            if (self.ping_at is None or self.received_at >= self.ping_at):
+                self.ping_at = now
+                try:
+                    ws.send(json.dumps({"msg": "ping", "id": "alive"}))
+                    return
+                except Exception as e:
+                    error = e
+
+            elif (now - self.ping_at >= timeout):
+                error = 'no answer to a ping within {0} seconds'.format(timeout)
+
+            else:
+                return
+
+            self.close(ws, error)
+
+    def connect(self):
+        """Opens and logs in the connection unless it is open. Called while holding the lock
+
+        Returns:
+            websocket.WebSocket: The open connection
+
+        Raises:
+            RealtimeConnectionError: If the connection could not be opened
+        """
+
+        if (self.ws is not None):
+            return self.ws
+
+        if (time.monotonic() < self.reconnect_at):
+            raise RealtimeConnectionError('Waiting to reconnect to {0}'.format(self.url))
+
+        connect_timeout, read_timeout = get_timeout()
+
+        try:
+            ws = websocket.create_connection(self.url, timeout=connect_timeout, enable_multithread=True)
+            try:
+                self.handshake(ws, read_timeout)
+            except Exception:
+                ws.close()
+                raise
+
+        except Exception as e:
+            self.reconnect_delay = min(max(self.reconnect_delay * 2, 1), MAX_RECONNECT_DELAY)
+            self.reconnect_at = time.monotonic() + self.reconnect_delay
+            raise RealtimeConnectionError('Error connecting to {0}: {1}'.format(self.url, e))
+
+        self.reconnect_delay = 0
+        ws.settimeout(None)
+        self.ws = ws
+        self.ping_at = None
+
+        threading.Thread(target=self.read, args=(ws,), name='rocketchat-realtime', daemon=True).start()
+        return ws
+
+    def handshake(self, ws, timeout):
+        """Opens the DDP session and logs in with the admin token (before the reader runs)"""
+
+        ws.settimeout(timeout)
+        ws.send(json.dumps({"msg": "connect", "version": "1", "support": ["1"]}))
+        self.wait_for(ws, lambda message: message.get('msg') == 'connected')
+
+        ws.send(json.dumps({"msg": "method", "id": "login", "method": "login",
+                            "params": [{"resume": self.backend.admin_token}]}))
+        message = self.wait_for(ws, lambda message: message.get('msg') == 'result' and message.get('id') == 'login')
+
+        if ('error' in message):
+            raise RealtimeError(message['error'])
+
+    def wait_for(self, ws, accept):
+        """Reads messages until one is accepted, answering the server pings meanwhile"""
+
+        while True:
+            message = loads(ws.recv())
+
+            if (message.get('msg') == 'ping'):
+                self.pong(ws, message)
+            elif (message.get('msg') == 'failed'):
+                raise RealtimeConnectionError('DDP version {0} is required'.format(message.get('version')))
+            elif (accept(message)):
+                return message
+
+    def pong(self, ws, ping):
+        pong = {"msg": "pong"}
+        if ('id' in ping):
+            pong['id'] = ping['id']
+        ws.send(json.dumps(pong))
+
+    def read(self, ws):
+        """Reader thread: hands each result to the call waiting for it, until the connection drops"""
+
+        try:
+            while True:
+                message = loads(ws.recv())
+                kind = message.get('msg')
+                # Any message (e.g. the pong of check_alive) shows the connection is alive
+                self.received_at = time.monotonic()
+
+                if (kind == 'result'):
+                    future = self.pending.pop(message.get('id'), None)
+                    if (future is None):
+                        continue
+                    if ('error' in message):
+                        future.set_exception(RealtimeError(message['error']))
+                    else:
+                        future.set_result(message.get('result'))
+
+                elif (kind == 'ping'):
+                    self.pong(ws, message)
+
+        except Exception as e:
+            self.close(ws, e)
+
+    def close(self, ws, error):
+        """Closes a connection and fails the calls still waiting on it"""
+
+        with self.lock:
+            if (self.ws is not ws):
+                return
+
+            self.ws = None
+            pending, self.pending = self.pending, {}
+
+        for future in pending.values():
+            if (not future.done()):
+                future.set_exception(RealtimeConnectionError('Connection to {0} lost: {1}'.format(self.url, error)))
+
+        try:
+            ws.close()
+        except Exception:
+            pass
+
+
+def body_params(data):
+    """Gets the parameters of a REST request body (bytes, string or dict)"""
+
+    if (isinstance(data, dict)):
+        return data
+
+    return loads(data) if data else {}
+
+
+def query_params(url):
+    return {key: values[0] for key, values in parse_qs(urlsplit(url).query).items()}
+
+
+class RealtimeApiRequest(ApiRequest):
+    """ApiRequest that sends the provisioning calls as realtime method calls (see the module documentation).
+
+    Each REST endpoint sent over the realtime connection is mapped to a method by a
+    'call_<endpoint>' function. It returns (method, params, result builder), or None to send
+    the call over REST.
+    """
+
+    # Shared by the requests of each backend: user ID -> username
+    _usernames = {}
+    _usernames_lock = threading.Lock()
+
+    def __init__(self, backend=None, session=None):
+        """
+        :param backend: The Rocket.Chat server called (see backends.get_default_backend)
+        :param session: Optional requests.Session used for the calls sent over REST
+        """
+
+        if (websocket is None):
+            raise ImproperlyConfigured(
+                "The realtime Rocket.Chat transport requires websocket-client: pip install websocket-client")
+
+        super().__init__(backend, session)
+
+        with self._usernames_lock:
+            self.usernames = self._usernames.setdefault(self.backend.name, LocalLRUCache(USERNAME_CACHE_SIZE))
+
+    def send_request(self, method, url, data=None, pretty_print=False, retries=0):
+        """
+        Makes an API call over the realtime connection, or over REST if it has no equivalent
+        method or the connection is down (see ApiRequest.send_request)
+
+        :return: an ApiResponse object -OR- string if used 'pretty_print'
+        """
+
+        mapper = getattr(self, 'call_' + get_endpoint(url).replace('.', '_'), None)
+        call = mapper(query_params(url), body_params(data)) if mapper and not pretty_print else None
+
+        breaker = get_circuit_breaker(self.backend.name)
+
+        if (call is None or breaker.is_open()):
+            return self.send_rest(method, url, data, pretty_print, retries)
+
+        name, params, build_result = call
+
+        try:
+            result = get_connection(self.backend).call(name, params, get_timeout()[1])
+
+        except RealtimeConnectionError:
+            # The REST call below is the probe of a half-open circuit
+            breaker.release_probe()
+            return self.send_rest(method, url, data, pretty_print, retries)
+
+        except RealtimeError as e:
+            # The server answered: a half-open circuit closes
+            breaker.record_success()
+
+            if (name in LOOKUP_METHODS):
+                return self.send_rest(method, url, data, pretty_print, retries)
+
+            return ApiResponse({
+                "success": False,
+                "error": '{0} [{1}]'.format(e.reason, e.error_type),
+                "errorType": ERROR_TYPES.get(e.error_type, e.error_type),
+            })
+
+        breaker.record_success()
+        return ApiResponse(dict(build_result(result), success=True))
+
+    def send_rest(self, method, url, data, pretty_print, retries):
+        """Sends a call over REST, remembering the username of the user in the response"""
+
+        resp = super().send_request(method, url, data, pretty_print, retries)
+
+        if (isinstance(resp, ApiResponse) and resp.user_id):
+            self.remember_username(resp.user_id, resp.data['user'].get('username'))
+
+        return resp
+
+    def get_username(self, user_id):
+        """Gets the username of a user ID: remembered, or stored (see models.RocketChatUser)
+
+        Returns:
+            string: The username -OR- None if it is not known
+        """
+
+        username = self.usernames.get(user_id)
+
+        if (username is None and getattr(settings, 'ROCKETCHAT_ID_STORE', True)):
+            from .models import RocketChatUser
+
+            username = RocketChatUser.objects.filter(
+                backend=self.backend.name, user_id=user_id).values_list('username', flat=True).first()
+
+            if (username):
+                self.remember_username(user_id, username)
+
+        return username
+
+    def remember_username(self, user_id, username):
+        if (user_id and username):
+            self.usernames.set(user_id, username, USERNAME_TIMEOUT)
+
+    # Method mappings (see the class documentation)
+
+    def call_groups_info(self, query, body):
+        if ('roomName' not in query):
+            return None
+
+        return 'getRoomByTypeAndName', ['p', query['roomName']], lambda result: {"group": result}
+
+    def call_groups_create(self, query, body):
+        def build(result):
+            return {"group": {"_id": result.get('rid') or result.get('_id'), "name": body['name']}}
+
+        return 'createPrivateGroup', [body['name'], []], build
+
+    def call_groups_invite(self, query, body):
+        username = self.get_username(body['userId'])
+        if (not username):
+            return None
+
+        return 'addUsersToRoom', [{"rid": body['roomId'], "users": [username]}], \
+            lambda result: {"group": {"_id": body['roomId']}}
+
+    def call_groups_kick(self, query, body):
+        username = self.get_username(body['userId'])
+        if (not username):
+            return None
+
+        return 'removeUserFromRoom', [{"rid": body['roomId'], "username": username}], \
+            lambda result: {"group": {"_id": body['roomId']}}
+
+    def call_groups_addOwner(self, query, body):
+        return 'addRoomOwner', [body['roomId'], body['userId']], lambda result: {}
+
+    def call_groups_removeOwner(self, query, body):
+        return 'removeRoomOwner', [body['roomId'], body['userId']], lambda result: {}
+
+    def call_users_create(self, query, body):
+        user_data = dict(body, joinDefaultChannels=False, roles=['user'])
+        user_data.pop('active', None)
+
+        def build(result):
+            user_id = result.get('_id') if isinstance(result, dict) else result
+            self.remember_username(user_id, body['username'])
+            return {"user": {"_id": user_id, "username": body['username'], "name": body.get('name')}}
+
+        return 'insertOrUpdateUser', [user_data], build
+
+    def call_users_createToken(self, query, body):
+        return 'createToken', [body['userId']], lambda result: {"data": result}
@@ -2,31 +2,46 @@
 
 
 import uuid
+from urllib.parse import quote
+
 from django.conf import settings
 
+from . import backends
 from .RocketChatError import RocketChatError
 from .ApiRequest import ApiRequest
+from .RealtimeApiRequest import RealtimeApiRequest
+from .ApiResponse import ApiResponse, dumps
+from .RocketChatCache import get_id_cache, get_login_token_cache, get_membership_ledger, MEMBER, OWNER
+from .SingleFlight import get_single_flight
 
 # Group API calls
 # groups.info       https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/info
 # groups.create     https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/groups-endpoints/create
 # groups.members    https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/groups-endpoints/members
+# groups.listAll    https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/listall
+# groups.roles      https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/roles
 # groups.invite     https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/groups-endpoints/invite
 # groups.addowner   https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/addowner
+# groups.removeowner https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/removeowner
+# groups.kick       https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/kick
+# groups.history    https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/history
 
 ## User API calls
 # users.info        https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/users-endpoints/get-users-info
 # users.create      https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/users-endpoints/create-user-endpoint
+# users.createToken https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/users-endpoints/create-users-token
+# users.list        https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/users-endpoints/get-users-list
 
 # TODO
-# Check if user already in the room
 # Add the room prefix to the settings file
 # Localization and translate messages
 
 class RocketChat(object):
 
     # Constructor
-    def __init__(self, edx_info):
+    #   require_enrollment=False is only used by admin jobs (e.g. removing an unenrolled user)
+    #   backend: the Rocket.Chat server to call. Defaults to the server of the course (see backends)
+    def __init__(self, edx_info, require_enrollment=True, backend=None):
 
         # Error checking
         if (not isinstance(edx_info, dict)):
@@ -42,12 +57,19 @@ class RocketChat(object):
             raise RocketChatError(error, message)
         
         self.edx_info = edx_info
+        self.course_id = course_id
         self.group_name = self.build_group_name(course_id)
+        self.backend = backend or backends.get_backend(self.group_name, course_id)
+        self.base_url = self.backend.base_url
         self.user_info = edx_info['user']
-        self.api_call = ApiRequest()
+        self.api_call = self.build_api_request()
+        self.id_cache = get_id_cache()
+        self.membership = get_membership_ledger()
+        self.login_tokens = get_login_token_cache()
+        self.single_flight = get_single_flight()
         
         # verify user enrollment        
-        if (not self.user_info['is_enrolled']):
+        if (require_enrollment and not self.user_info['is_enrolled']):
             error = "{{'ValidationError':'User {0} is not enrolled in the course.'}}".format(self.user_info['username'])
             message = "Enrollment in course '{0}' is required to access the group chat.".format(course_id)
             raise RocketChatError(error, message)
@@ -59,7 +81,21 @@ class RocketChat(object):
         self.user_info['username'] = str(self.user_info['username']).lower()
 
 
-    def build_group_name(self, course_id):
+    def build_api_request(self):
+        """Builds the transport of the admin calls (see ROCKETCHAT_TRANSPORT)
+
+        Returns:
+            ApiRequest: REST calls -OR- RealtimeApiRequest: calls over the realtime connection
+        """
+
+        if(getattr(settings, 'ROCKETCHAT_TRANSPORT', 'rest') == 'realtime'):
+            return RealtimeApiRequest(self.backend)
+
+        return ApiRequest(self.backend)
+
+
+    @staticmethod
+    def build_group_name(course_id):
         """Gets the room/group name from the course ID
 
         Args:
@@ -95,37 +131,85 @@ class RocketChat(object):
     def get_room_url(self):
         """Gets the room URL
 
+        A login token (see get_login_token) is never added to it: URLs end up in the browser
+        history, Referer headers and proxy logs. The page passes the token to the room with
+        postMessage instead (see rocket_chat.html).
+
         Returns:
             string: The URL to the RocketChat room
         """
         
-        return "{0}group/{1}".format(settings.ROCKETCHAT_BASE_URL, self.group_name)
+        return "{0}group/{1}".format(self.base_url, self.group_name)
 
 
-    def get_group_info(self):
+    def get_group_info(self, create=True):
         """Gets group info from the RocketChat room name
 
+        Args:
+            create (bool): Creates the room if it does not exist
+
         Returns:
             dict: A JSON dict containing the room information
                 If room does exist, returns: {'errorType': 'error-room-not-found'}
+                If the room ID is cached (or stored), returns: {'success': True, 'group': {'_id': ..., 'name': ...}}
         """
-        
-        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/info
-        # Get group info. If does not exist, create it
 
-        api_url = '{0}/api/v1/groups.info?roomName={1}'.format \
-            (settings.ROCKETCHAT_BASE_URL, self.group_name)
+        # The room ID never changes once created. Skip the network call if it is known
+        #   (cached, or stored in the database, see IdCache)
+        room_id = self.id_cache.get_room_id(self.backend.name, self.group_name)
+        if(room_id):
+            return ApiResponse({"success": True, "group": {"_id": room_id, "name": self.group_name}})
 
-        # Get the room info
-        json_resp = self.api_call.get(api_url)
+        # Get group info. If does not exist, create it
+        json_resp = self.find_group()
 
         # Check for an unsuccessful response 
         # JSON response on failure {"success": false, "error": "The room...", "errorType": "error-room-not-found"}
         if(json_resp.get('success') == False):
+            if(not create):
+                return json_resp
+
             # Attempt to create the room and then try again.
-            json_resp = self.create_group()
+            # Only one request creates the room. Concurrent requests wait and reuse its result
+            json_resp = self.single_flight.do(
+                'group:{0}:{1}'.format(self.backend.name, self.group_name), self.find_or_create_group)
         
         self.check_json_for_success(json_resp)
+        self.id_cache.set_room_id(
+            self.backend.name, self.group_name, json_resp.get('group', {}).get('_id'), self.course_id)
+        return json_resp
+
+
+    def find_group(self):
+        """Looks up the room by name (no cache, no creation)
+
+        Returns:
+            dict: A JSON dict containing the room information
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/info
+        api_url = '{0}/api/v1/groups.info?roomName={1}'.format \
+            (self.base_url, self.group_name)
+
+        return self.api_call.get(api_url)
+
+
+    def find_or_create_group(self):
+        """Creates the room unless it exists. Called while holding the single-flight lock
+
+        Returns:
+            dict: A JSON dict containing the group information
+        """
+
+        # Another request may have created the room before the lock was taken. It recorded the
+        #   room ID while holding the lock, so Rocket.Chat is not asked again
+        room_id = self.id_cache.get_room_id(self.backend.name, self.group_name)
+        if(room_id):
+            return ApiResponse({"success": True, "group": {"_id": room_id, "name": self.group_name}})
+
+        json_resp = self.create_group()
+        self.id_cache.set_room_id(
+            self.backend.name, self.group_name, json_resp.get('group', {}).get('_id'), self.course_id)
         return json_resp
 
 
@@ -136,41 +220,73 @@ class RocketChat(object):
             dict: A JSON dict containing the group information
         """
 
-        json_string = '{{ "name": "{0}" }}'.format(self.group_name)
+        json_string = dumps({"name": self.group_name})
 
         # https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/groups-endpoints/create
         api_url = '{0}/api/v1/groups.create'.format \
-            (settings.ROCKETCHAT_BASE_URL)
+            (self.base_url)
 
         json_resp = self.api_call.post(api_url, json_string)
+
+        # Created by a concurrent request meanwhile: use that room
+        if(json_resp.get('errorType') == 'error-duplicate-channel-name'):
+            json_resp = self.find_group()
+
         self.check_json_for_success(json_resp)
         return json_resp
 
 
-    def add_user_to_group(self, room_id, user_id):
+    def add_user_to_group(self, room_id, user_id, repair=True):
         """Adds a user to the RocketChat group
 
+        The membership ledger records which users were already invited (and promoted to
+        owner), so a returning user does not cause any write call to Rocket.Chat.
+
+        A wrong ledger entry (the user was removed from the room in Rocket.Chat) is only
+        noticed for staff, whose groups.addOwner call fails with error-user-not-in-room: they
+        are invited again at once. A learner makes no call at all, so they are invited again
+        once the entry expires (ROCKETCHAT_MEMBERSHIP_TIMEOUT) or by rocketchat_reconcile.
+
         Args:
             room_id (string): Room/group ID to add the user to
             user_id (string): User ID to add to the room
+            repair (bool): Re-invite the user once if Rocket.Chat reports the ledger is wrong
 
         Returns:
             dict: JSON dict of the group the user was added to
+                If the ledger already has the membership, returns: {'success': True, 'group': {'_id': ...}}
         """
 
+        is_staff = self.user_info['is_staff']
+        state = self.membership.get_state(room_id, user_id)
+
+        # Nothing to do for a recorded member (or owner, if staff)
+        if(state == OWNER or (state == MEMBER and not is_staff)):
+            return ApiResponse({"success": True, "group": {"_id": room_id}})
+
         # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/invite
-        json_string = '{{ "roomId": "{0}", "userId": "{1}" }}'.format(room_id, user_id)
+        json_string = dumps({"roomId": room_id, "userId": user_id})
+
+        if(state is None):
+            api_url = '{0}/api/v1/groups.invite'.format \
+                (self.base_url)
+
+            group_info = self.api_call.post(api_url, json_string)
 
-        api_url = '{0}/api/v1/groups.invite'.format \
-            (settings.ROCKETCHAT_BASE_URL)
+            # Drop cached IDs if Rocket.Chat no longer knows the room or user
+            self.invalidate_ids(group_info)
 
-        group_info = self.api_call.post(api_url, json_string)
+            # Validate the response before recording the membership
+            self.check_json_for_success(group_info)
+            self.membership.set_state(room_id, user_id, MEMBER)
+        else:
+            group_info = ApiResponse({"success": True, "group": {"_id": room_id}})
 
         # Add the user as an owner if flag is set
-        if(self.user_info['is_staff']):
+        if(is_staff):
             
             # There is no easy to check for the group owner. Instead, add the user as owner,
-            #   but don't evaluate response (silently fail if the user is already the owner)
+            #   but don't fail on the response (silently fail if the user is already the owner)
             # https://github.com/RocketChat/Rocket.Chat/issues/12870
             # Error data: {"success": false, "error": 
             #   "User is already an owner [error-user-already-owner]", 
@@ -179,37 +295,305 @@ class RocketChat(object):
             
             # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/addowner
             api_url = '{0}/api/v1/groups.addOwner'.format \
-                (settings.ROCKETCHAT_BASE_URL)
-            self.api_call.post(api_url, json_string)
+                (self.base_url)
+            owner_info = self.api_call.post(api_url, json_string)
+
+            if(owner_info.get('success') == True or owner_info.get('errorType') == 'error-user-already-owner'):
+                self.membership.set_state(room_id, user_id, OWNER)
+
+            elif(owner_info.get('errorType') == 'error-user-not-in-room' and repair):
+                # The ledger is out of date (the user was removed from the room). Repair it
+                self.membership.delete_state(room_id, user_id)
+                return self.add_user_to_group(room_id, user_id, repair=False)
 
-        # Validate and return the initial response
-        self.check_json_for_success(group_info)
         return group_info
 
 
-    def get_user_info(self):
+    def remove_user_from_group(self, room_id, user_id):
+        """Removes a user from the RocketChat group
+
+        Args:
+            room_id (string): Room/group ID to remove the user from
+            user_id (string): User ID to remove from the room
+
+        Returns:
+            dict: JSON dict of the group the user was removed from
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/kick
+        json_string = dumps({"roomId": room_id, "userId": user_id})
+
+        api_url = '{0}/api/v1/groups.kick'.format \
+            (self.base_url)
+
+        json_resp = self.api_call.post(api_url, json_string)
+        self.membership.delete_state(room_id, user_id)
+
+        # The user already left the room
+        if(json_resp.get('errorType') == 'error-user-not-in-room'):
+            return ApiResponse({"success": True, "group": {"_id": room_id}})
+
+        self.check_json_for_success(json_resp)
+        return json_resp
+
+
+    def remove_owner_from_group(self, room_id, user_id):
+        """Removes the owner role of a user in the RocketChat group. The user stays in the room
+
+        Args:
+            room_id (string): Room/group ID
+            user_id (string): User ID of the owner
+
+        Returns:
+            dict: JSON dict of the response
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/removeowner
+        json_string = dumps({"roomId": room_id, "userId": user_id})
+
+        api_url = '{0}/api/v1/groups.removeOwner'.format \
+            (self.base_url)
+
+        json_resp = self.api_call.post(api_url, json_string)
+
+        # The user is not an owner (anymore)
+        if(json_resp.get('errorType') == 'error-user-not-owner'):
+            json_resp = ApiResponse({"success": True})
+
+        self.check_json_for_success(json_resp)
+
+        if(self.membership.get_state(room_id, user_id) == OWNER):
+            self.membership.set_state(room_id, user_id, MEMBER)
+
+        return json_resp
+
+
+    def get_group_members(self, room_id, page_size=100, shift=None):
+        """Gets the members of the RocketChat group, one page at a time, sorted by username
+
+        Args:
+            room_id (string): Room/group ID
+            page_size (int): Members fetched per call
+            shift (callable): See get_pages. Lets the caller invite or remove members it has
+                already read while the next pages are still to come
+
+        Returns:
+            generator: (username, user_id) of each member, in username order
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/groups-endpoints/members
+        api_url = '{0}/api/v1/groups.members?roomId={1}&sort={2}'.format \
+            (self.base_url, room_id, quote(dumps({"username": 1})))
+
+        for member in self.get_pages(api_url, 'members', page_size, shift):
+            yield member.get('username'), member.get('_id')
+
+
+    def list_groups(self, page_size=100):
+        """Gets all the private groups (rooms) of Rocket.Chat, one page at a time
+
+        Args:
+            page_size (int): Groups fetched per call
+
+        Returns:
+            generator: (name, room_id) of each group
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/listall
+        api_url = '{0}/api/v1/groups.listAll?fields={1}'.format \
+            (self.base_url, quote(dumps({"name": 1})))
+
+        for group in self.get_pages(api_url, 'groups', page_size):
+            yield group.get('name'), group.get('_id')
+
+
+    def list_users(self, page_size=100):
+        """Gets all the users of Rocket.Chat, one page at a time
+
+        Args:
+            page_size (int): Users fetched per call
+
+        Returns:
+            generator: (username, user_id) of each user
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/users-endpoints/get-users-list
+        api_url = '{0}/api/v1/users.list?fields={1}'.format \
+            (self.base_url, quote(dumps({"username": 1})))
+
+        for user in self.get_pages(api_url, 'users', page_size):
+            yield user.get('username'), user.get('_id')
+
+
+    def get_group_history(self, room_id, oldest=None, latest=None, page_size=100):
+        """Gets the messages of the RocketChat group between two times, one page at a time, newest first
+
+        The pages are read by offset below a fixed 'latest' time, so messages posted meanwhile
+        do not shift them.
+
+        Args:
+            room_id (string): Room/group ID
+            oldest (string): Only the messages posted at or after this ISO 8601 time (all if None)
+            latest (string): Only the messages posted at or before this ISO 8601 time
+            page_size (int): Messages fetched per call
+
+        Returns:
+            generator: Each message (dict with '_id', 'ts', 'u' and, for system messages, 't')
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/history
+        api_url = '{0}/api/v1/groups.history?roomId={1}&inclusive=true'.format \
+            (self.base_url, room_id)
+
+        if(oldest):
+            api_url = '{0}&oldest={1}'.format(api_url, quote(oldest))
+        if(latest):
+            api_url = '{0}&latest={1}'.format(api_url, quote(latest))
+
+        offset = 0
+
+        # groups.history does not report a total: the last page is the first short one
+        while True:
+            json_resp = self.api_call.get('{0}&offset={1}&count={2}'.format(api_url, offset, page_size))
+            self.check_json_for_success(json_resp)
+
+            messages = json_resp.get('messages', [])
+            for message in messages:
+                yield message
+
+            offset += len(messages)
+            if(len(messages) < page_size):
+                return
+
+
+    def get_pages(self, api_url, items_key, page_size, shift=None):
+        """Calls a paginated endpoint until all its items are read
+
+        Args:
+            api_url (string): The endpoint URL with its query parameters, except the page
+            items_key (string): The key of the items in the response (e.g. 'members')
+            page_size (int): Items fetched per call
+            shift (callable): Returns the number of items added (or, if negative, removed)
+                so far among the items already read, so the next page starts after them
+
+        Returns:
+            generator: Each item, in the order of the endpoint
+        """
+
+        read = 0
+
+        while True:
+            offset = read + (shift() if shift else 0)
+
+            json_resp = self.api_call.get('{0}&offset={1}&count={2}'.format(api_url, offset, page_size))
+            self.check_json_for_success(json_resp)
+
+            items = json_resp.get(items_key, [])
+            for item in items:
+                yield item
+
+            read += len(items)
+            if(not items or offset + len(items) >= json_resp.get('total', 0)):
+                return
+
+
+    def get_group_owners(self, room_id):
+        """Gets the owners of the RocketChat group
+
+        Args:
+            room_id (string): Room/group ID
+
+        Returns:
+            set: The user IDs of the room owners
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/groups-endpoints/roles
+        api_url = '{0}/api/v1/groups.roles?roomId={1}'.format \
+            (self.base_url, room_id)
+
+        json_resp = self.api_call.get(api_url)
+        self.check_json_for_success(json_resp)
+
+        return set(
+            role.get('u', {}).get('_id')
+            for role in json_resp.get('roles', [])
+            if 'owner' in role.get('roles', [])
+        )
+
+
+    def get_user_info(self, create=True):
         """Gets ther RocketChat user's info from the username. Creates the user
             using their edX user info if they do not exist in the system.
 
+        Args:
+            create (bool): Creates the user if they do not exist
+
         Returns:
             dict: JSON dict containing the user's information 
+                If the user ID is cached (or stored), returns: {'success': True, 'user': {'_id': ..., 'username': ...}}
         """
 
-        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/users-endpoints/get-users-info
-        api_url = '{0}/api/v1/users.info?username={1}'.format \
-            (settings.ROCKETCHAT_BASE_URL, self.user_info['username'])
+        username = self.user_info['username']
+
+        # The user ID never changes once created. Skip the network call if it is known
+        #   (cached, or stored in the database, see IdCache)
+        user_id = self.id_cache.get_user_id(self.backend.name, username)
+        if(user_id):
+            return ApiResponse({"success": True, "user": {"_id": user_id, "username": username}})
 
         # Attempt to get the user info
-        json_resp = self.api_call.get(api_url)
+        json_resp = self.find_user()
 
         # Check for an unsuccessful response 
         # JSON response on failure {"success":false,"error":"User not found."}
         if(json_resp.get('success') == False):
+            if(not create):
+                return json_resp
+
             # Attempt to create the user and then try again.
-            return self.create_user()
+            # Only one request creates the user (e.g. double-clicks). The others reuse its result
+            json_resp = self.single_flight.do(
+                'user:{0}:{1}'.format(self.backend.name, username), self.find_or_create_user)
+            self.check_json_for_success(json_resp)
         else:
             self.check_json_for_success(json_resp)
-            return json_resp
+
+        self.id_cache.set_user_id(self.backend.name, username, json_resp.get('user', {}).get('_id'))
+        return json_resp
+
+
+    def find_user(self):
+        """Looks up the user by username (no cache, no creation)
+
+        Returns:
+            dict: JSON dict containing the user's information
+        """
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/users-endpoints/get-users-info
+        api_url = '{0}/api/v1/users.info?username={1}'.format \
+            (self.base_url, self.user_info['username'])
+
+        return self.api_call.get(api_url)
+
+
+    def find_or_create_user(self):
+        """Creates the user unless they exist. Called while holding the single-flight lock
+
+        Returns:
+            dict: JSON dict containing the user's information
+        """
+
+        username = self.user_info['username']
+
+        # Another request may have created the user before the lock was taken. It recorded the
+        #   user ID while holding the lock, so Rocket.Chat is not asked again
+        user_id = self.id_cache.get_user_id(self.backend.name, username)
+        if(user_id):
+            return ApiResponse({"success": True, "user": {"_id": user_id, "username": username}})
+
+        json_resp = self.create_user()
+        self.id_cache.set_user_id(self.backend.name, username, json_resp.get('user', {}).get('_id'))
+        return json_resp
 
 
     def create_user(self):
@@ -228,24 +612,142 @@ class RocketChat(object):
                 "sendWelcomeEmail": false }'
 
         """
+        json_string = self.build_user_data()
+
+        # https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/groups-endpoints/create
+        api_url = '{0}/api/v1/users.create'.format \
+            (self.base_url)
+
+        json_resp = self.api_call.post(api_url, json_string)
+
+        # Created by a concurrent request meanwhile ("someuser is already in use :(")
+        if(json_resp.get('errorType') == 'error-field-unavailable'):
+            existing = self.find_user()
+            if(existing.get('success') == True):
+                json_resp = existing
+
+        self.check_json_for_success(json_resp)
+        return json_resp
+
+
+    def build_user_data(self):
+        """Builds the users.create request body from the edX user info
+
+        Returns:
+            bytes: The JSON request body
+        """
+
         username = self.user_info['username']
         email = self.user_info['email']
         name = self.user_info['display_name']
         # Generate a random password (users only login using OAuth)
         password = uuid.uuid4().hex
 
-        json_string = '{{ "username": "{0}",  "email": "{1}", "password": "{2}", \
-                "name": "{3}", "active": true, "verified": true, "requirePasswordChange": false, \
-                "sendWelcomeEmail": false }}'.format(
-                    username, email, password, name)
+        return dumps({
+            "username": username,
+            "email": email,
+            "password": password,
+            "name": name,
+            "active": True,
+            "verified": True,
+            "requirePasswordChange": False,
+            "sendWelcomeEmail": False,
+        })
 
-        # https://developer.rocket.chat/reference/api/rest-api/endpoints/team-collaboration-endpoints/groups-endpoints/create
-        api_url = '{0}/api/v1/users.create'.format \
-            (settings.ROCKETCHAT_BASE_URL)
+
+    def get_login_token(self, user_id):
+        """Gets a login token for the user, so the room opens without the OAuth/SAML login
+
+        The token is created with the admin token and cached (see LoginTokenCache). The token
+        it replaces is revoked, so each user has at most one token of this app at a time.
+        Requires CREATE_TOKENS_FOR_USERS=true in the Rocket.Chat server environment.
+
+        Args:
+            user_id (string): User ID of the RocketChat user
+
+        Returns:
+            string: The token -OR- None if it could not be created. The user then logs in as usual
+
+        API call required
+        curl -H "X-Auth-Token: $TOKEN" \
+            -H "X-User-Id: $USER_ID" \
+            -H "Content-type:application/json" \
+            https://my.chat.site/api/v1/users.createToken \
+            -d '{ "userId": "BsNr28znDkG8aeo7W" }'
+        """
+
+        token = self.login_tokens.get_token(user_id)
+        if(token):
+            return token
+
+        json_string = dumps({"userId": user_id})
+
+        api_url = '{0}/api/v1/users.createToken'.format \
+            (self.base_url)
 
         json_resp = self.api_call.post(api_url, json_string)
-        self.check_json_for_success(json_resp)
-        return json_resp
+
+        # JSON response on success {"data": {"userId": "...", "authToken": "..."}, "success": true}
+        token = json_resp.get('data', {}).get('authToken') if json_resp.get('success') == True else None
+
+        if(token):
+            expired = self.login_tokens.get_expired_token(user_id)
+            self.login_tokens.set_token(user_id, token)
+
+            if(expired):
+                self.revoke_login_token(user_id, expired)
+
+        return token
+
+
+    def revoke_login_token(self, user_id, token):
+        """Revokes a login token created by get_login_token. The other sessions of the user are kept
+
+        Args:
+            user_id (string): User ID of the RocketChat user
+            token (string): The token to revoke
+
+        API call required
+        curl -H "X-Auth-Token: $USER_TOKEN" \
+            -H "X-User-Id: $USER_ID" \
+            -X POST https://my.chat.site/api/v1/logout
+        """
+
+        api_url = '{0}/api/v1/logout'.format \
+            (self.base_url)
+
+        # Made as the user: logout only removes the token it is called with.
+        # It fails if the user already logged out of that session, which revokes it too
+        ApiRequest(self.backend, auth=(user_id, token)).post(api_url, b'')
+
+
+    def invalidate_ids(self, json):
+        """Removes cached room or user IDs that Rocket.Chat reports as unknown
+
+        Args:
+            json (dict): A JSON response from Rocket.Chat
+
+        Returns:
+            bool: True if a cached ID was removed
+        """
+
+        if(json.get('success') != False):
+            return False
+
+        error = str(json.get('error', ''))
+        error_type = json.get('errorType')
+
+        # {"success": false, "error": "The required \"roomId\" or \"roomName\" param provided does not match any group [error-room-not-found]", "errorType": "error-room-not-found"}
+        if(error_type == 'error-room-not-found'):
+            self.id_cache.delete_room_id(self.backend.name, self.group_name)
+            return True
+
+        # {"success": false, "error": "User not found."}
+        if(error_type in ('error-invalid-user', 'error-user-not-found') or 'User not found' in error):
+            self.id_cache.delete_user_id(self.backend.name, self.user_info['username'])
+            return True
+
+        return False
 
 
     def check_json_for_success(self, json):
@@ -260,6 +762,12 @@ class RocketChat(object):
 
         # Throw exception if a failure is found
 
+        # Fast path for decoded responses (see ApiResponse)
+        if(isinstance(json, ApiResponse)):
+            if(json.success == True):
+                return
+            json = json.data
+
         # Response type one: {'success': Boolean}
         if(json.get('success') == 'True' or json.get('success') == True ):
             return
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+
+import logging, threading, time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+
+log = logging.getLogger(__name__)
+
+# Prefix for every key this app stores in the Django cache
+KEY_PREFIX = 'rocketchat_tab'
+
+# Membership states recorded in the ledger
+MEMBER = 'member'
+OWNER = 'owner'
+
+
+class LocalLRUCache(object):
+    """A small, thread-safe, in-process LRU cache with a per-entry expiry.
+
+    Attributes:
+        max_size -- the number of entries kept before the least recently used is dropped
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Gets a value if it is present and has not expired
+
+        Args:
+            key (string): The cache key
+
+        Returns:
+            The cached value, or None
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None):
+                return None
+
+            value, expires = entry
+            if (expires < time.monotonic()):
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        """Stores a value for 'timeout' seconds
+
+        Args:
+            key (string): The cache key
+            value: The value to store
+            timeout (int): Number of seconds the value is valid
+        """
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+
+            while (len(self._entries) > self.max_size):
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache(object):
+    """Caches values in a local LRU in front of the shared Django cache backend.
+
+    Reads check the process-local tier first, then the Django cache. Values found in the
+    Django cache are copied to the local tier. The local tier uses a shorter timeout so an
+    invalidation made by another worker is picked up within 'local_timeout' seconds.
+    """
+
+    def __init__(self, namespace, max_size, timeout, local_timeout):
+        self.namespace = namespace
+        self.timeout = timeout
+        self.local_timeout = min(local_timeout, timeout)
+        self.local = LocalLRUCache(max_size)
+
+    def make_key(self, key):
+        return '{0}:{1}:{2}'.format(KEY_PREFIX, self.namespace, key)
+
+    def get(self, key, shared=True):
+        """Gets a value. shared=False only reads the local tier (no I/O, e.g. on an event loop)"""
+
+        cache_key = self.make_key(key)
+
+        value = self.local.get(cache_key)
+        if (value is not None or not shared):
+            return value
+
+        value = cache.get(cache_key)
+        if (value is not None):
+            self.local.set(cache_key, value, self.local_timeout)
+
+        return value
+
+    def set(self, key, value):
+        cache_key = self.make_key(key)
+        self.local.set(cache_key, value, self.local_timeout)
+        cache.set(cache_key, value, self.timeout)
+
+    def delete(self, key):
+        cache_key = self.make_key(key)
+        self.local.delete(cache_key)
+        cache.delete(cache_key)
+
+
+def write_store(function, *args):
+    """Writes an ID or a membership to the database (see models)
+
+    The stored rows only save calls to Rocket.Chat later, so a failed write is logged
+    and does not fail the provisioning. The write runs in its own savepoint.
+    """
+
+    try:
+        with transaction.atomic():
+            function(*args)
+    except DatabaseError as e:
+        log.warning("Could not store the Rocket.Chat IDs %s: %s", args, e)
+
+
+class IdCache(object):
+    """Resolves Rocket.Chat room and user IDs without a network call.
+
+    A room's '_id' and a user's '_id' never change once created, so they are cached by
+    the backend name (see backends) and the group name (see RocketChat.build_group_name)
+    or the lowercased username.
+
+    With ROCKETCHAT_ID_STORE, the IDs are also kept in the database (see models) and
+    read from there when they are not cached, e.g. after a deploy or a cache flush.
+    Pass store=False to only read the in-process tier, e.g. from a coroutine, which must not
+    wait for the Django cache or the database on the event loop.
+    """
+
+    def __init__(self):
+        max_size = getattr(settings, 'ROCKETCHAT_ID_CACHE_SIZE', 2048)
+        timeout = getattr(settings, 'ROCKETCHAT_ID_CACHE_TIMEOUT', 60 * 60 * 24)
+        local_timeout = getattr(settings, 'ROCKETCHAT_ID_CACHE_LOCAL_TIMEOUT', 60 * 5)
+
+        self.rooms = TwoTierCache('room', max_size, timeout, local_timeout)
+        self.users = TwoTierCache('user', max_size, timeout, local_timeout)
+        self.store = getattr(settings, 'ROCKETCHAT_ID_STORE', True)
+
+    def make_key(self, backend, name):
+        return '{0}:{1}'.format(backend, name)
+
+    def get_room_id(self, backend, group_name, store=True):
+        room_id = self.rooms.get(self.make_key(backend, group_name), shared=store)
+
+        if(room_id is None and store and self.store):
+            from .models import RocketChatRoom
+            room_id = RocketChatRoom.get_room_id(backend, group_name)
+            if(room_id):
+                self.rooms.set(self.make_key(backend, group_name), room_id)
+
+        return room_id
+
+    def set_room_id(self, backend, group_name, room_id, course_id=None):
+        """Records a room ID. The database row needs the course ID"""
+
+        if (room_id):
+            self.rooms.set(self.make_key(backend, group_name), room_id)
+
+            if(self.store and course_id is not None):
+                from .models import RocketChatRoom
+                write_store(RocketChatRoom.set_room_id, backend, group_name, room_id, course_id)
+
+    def delete_room_id(self, backend, group_name):
+        self.rooms.delete(self.make_key(backend, group_name))
+
+        if(self.store):
+            from .models import RocketChatRoom
+            write_store(RocketChatRoom.delete_room_id, backend, group_name)
+
+    def get_user_id(self, backend, username, store=True):
+        username = str(username).lower()
+        user_id = self.users.get(self.make_key(backend, username), shared=store)
+
+        if(user_id is None and store and self.store):
+            from .models import RocketChatUser
+            user_id = RocketChatUser.get_user_id(backend, username)
+            if(user_id):
+                self.users.set(self.make_key(backend, username), user_id)
+
+        return user_id
+
+    def set_user_id(self, backend, username, user_id):
+        if (user_id):
+            username = str(username).lower()
+            self.users.set(self.make_key(backend, username), user_id)
+
+            if(self.store):
+                from .models import RocketChatUser
+                write_store(RocketChatUser.set_user_id, backend, username, user_id)
+
+    def delete_user_id(self, backend, username):
+        username = str(username).lower()
+        self.users.delete(self.make_key(backend, username))
+
+        if(self.store):
+            from .models import RocketChatUser
+            write_store(RocketChatUser.delete_user_id, backend, username)
+
+
+class MembershipLedger(object):
+    """Records which users were invited to (or made owner of) which room.
+
+    Entries expire after ROCKETCHAT_MEMBERSHIP_TIMEOUT seconds, so a user removed from a room
+    directly in Rocket.Chat is invited again at the latest after that time. Before that, only
+    staff are invited again right away (see RocketChat.add_user_to_group), and the
+    rocketchat_reconcile command puts everyone back.
+
+    With ROCKETCHAT_ID_STORE, the memberships are also kept in the database, with the same
+    expiry (see IdCache).
+    """
+
+    def __init__(self):
+        max_size = getattr(settings, 'ROCKETCHAT_ID_CACHE_SIZE', 2048)
+        self.timeout = getattr(settings, 'ROCKETCHAT_MEMBERSHIP_TIMEOUT', 60 * 60)
+        local_timeout = getattr(settings, 'ROCKETCHAT_ID_CACHE_LOCAL_TIMEOUT', 60 * 5)
+
+        self.members = TwoTierCache('member', max_size, self.timeout, local_timeout)
+        self.store = getattr(settings, 'ROCKETCHAT_ID_STORE', True)
+
+    def make_key(self, room_id, user_id):
+        return '{0}:{1}'.format(room_id, user_id)
+
+    def get_state(self, room_id, user_id, store=True):
+        """Gets the recorded membership state
+
+        Returns:
+            string: MEMBER, OWNER or None if the membership is not recorded
+        """
+
+        state = self.members.get(self.make_key(room_id, user_id), shared=store)
+
+        if(state is None and store and self.store):
+            from .models import RocketChatMembership
+            state = RocketChatMembership.get_state(room_id, user_id, self.timeout)
+            if(state):
+                self.members.set(self.make_key(room_id, user_id), state)
+
+        return state
+
+    def set_state(self, room_id, user_id, state):
+        self.members.set(self.make_key(room_id, user_id), state)
+
+        if(self.store):
+            from .models import RocketChatMembership
+            write_store(RocketChatMembership.set_state, room_id, user_id, state)
+
+    def delete_state(self, room_id, user_id):
+        self.members.delete(self.make_key(room_id, user_id))
+
+        if(self.store):
+            from .models import RocketChatMembership
+            write_store(RocketChatMembership.delete_state, room_id, user_id)
+
+
+class LoginTokenCache(object):
+    """Keeps the Rocket.Chat login token created for each user (see RocketChat.get_login_token).
+
+    A token is reused for ROCKETCHAT_LOGIN_TOKEN_TIMEOUT seconds. This must be shorter than
+    the 'Login Expiration in Days' of Rocket.Chat. It is then kept as long again, so the
+    token that replaces it can revoke it. A token is also void once the user logs out of
+    Rocket.Chat: until it is replaced, the iframe then shows the usual login page.
+
+    The tokens are stored in plaintext in the Django cache: anyone who can read the cache
+    can log in to Rocket.Chat as these users.
+    """
+
+    def __init__(self):
+        max_size = getattr(settings, 'ROCKETCHAT_ID_CACHE_SIZE', 2048)
+        local_timeout = getattr(settings, 'ROCKETCHAT_ID_CACHE_LOCAL_TIMEOUT', 60 * 5)
+
+        self.timeout = getattr(settings, 'ROCKETCHAT_LOGIN_TOKEN_TIMEOUT', 60 * 60 * 24)
+        self.tokens = TwoTierCache('token', max_size, 2 * self.timeout, local_timeout)
+
+    def get_entry(self, user_id):
+        """Gets the (token, creation time) of a user -OR- (None, None)"""
+
+        entry = self.tokens.get(user_id)
+        if (isinstance(entry, str)):
+            # Stored without its creation time by an older version
+            return entry, time.time()
+        return tuple(entry) if entry else (None, None)
+
+    def get_token(self, user_id):
+        """Gets the token of a user, unless it is due to be replaced"""
+
+        token, created = self.get_entry(user_id)
+        return token if token and time.time() - created < self.timeout else None
+
+    def get_expired_token(self, user_id):
+        """Gets the token of a user that is due to be replaced (and revoked)"""
+
+        token, created = self.get_entry(user_id)
+        return token if token and time.time() - created >= self.timeout else None
+
+    def set_token(self, user_id, token):
+        self.tokens.set(user_id, (token, time.time()))
+
+    def delete_token(self, user_id):
+        self.tokens.delete(user_id)
+
+
+_id_cache = None
+_membership_ledger = None
+_login_token_cache = None
+_id_cache_lock = threading.Lock()
+
+
+def get_id_cache():
+    """Gets the process-wide ID cache
+
+    Returns:
+        IdCache: The shared cache instance
+    """
+
+    global _id_cache
+
+    if (_id_cache is None):
+        with _id_cache_lock:
+            if (_id_cache is None):
+                _id_cache = IdCache()
+
+    return _id_cache
+
+
+def get_membership_ledger():
+    """Gets the process-wide membership ledger
+
+    Returns:
+        MembershipLedger: The shared ledger instance
+    """
+
+    global _membership_ledger
+
+    if (_membership_ledger is None):
+        with _id_cache_lock:
+            if (_membership_ledger is None):
+                _membership_ledger = MembershipLedger()
+
+    return _membership_ledger
+
+
+def get_login_token_cache():
+    """Gets the process-wide login token cache
+
+    Returns:
+        LoginTokenCache: The shared cache instance
+    """
+
+    global _login_token_cache
+
+    if (_login_token_cache is None):
+        with _id_cache_lock:
+            if (_login_token_cache is None):
+                _login_token_cache = LoginTokenCache()
+
+    return _login_token_cache
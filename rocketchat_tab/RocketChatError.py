@@ -13,6 +13,9 @@ class RocketChatError(Exception):
 
     def __init__(self, json_dict, message="There was a unexpected error with the chat server."):
         
+        # Keep the raw error data so callers can inspect the error type
+        self.json_dict = json_dict
+
         json_str = ""
         
         if(isinstance(json_dict, dict)):
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio, threading, time, uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .RocketChatCache import KEY_PREFIX
+
+# Seconds the result of a call is kept for the requests that waited on it
+RESULT_TIMEOUT = 30
+
+# Seconds between two checks for the result while waiting
+POLL_INTERVAL = 0.05
+
+
+class SingleFlight(object):
+    """Makes sure only one request at a time runs a call for a given key.
+
+    The first request takes a lock in the Django cache and runs the call. Concurrent requests
+    (in any process) wait for its result and reuse it. The lock is a lease: if its holder dies,
+    it expires after 'lease' seconds. If the holder fails or the wait times out, a waiting
+    request runs the call itself.
+
+    Attributes:
+        lease -- seconds the lock is held at most
+        wait -- seconds a request waits for the result of another request
+    """
+
+    def __init__(self):
+        self.lease = getattr(settings, 'ROCKETCHAT_SINGLE_FLIGHT_LEASE', 15)
+        self.wait = getattr(settings, 'ROCKETCHAT_SINGLE_FLIGHT_WAIT', 5)
+
+    def do(self, key, function):
+        """Runs function() once for all concurrent callers with the same key
+
+        Args:
+            key (string): Identifies the call, e.g. 'group:default:edx-IT_IS-NAU_01-2021_2022'.
+                Includes the backend: the same room or user has another ID on each server
+            function (callable): The call to make. Its result must be picklable
+
+        Returns:
+            The result of function(), possibly from another request
+        """
+
+        lock_key = '{0}:flight:{1}:lock'.format(KEY_PREFIX, key)
+        result_key = '{0}:flight:{1}:result'.format(KEY_PREFIX, key)
+        token = uuid.uuid4().hex
+
+        if (cache.add(lock_key, token, self.lease)):
+            try:
+                result = function()
+                cache.set(result_key, result, RESULT_TIMEOUT)
+                return result
+            finally:
+                self.release(lock_key, token)
+
+        deadline = time.monotonic() + self.wait
+
+        while (time.monotonic() < deadline):
+            time.sleep(POLL_INTERVAL)
+
+            result = cache.get(result_key)
+            if (result is not None):
+                return result
+
+            # The holder finished without a result (it failed). Try ourselves
+            if (cache.get(lock_key) is None):
+                break
+
+        return function()
+
+    async def ado(self, key, function):
+        """Same as do() for a coroutine function. Neither waiting nor the cache block the event loop
+
+        Args:
+            key (string): Identifies the call, e.g. 'group:default:edx-IT_IS-NAU_01-2021_2022'
+            function (callable): Returns the coroutine to await. Its result must be picklable
+
+        Returns:
+            The result of function(), possibly from another request
+        """
+
+        lock_key = '{0}:flight:{1}:lock'.format(KEY_PREFIX, key)
+        result_key = '{0}:flight:{1}:result'.format(KEY_PREFIX, key)
+        token = uuid.uuid4().hex
+
+        cache_add = sync_to_async(cache.add, thread_sensitive=False)
+        cache_get = sync_to_async(cache.get, thread_sensitive=False)
+
+        if (await cache_add(lock_key, token, self.lease)):
+            try:
+                result = await function()
+                await sync_to_async(cache.set, thread_sensitive=False)(result_key, result, RESULT_TIMEOUT)
+                return result
+            finally:
+                await sync_to_async(self.release, thread_sensitive=False)(lock_key, token)
+
+        deadline = time.monotonic() + self.wait
+
+        while (time.monotonic() < deadline):
+            await asyncio.sleep(POLL_INTERVAL)
+
+            result = await cache_get(result_key)
+            if (result is not None):
+                return result
+
+            if (await cache_get(lock_key) is None):
+                break
+
+        return await function()
+
+    def release(self, lock_key, token):
+        # Only release the lock if the lease did not expire and pass to someone else
+        if (cache.get(lock_key) == token):
+            cache.delete(lock_key)
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Gets the process-wide SingleFlight
+
+    Returns:
+        SingleFlight: The shared instance
+    """
+
+    global _single_flight
+
+    if (_single_flight is None):
+        with _single_flight_lock:
+            if (_single_flight is None):
+                _single_flight = SingleFlight()
+
+    return _single_flight
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Counts the messages and participants of the course rooms, for instructors.
+
+Each sync reads only the messages posted since the previous one: the room's high-water mark
+(RocketChatRoomActivity.synced_until) is the 'oldest' time of the groups.history pages. The
+pages are streamed and added up on the fly, so the memory used grows with the number of
+people who posted, not with the number of messages. The totals are then added to the
+summary tables and the high-water mark is moved forward, in one transaction.
+
+The high-water mark is the time of the newest message read, a time of the Rocket.Chat clock.
+A sync only reads the messages older than SYNC_LAG: the messages still being saved by
+Rocket.Chat, or stamped by a clock a little behind the LMS one, are read by the next sync.
+
+The activity view only reads the summary tables: it never calls Rocket.Chat.
+"""
+
+import collections
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .RocketChat import RocketChat
+from .models import RocketChatDailyActivity, RocketChatParticipant, RocketChatRoomActivity
+
+# Messages posted in the last minute (by the LMS clock) are left to the next sync
+SYNC_LAG = timedelta(minutes=1)
+
+
+def format_time(value):
+    """Formats a time like Rocket.Chat (ISO 8601 in UTC, with milliseconds)"""
+
+    value = value.astimezone(dt_timezone.utc)
+    return '{0}.{1:03d}Z'.format(value.strftime('%Y-%m-%dT%H:%M:%S'), value.microsecond // 1000)
+
+
+def parse_time(value):
+    """Parses a message time: an ISO 8601 string, or {"$date": milliseconds} in some versions"""
+
+    if(isinstance(value, dict)):
+        return datetime.fromtimestamp(value.get('$date', 0) / 1000.0, dt_timezone.utc)
+
+    return parse_datetime(value) if value else None
+
+
+class ActivityTotals(object):
+    """The activity found in one sync of a room
+
+    Attributes:
+        messages -- user messages counted
+        last_message_at -- time of the newest message
+        newest -- time of the newest message read, counted or not (the next high-water mark)
+        senders -- (username, messages, last message time) of each user ID
+        days -- messages of each day (UTC)
+    """
+
+    def __init__(self, oldest):
+        """
+        :param oldest: The high-water mark. Messages at that time were counted by the previous sync
+        """
+
+        self.oldest = oldest
+        self.messages = 0
+        self.last_message_at = None
+        self.newest = oldest
+        self.senders = {}
+        self.days = collections.Counter()
+
+    def add(self, message):
+        """Counts a message of groups.history"""
+
+        sent_at = parse_time(message.get('ts'))
+        if(sent_at is None or (self.oldest is not None and sent_at <= self.oldest)):
+            return
+
+        if(self.newest is None or sent_at > self.newest):
+            self.newest = sent_at
+
+        # System messages (user joined, room renamed...) have a type
+        if(message.get('t')):
+            return
+
+        user = message.get('u') or {}
+        user_id = user.get('_id')
+        if(not user_id):
+            return
+
+        self.messages += 1
+        self.days[sent_at.date()] += 1
+
+        if(self.last_message_at is None or sent_at > self.last_message_at):
+            self.last_message_at = sent_at
+
+        username, messages, last_message_at = self.senders.get(user_id, (user.get('username', ''), 0, sent_at))
+        self.senders[user_id] = (username, messages + 1, max(last_message_at, sent_at))
+
+
+def sync_course(course_key, page_size=500):
+    """Syncs the activity of a course room
+
+    Args:
+        course_key (CourseKey): The course ID
+        page_size (int): Messages read per groups.history call
+
+    Returns:
+        tuple: (messages added, calls made to Rocket.Chat) -OR- None if the course has no room
+    """
+
+    course_info = {
+        "user": {"username": "", "email": "", "display_name": "", "is_staff": False, "is_enrolled": False},
+        "course": {"name": "", "key": str(course_key)},
+    }
+
+    rocketChat = RocketChat(course_info, require_enrollment=False)
+
+    room_id = rocketChat.get_group_info(create=False).get('group', {}).get('_id')
+    if(not room_id):
+        return None
+
+    added = sync_room(rocketChat, room_id, page_size)
+    return added, rocketChat.api_call.calls
+
+
+def sync_room(rocketChat, room_id, page_size=500):
+    """Reads the messages posted since the last sync and adds them to the summary tables
+
+    Args:
+        rocketChat (RocketChat): The admin client of the course
+        room_id (string): Room/group ID
+        page_size (int): Messages read per groups.history call
+
+    Returns:
+        int: The number of messages added
+    """
+
+    backend = rocketChat.backend.name
+    summary = RocketChatRoomActivity.objects.filter(backend=backend, room_id=room_id).first()
+    oldest = summary.synced_until if summary else None
+
+    # The fixed end of the pages. Truncated to the millisecond, like the message times
+    latest = timezone.now() - SYNC_LAG
+    latest = latest.replace(microsecond=latest.microsecond // 1000 * 1000)
+
+    totals = ActivityTotals(oldest)
+    history = rocketChat.get_group_history(
+        room_id, format_time(oldest) if oldest else None, format_time(latest), page_size)
+
+    for message in history:
+        totals.add(message)
+
+    if(not save_totals(backend, rocketChat.course_id, room_id, oldest, totals.newest, totals)):
+        # Another sync of the room finished first: it counted the same messages
+        return 0
+
+    return totals.messages
+
+
+@transaction.atomic
+def save_totals(backend, course_id, room_id, oldest, latest, totals):
+    """Adds the totals of a sync to the summary tables and moves the high-water mark to 'latest'
+
+    Returns:
+        bool: False if the high-water mark moved meanwhile (nothing is saved)
+    """
+
+    summary, created = RocketChatRoomActivity.objects.select_for_update().get_or_create(
+        backend=backend, room_id=room_id, defaults={'course_id': course_id})
+
+    if(summary.synced_until != oldest):
+        return False
+
+    # Participants: one query to read them and one per kind of write
+    participants = {
+        row.user_id: row
+        for row in RocketChatParticipant.objects.filter(room_id=room_id, user_id__in=list(totals.senders))
+    }
+
+    new = []
+    for user_id, (username, messages, last_message_at) in totals.senders.items():
+        row = participants.get(user_id)
+        if(row is None):
+            new.append(RocketChatParticipant(room_id=room_id, user_id=user_id, username=username,
+                                             messages=messages, last_message_at=last_message_at))
+        else:
+            row.username = username or row.username
+            row.messages += messages
+            row.last_message_at = max(filter(None, (row.last_message_at, last_message_at)))
+
+    if(participants):
+        RocketChatParticipant.objects.bulk_update(participants.values(), ['username', 'messages', 'last_message_at'])
+    RocketChatParticipant.objects.bulk_create(new)
+
+    # Days
+    days = {row.day: row for row in RocketChatDailyActivity.objects.filter(room_id=room_id, day__in=list(totals.days))}
+
+    for day, row in days.items():
+        row.messages += totals.days[day]
+
+    if(days):
+        RocketChatDailyActivity.objects.bulk_update(days.values(), ['messages'])
+    RocketChatDailyActivity.objects.bulk_create([
+        RocketChatDailyActivity(room_id=room_id, day=day, messages=messages)
+        for day, messages in totals.days.items() if day not in days
+    ])
+
+    # Room
+    summary.course_id = course_id
+    summary.messages += totals.messages
+    summary.participants += len(new)
+    if(totals.last_message_at):
+        summary.last_message_at = max(filter(None, (summary.last_message_at, totals.last_message_at)))
+    summary.synced_until = latest
+    summary.save()
+
+    return True
+
+
+def get_course_activity(course_key, days=30, top=20):
+    """Gets the activity of a course room from the summary tables (Rocket.Chat is not called)
+
+    Args:
+        course_key (CourseKey): The course ID
+        days (int): Days of daily counts, up to today
+        top (int): Number of most active participants
+
+    Returns:
+        dict: {'messages', 'participants', 'last_message_at', 'synced_until',
+               'daily': [(day, messages)...], 'top': [(username, messages, last_message_at)...]}
+            -OR- None if the room was never synced
+    """
+
+    rooms = list(RocketChatRoomActivity.objects.filter(course_id=course_key))
+    if(not rooms):
+        return None
+
+    room_ids = [room.room_id for room in rooms]
+    today = timezone.now().astimezone(dt_timezone.utc).date()
+    first_day = today - timedelta(days=days - 1)
+
+    counts = collections.Counter()
+    for day, messages in RocketChatDailyActivity.objects.filter(
+            room_id__in=room_ids, day__gte=first_day).values_list('day', 'messages'):
+        counts[day] += messages
+
+    top_participants = (
+        RocketChatParticipant.objects
+        .filter(room_id__in=room_ids)
+        .order_by('-messages', 'username')
+        .values_list('username', 'messages', 'last_message_at')[:top]
+    )
+
+    return {
+        "messages": sum(room.messages for room in rooms),
+        "participants": sum(room.participants for room in rooms),
+        "last_message_at": max(filter(None, (room.last_message_at for room in rooms)), default=None),
+        "synced_until": min(filter(None, (room.synced_until for room in rooms)), default=None),
+        "daily": [(first_day + timedelta(days=index), counts[first_day + timedelta(days=index)])
+                  for index in range(days)],
+        "top": list(top_participants),
+    }
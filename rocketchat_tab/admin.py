@@ -3,4 +3,52 @@
 
 from django.contrib import admin
 
-# Register your models here.
+from .models import (
+    RocketChatDailyActivity, RocketChatMembership, RocketChatParticipant, RocketChatRoom, RocketChatRoomActivity,
+    RocketChatUser,
+)
+
+
+@admin.register(RocketChatRoom)
+class RocketChatRoomAdmin(admin.ModelAdmin):
+    list_display = ('course_id', 'group_name', 'room_id', 'backend', 'modified')
+    list_filter = ('backend',)
+    search_fields = ('course_id', 'group_name', 'room_id')
+    readonly_fields = ('created', 'modified')
+
+
+@admin.register(RocketChatUser)
+class RocketChatUserAdmin(admin.ModelAdmin):
+    list_display = ('username', 'user_id', 'backend', 'modified')
+    list_filter = ('backend',)
+    search_fields = ('username', 'user_id')
+    readonly_fields = ('created', 'modified')
+
+
+@admin.register(RocketChatMembership)
+class RocketChatMembershipAdmin(admin.ModelAdmin):
+    list_display = ('room_id', 'user_id', 'state', 'modified')
+    list_filter = ('state',)
+    search_fields = ('room_id', 'user_id')
+    readonly_fields = ('modified',)
+
+
+@admin.register(RocketChatRoomActivity)
+class RocketChatRoomActivityAdmin(admin.ModelAdmin):
+    list_display = ('course_id', 'room_id', 'messages', 'participants', 'last_message_at', 'synced_until')
+    list_filter = ('backend',)
+    search_fields = ('course_id', 'room_id')
+    readonly_fields = ('modified',)
+
+
+@admin.register(RocketChatParticipant)
+class RocketChatParticipantAdmin(admin.ModelAdmin):
+    list_display = ('username', 'room_id', 'messages', 'last_message_at')
+    search_fields = ('username', 'user_id', 'room_id')
+
+
+@admin.register(RocketChatDailyActivity)
+class RocketChatDailyActivityAdmin(admin.ModelAdmin):
+    list_display = ('room_id', 'day', 'messages')
+    search_fields = ('room_id',)
+    date_hierarchy = 'day'
@@ -27,4 +27,17 @@ class RocketChatConfig(AppConfig):
         }}
 
     def ready(self):
-        pass
+        # Create the metrics sink (or leave metrics disabled)
+        from . import metrics
+        metrics.configure()
+
+        # Build the pooled HTTP session (and optionally connect) before the first request
+        from .ApiRequest import ApiRequest
+        ApiRequest.warm_up()
+
+        # Provision users when they enroll, unenroll or change course roles
+        from . import signals
+        signals.connect_role_signals()
+
+        # Create course rooms when courses are published or created (Studio)
+        signals.connect_course_signals()
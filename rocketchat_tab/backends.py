@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Spreads the course rooms over several Rocket.Chat servers (backends).
+
+Each course is assigned to a backend by consistent hashing of its room name (see
+RocketChat.build_group_name): the assignment is the same in every LMS worker, and adding
+a backend only moves about 1/N of the courses. ROCKETCHAT_BACKEND_OVERRIDES pins
+courses to a backend, e.g. to keep the courses that would move where their room already is
+(see the rocketchat_backends management command).
+
+Without ROCKETCHAT_BACKENDS, there is a single backend named 'default', made of
+ROCKETCHAT_BASE_URL, ROCKETCHAT_ADMIN_TOKEN and ROCKETCHAT_ADMIN_USER_ID.
+"""
+
+import bisect, collections, hashlib, threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Name of the backend made of the single-server settings
+DEFAULT = 'default'
+
+# Points of each backend on the ring (times its weight). More points spread the courses more evenly
+REPLICAS = 128
+
+# A Rocket.Chat server and the admin credentials used to call it
+Backend = collections.namedtuple('Backend', 'name base_url admin_token admin_user_id weight')
+
+_backends = None
+_ring = None
+_backends_lock = threading.Lock()
+
+
+def hash_key(key):
+    """Hashes a string to a position on the ring (the same in every process, unlike hash())"""
+
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """A consistent hash ring of backend names.
+
+    Each backend has REPLICAS points (times its weight) on the ring. A key belongs to the
+    backend of the first point at or after the key's hash.
+    """
+
+    def __init__(self, weights, replicas=REPLICAS):
+        """
+        :param weights: The weight of each backend name
+        :param replicas: Points on the ring per unit of weight
+        """
+
+        points = []
+        for name, weight in weights.items():
+            for replica in range(int(replicas * weight)):
+                points.append((hash_key('{0}#{1}'.format(name, replica)), name))
+
+        if(not points):
+            raise ImproperlyConfigured("ROCKETCHAT_BACKENDS has no backend with a weight above 0")
+
+        points.sort()
+        self.hashes = [point for point, name in points]
+        self.names = [name for point, name in points]
+
+    def get(self, key):
+        """Gets the backend name a key belongs to"""
+
+        index = bisect.bisect_left(self.hashes, hash_key(key))
+        return self.names[index % len(self.names)]
+
+
+def build_backends():
+    """Builds the backends from the settings
+
+    Returns:
+        dict: The Backend of each name
+    """
+
+    config = getattr(settings, 'ROCKETCHAT_BACKENDS', None)
+
+    if(not config):
+        return {DEFAULT: Backend(DEFAULT, settings.ROCKETCHAT_BASE_URL, settings.ROCKETCHAT_ADMIN_TOKEN,
+                                 settings.ROCKETCHAT_ADMIN_USER_ID, 1)}
+
+    backends = {}
+    for name, options in config.items():
+        try:
+            backends[name] = Backend(name, options['BASE_URL'], options['ADMIN_TOKEN'],
+                                     options['ADMIN_USER_ID'], options.get('WEIGHT', 1))
+        except KeyError as e:
+            raise ImproperlyConfigured("ROCKETCHAT_BACKENDS['{0}'] has no {1}".format(name, e))
+
+    for course_id, name in getattr(settings, 'ROCKETCHAT_BACKEND_OVERRIDES', {}).items():
+        if(name not in backends):
+            raise ImproperlyConfigured(
+                "ROCKETCHAT_BACKEND_OVERRIDES assigns {0} to the unknown backend '{1}'".format(course_id, name))
+
+    return backends
+
+
+def get_backends():
+    """Gets the backends (built once per process)
+
+    Returns:
+        dict: The Backend of each name
+    """
+
+    global _backends, _ring
+
+    if(_backends is None):
+        with _backends_lock:
+            if(_backends is None):
+                backends = build_backends()
+                _ring = HashRing({name: backend.weight for name, backend in backends.items()})
+                _backends = backends
+
+    return _backends
+
+
+def get_default_backend():
+    """Gets the backend used when none is given: the 'default' backend, or the only one
+
+    Returns:
+        Backend: The default backend
+    """
+
+    backends = get_backends()
+
+    if(DEFAULT in backends):
+        return backends[DEFAULT]
+
+    if(len(backends) == 1):
+        return next(iter(backends.values()))
+
+    raise ImproperlyConfigured("ROCKETCHAT_BACKENDS has several backends and none named '{0}'".format(DEFAULT))
+
+
+def get_backend(group_name, course_id=None):
+    """Gets the backend of a course room
+
+    Args:
+        group_name (string): The room name (see RocketChat.build_group_name)
+        course_id (string): The course ID, checked against ROCKETCHAT_BACKEND_OVERRIDES
+
+    Returns:
+        Backend: The backend the room belongs to
+    """
+
+    backends = get_backends()
+
+    if(len(backends) == 1):
+        return next(iter(backends.values()))
+
+    name = getattr(settings, 'ROCKETCHAT_BACKEND_OVERRIDES', {}).get(str(course_id)) if course_id else None
+    return backends[name or _ring.get(group_name)]
+
+
+def get_course_backend(course_id):
+    """Gets the backend of a course (see get_backend)
+
+    Args:
+        course_id (string): The course ID
+
+    Returns:
+        Backend: The backend the course room belongs to
+    """
+
+    from .RocketChat import RocketChat
+
+    return get_backend(RocketChat.build_group_name(str(course_id)), course_id)
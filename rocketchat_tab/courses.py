@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Course lookups shared by the views, management commands and background jobs.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from opaque_keys.edx.keys import CourseKey
+
+from .RocketChatCache import KEY_PREFIX
+
+# Name added to the course's Advanced Module List to show the Chat tab
+ADVANCED_MODULE_NAME = 'rocketchat-tab'
+# Type of the Chat tab in the course tabs (see plugins.RocketChatTab)
+TAB_TYPE = 'rocketchat_tab'
+
+
+def is_chat_enabled(course_key):
+    """Checks if a course shows the Chat tab. The answer is cached for an hour
+
+    Args:
+        course_key (CourseKey): The course ID
+
+    Returns:
+        bool: True if 'rocketchat-tab' is in the course's advanced modules
+    """
+
+    from xmodule.modulestore.django import modulestore
+
+    cache_key = make_enabled_key(course_key)
+    enabled = cache.get(cache_key)
+
+    if(enabled is None):
+        # depth=0 only loads the course block itself, not its content
+        course = modulestore().get_course(course_key, depth=0)
+        enabled = course is not None and ADVANCED_MODULE_NAME in getattr(course, 'advanced_modules', [])
+        cache.set(cache_key, enabled, 60 * 60)
+
+    return enabled
+
+
+def make_enabled_key(course_key):
+    return '{0}:enabled:{1}'.format(KEY_PREFIX, course_key)
+
+
+def forget_chat_enabled(course_key):
+    """Drops the cached answer of is_chat_enabled (e.g. when the course is published)"""
+
+    cache.delete(make_enabled_key(course_key))
+
+
+def get_chat_course_keys():
+    """Gets the courses that show the Chat tab
+
+    Only the courses whose course overview lists the Chat tab are checked: the course tabs are
+    stored with the overview, so the other courses are never loaded from the modulestore.
+
+    Returns:
+        generator: CourseKey of each course with 'rocketchat-tab' in its advanced modules
+    """
+
+    from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+
+    candidates = (
+        CourseOverview.objects
+        .filter(tab_set__type=TAB_TYPE)
+        .values_list('id', flat=True)
+        .distinct()
+        .iterator()
+    )
+
+    for course_key in candidates:
+        if(is_chat_enabled(course_key)):
+            yield course_key
+
+
+def get_course_name(course_key):
+    """Gets the display name of a course from its (cached) course overview
+
+    Args:
+        course_key (CourseKey or string): The course ID
+
+    Returns:
+        string: The course display name
+    """
+
+    from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+
+    if(isinstance(course_key, str)):
+        course_key = CourseKey.from_string(course_key)
+
+    return CourseOverview.get_from_id(course_key).display_name
+
+
+def get_course_staff_ids(course_key):
+    """Gets the IDs of the users with a staff or instructor role in a course
+
+    Args:
+        course_key (CourseKey): The course ID
+
+    Returns:
+        set: The user IDs of the course team
+    """
+
+    from common.djangoapps.student.roles import CourseInstructorRole, CourseStaffRole
+
+    user_ids = set()
+    for role in (CourseStaffRole(course_key), CourseInstructorRole(course_key)):
+        user_ids.update(role.users_with_role().values_list('id', flat=True))
+
+    return user_ids
+
+
+def get_course_owner_ids(course_key):
+    """Gets the IDs of the course and organization team members who are course staff
+
+    Each one is checked with is_course_staff, the check of the Chat tab. Staff access can
+    only come from these teams or from global staff (User.is_staff), so the rest of a roster
+    needs no check.
+
+    Args:
+        course_key (CourseKey): The course ID
+
+    Returns:
+        set: The user IDs of the room owners, except global staff
+    """
+
+    from django.contrib.auth import get_user_model
+    from common.djangoapps.student.roles import OrgInstructorRole, OrgStaffRole
+
+    user_ids = get_course_staff_ids(course_key)
+    for role in (OrgStaffRole(course_key.org), OrgInstructorRole(course_key.org)):
+        user_ids.update(role.users_with_role().values_list('id', flat=True))
+
+    users = get_user_model().objects.in_bulk(user_ids) if user_ids else {}
+    return set(user_id for user_id, user in users.items() if is_course_staff(user, course_key))
+
+
+def make_staff_key(user_id, course_key):
+    return '{0}:staff:{1}:{2}'.format(KEY_PREFIX, course_key, user_id)
+
+
+def is_course_staff(user, course_key):
+    """Checks if a user has staff access to a course (room owner). The answer is cached
+
+    The check is the LMS 'staff' access check (global staff, course and organization teams),
+    made on the course key so the course is not loaded. It is cached for
+    ROCKETCHAT_ROLE_CACHE_TIMEOUT seconds, and dropped when a course role changes
+    (see signals).
+
+    Args:
+        user (User): The edX user
+        course_key (CourseKey): The course ID
+
+    Returns:
+        bool: True if the user is course staff
+    """
+
+    from lms.djangoapps.courseware.access import has_access
+
+    if(not user.is_authenticated):
+        return False
+
+    cache_key = make_staff_key(user.id, course_key)
+    is_staff = cache.get(cache_key)
+
+    if(is_staff is None):
+        is_staff = bool(has_access(user, 'staff', course_key))
+        cache.set(cache_key, is_staff, getattr(settings, 'ROCKETCHAT_ROLE_CACHE_TIMEOUT', 60 * 5))
+
+    return is_staff
+
+
+def forget_course_staff(user_id, course_key):
+    """Drops the cached staff access of a user (see is_course_staff)"""
+
+    cache.delete(make_staff_key(user_id, course_key))
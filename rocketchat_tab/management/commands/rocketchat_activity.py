@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+
+from django.core.management.base import BaseCommand, CommandError
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+
+from ...RocketChatError import RocketChatError
+from ... import activity, courses
+
+
+class Command(BaseCommand):
+    """
+    Counts the messages and participants of course rooms for the activity view (see
+    activity.py). Each run only reads the messages posted since the previous run, so it is
+    meant to run periodically, e.g. hourly from cron. The first run of a room reads its whole
+    history once.
+
+    Examples:
+        ./manage.py lms rocketchat_activity course-v1:NAU+IT_IS+2022_SUMMER
+        ./manage.py lms rocketchat_activity --all
+    """
+
+    help = "Syncs the message and participant counts of Rocket.Chat course rooms."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', help='Course IDs to sync')
+        parser.add_argument('--all', action='store_true',
+                            help="Sync every course with 'rocketchat-tab' in its advanced modules")
+        parser.add_argument('--page-size', type=int, default=500,
+                            help='Number of messages read per groups.history call')
+
+    def handle(self, *args, **options):
+
+        if(options['all']):
+            course_keys = courses.get_chat_course_keys()
+        elif(options['course_ids']):
+            course_keys = [self.parse_course_key(course_id) for course_id in options['course_ids']]
+        else:
+            raise CommandError('Specify one or more course IDs or --all')
+
+        for course_key in course_keys:
+            self.sync_course(course_key, options)
+
+    def parse_course_key(self, course_id):
+        try:
+            return CourseKey.from_string(course_id)
+        except InvalidKeyError:
+            raise CommandError('Invalid course ID: {0}'.format(course_id))
+
+    def sync_course(self, course_key, options):
+        """Syncs the room of one course and prints the result"""
+
+        try:
+            result = activity.sync_course(course_key, options['page_size'])
+        except RocketChatError as e:
+            self.stderr.write('{0}: {1}'.format(course_key, str(e).strip()))
+            return
+
+        if(result is None):
+            self.stdout.write('{0}: no room yet'.format(course_key))
+            return
+
+        added, calls = result
+        self.stdout.write(self.style.SUCCESS(
+            '{0}: {1} new messages in {2} calls to Rocket.Chat'.format(course_key, added, calls)))
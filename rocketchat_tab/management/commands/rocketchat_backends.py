@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+
+import collections, json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import backends
+from ...models import RocketChatRoom
+
+
+class Command(BaseCommand):
+    """
+    Shows how the course rooms are spread over the Rocket.Chat backends (ROCKETCHAT_BACKENDS),
+    and which rooms the current configuration would move to another backend.
+
+    A course assigned to a backend where its room is not gets a new, empty room there. Run
+    this command with the new configuration before adding or removing a backend, and add the
+    overrides it prints to ROCKETCHAT_BACKEND_OVERRIDES to keep those courses where they are.
+    It reads the stored rooms (see models and the rocketchat_backfill command).
+
+    Examples:
+        ./manage.py lms rocketchat_backends
+    """
+
+    help = "Shows the backend of each course room and the overrides that keep rooms where they are."
+
+    def handle(self, *args, **options):
+
+        if(not getattr(settings, 'ROCKETCHAT_ID_STORE', True)):
+            raise CommandError('ROCKETCHAT_ID_STORE is disabled: the rooms are not stored')
+
+        assigned = collections.Counter()
+        overrides = {}
+
+        rooms = RocketChatRoom.objects.order_by('course_id').values_list('course_id', 'group_name', 'backend')
+        for course_id, group_name, current in rooms.iterator():
+            backend = backends.get_backend(group_name, course_id).name
+            assigned[backend] += 1
+
+            if(backend != current):
+                overrides[str(course_id)] = current
+
+        for name, backend in backends.get_backends().items():
+            self.stdout.write('{0} ({1}): {2} rooms'.format(name, backend.base_url, assigned[name]))
+
+        if(not overrides):
+            self.stdout.write(self.style.SUCCESS('Every room is on its assigned backend'))
+            return
+
+        self.stdout.write(self.style.WARNING(
+            '{0} rooms are not on their assigned backend. To keep them where they are, add to '
+            'ROCKETCHAT_BACKEND_OVERRIDES:'.format(len(overrides))))
+        self.stdout.write(json.dumps(overrides, indent=4, sort_keys=True))
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+
+import itertools
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Lower
+
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+
+from ... import backends
+from ...models import RocketChatMembership, RocketChatRoom, RocketChatUser, upsert
+from ...RocketChat import RocketChat
+from ...RocketChatCache import MEMBER, OWNER
+from ...RocketChatError import RocketChatError
+
+
+def chunks(iterable, size):
+    """Splits an iterable into lists of 'size' items (the last one may be shorter)"""
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if(not chunk):
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    """
+    Loads the Rocket.Chat IDs of the course rooms and of the LMS users into the database
+    (see models), paging through Rocket.Chat, so a fresh install or a flushed cache does not
+    look every room and user up again one request at a time.
+
+    With --memberships, the members and owners of each course room are loaded too. With
+    several backends (ROCKETCHAT_BACKENDS), each one is read in turn. Run it again at any
+    time: rows are updated in place.
+
+    Examples:
+        ./manage.py lms rocketchat_backfill
+        ./manage.py lms rocketchat_backfill --memberships --page-size 1000
+    """
+
+    help = "Loads the Rocket.Chat room, user and membership IDs into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=500,
+                            help='Number of rooms, users or members read from Rocket.Chat at a time')
+        parser.add_argument('--memberships', action='store_true',
+                            help='Also load the members and owners of every course room')
+
+    def handle(self, *args, **options):
+
+        if(not getattr(settings, 'ROCKETCHAT_ID_STORE', True)):
+            raise CommandError('ROCKETCHAT_ID_STORE is disabled: there is nothing to backfill')
+
+        # Rooms are matched to courses by name
+        course_keys = {
+            RocketChat.build_group_name(str(course_key)): course_key
+            for course_key in CourseOverview.objects.values_list('id', flat=True).iterator()
+        }
+
+        if(not course_keys):
+            self.stdout.write('No courses: there is nothing to backfill')
+            return
+
+        for backend in backends.get_backends().values():
+            self.backfill_backend(backend, course_keys, options)
+
+    def backfill_backend(self, backend, course_keys, options):
+        """Loads the IDs of one Rocket.Chat server
+
+        Args:
+            backend (Backend): The Rocket.Chat server
+            course_keys (dict): The course key of each room name
+            options (dict): The command options
+        """
+
+        # An admin client (the course is only needed to build it)
+        rocketChat = RocketChat(self.make_edx_info(next(iter(course_keys.values()))),
+                                require_enrollment=False, backend=backend)
+        page_size = options['page_size']
+
+        self.stdout.write('{0} ({1}):'.format(backend.name, backend.base_url))
+
+        try:
+            room_ids = self.backfill_rooms(rocketChat, course_keys, page_size)
+            self.backfill_users(rocketChat, page_size)
+
+            if(options['memberships']):
+                self.backfill_memberships(rocketChat, room_ids, page_size)
+
+        except RocketChatError as e:
+            raise CommandError('{0}: {1}'.format(backend.name, str(e).strip()))
+
+        self.stdout.write(self.style.SUCCESS(
+            '{0}: done in {1} calls to Rocket.Chat'.format(backend.name, rocketChat.api_call.calls)))
+
+    def make_edx_info(self, course_key):
+        return {
+            "user": {"username": "", "email": "", "display_name": "", "is_staff": False, "is_enrolled": False},
+            "course": {"name": "", "key": str(course_key)},
+        }
+
+    def backfill_rooms(self, rocketChat, course_keys, page_size):
+        """Stores the ID of every course room
+
+        Args:
+            rocketChat (RocketChat): The admin client
+            course_keys (dict): The course key of each room name
+            page_size (int): Rooms read at a time
+
+        Returns:
+            list: The IDs of the course rooms
+        """
+
+        room_ids = []
+        changed = 0
+
+        for groups in chunks(rocketChat.list_groups(page_size), page_size):
+            rows = {
+                name: {'room_id': room_id, 'course_id': course_keys[name]}
+                for name, room_id in groups if name in course_keys
+            }
+
+            changed += upsert(RocketChatRoom, 'group_name', rows, backend=rocketChat.backend.name) if rows else 0
+            room_ids.extend(row['room_id'] for row in rows.values())
+
+        self.stdout.write('  Rooms: {0} course rooms, {1} added or changed'.format(len(room_ids), changed))
+        return room_ids
+
+    def backfill_users(self, rocketChat, page_size):
+        """Stores the ID of every Rocket.Chat user that is an LMS user"""
+
+        found = 0
+        changed = 0
+
+        for users in chunks(rocketChat.list_users(page_size), page_size):
+            # Users created by this plugin have the lowercased LMS username
+            user_ids = {username: user_id for username, user_id in users
+                        if username and username == username.lower()}
+
+            known = set(
+                get_user_model().objects
+                .annotate(lower_username=Lower('username'))
+                .filter(lower_username__in=list(user_ids))
+                .values_list('lower_username', flat=True)
+            )
+
+            rows = {username: {'user_id': user_ids[username]} for username in known}
+            found += len(rows)
+            changed += upsert(RocketChatUser, 'username', rows, backend=rocketChat.backend.name) if rows else 0
+
+        self.stdout.write('  Users: {0} LMS users, {1} added or changed'.format(found, changed))
+
+    def backfill_memberships(self, rocketChat, room_ids, page_size):
+        """Stores the members and owners of each course room"""
+
+        found = 0
+
+        for room_id in room_ids:
+            owners = rocketChat.get_group_owners(room_id)
+
+            for members in chunks(rocketChat.get_group_members(room_id, page_size), page_size):
+                rows = {user_id: {'state': OWNER if user_id in owners else MEMBER} for username, user_id in members}
+                found += len(rows)
+
+                # The memberships were just confirmed: they are trusted for another ROCKETCHAT_MEMBERSHIP_TIMEOUT
+                upsert(RocketChatMembership, 'user_id', rows, touch=True, room_id=room_id)
+
+        self.stdout.write('  Memberships: {0} in {1} rooms'.format(found, len(room_ids)))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+
+from common.djangoapps.student.models import CourseEnrollment
+
+from ...RocketChatCache import KEY_PREFIX
+from ...RocketChatError import RocketChatError
+from ... import courses, provisioning
+
+# Checkpoints are kept for a week so an interrupted run can be resumed
+CHECKPOINT_TIMEOUT = 60 * 60 * 24 * 7
+
+
+class Command(BaseCommand):
+    """
+    Creates the Rocket.Chat room, the missing users and the memberships of whole course
+    rosters ahead of time, so the Chat tab has nothing left to provision on first view.
+
+    The roster is read in batches of enrollments ordered by ID. The last finished batch is
+    recorded, and a new run of the same course continues from there (unless --restart).
+
+    Examples:
+        ./manage.py lms rocketchat_provision course-v1:NAU+IT_IS+2022_SUMMER
+        ./manage.py lms rocketchat_provision --all --workers 16
+    """
+
+    help = "Pre-provisions Rocket.Chat rooms, users and memberships for course rosters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', help='Course IDs to provision')
+        parser.add_argument('--all', action='store_true',
+                            help="Provision every course with 'rocketchat-tab' in its advanced modules")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of enrollments read from the database at a time')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of users provisioned at the same time')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint of a previous run and start over')
+
+    def handle(self, *args, **options):
+
+        if(options['all']):
+            course_keys = courses.get_chat_course_keys()
+        elif(options['course_ids']):
+            course_keys = [self.parse_course_key(course_id) for course_id in options['course_ids']]
+        else:
+            raise CommandError('Specify one or more course IDs or --all')
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for course_key in course_keys:
+                self.provision_course(course_key, executor, options)
+
+    def parse_course_key(self, course_id):
+        try:
+            return CourseKey.from_string(course_id)
+        except InvalidKeyError:
+            raise CommandError('Invalid course ID: {0}'.format(course_id))
+
+    def provision_course(self, course_key, executor, options):
+        """Provisions the room and every active enrollment of one course
+
+        Args:
+            course_key (CourseKey): The course to provision
+            executor (ThreadPoolExecutor): The pool bounding the concurrent users
+            options (dict): The command options
+        """
+
+        checkpoint_key = '{0}:provision:{1}'.format(KEY_PREFIX, course_key)
+        last_id = 0 if options['restart'] else cache.get(checkpoint_key, 0)
+
+        course_name = courses.get_course_name(course_key)
+        staff_ids = courses.get_course_staff_ids(course_key)
+
+        self.stdout.write('{0}: starting after enrollment {1}'.format(course_key, last_id))
+
+        processed = 0
+        failed = 0
+        started = time.monotonic()
+        room_ready = False
+
+        while True:
+            enrollments = list(
+                CourseEnrollment.objects
+                .filter(course_id=course_key, is_active=True, id__gt=last_id)
+                .select_related('user', 'user__profile')
+                .order_by('id')[:options['batch_size']]
+            )
+
+            if(not enrollments):
+                break
+
+            edx_infos = [
+                provisioning.build_edx_info(
+                    enrollment.user, course_key, course_name,
+                    is_staff=enrollment.user.is_staff or enrollment.user.id in staff_ids)
+                for enrollment in enrollments
+            ]
+
+            # Provision the first user alone so the room is created exactly once
+            if(not room_ready):
+                ok = self.provision_user(edx_infos.pop(0))
+                processed += 1
+                failed += 0 if ok else 1
+                room_ready = ok
+
+            for ok in executor.map(self.provision_user, edx_infos):
+                processed += 1
+                failed += 0 if ok else 1
+
+            last_id = enrollments[-1].id
+            cache.set(checkpoint_key, last_id, CHECKPOINT_TIMEOUT)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write('{0}: {1} users processed, {2} failed, {3:.1f} users/s'.format(
+                course_key, processed, failed, processed / elapsed if elapsed else 0))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            '{0}: done. {1} users processed, {2} failed in {3:.1f}s ({4:.1f} users/s)'.format(
+                course_key, processed, failed, elapsed, processed / elapsed if elapsed else 0)))
+
+        # The run finished: the next run starts from the beginning (and retries failed users)
+        cache.delete(checkpoint_key)
+
+    def provision_user(self, edx_info):
+        """Provisions one user. Errors are reported and do not stop the run
+
+        Args:
+            edx_info (dict): The essential user and course information
+
+        Returns:
+            bool: True on success
+        """
+
+        try:
+            provisioning.provision_room(edx_info)
+            return True
+
+        except RocketChatError as e:
+            self.stderr.write('{0}: {1}'.format(edx_info['user']['username'], str(e).strip()))
+            return False
+
+        finally:
+            close_old_connections()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+
+from ...RocketChatError import RocketChatError
+from ...reconciliation import Reconciler
+from ... import courses
+
+
+class Command(BaseCommand):
+    """
+    Brings course rooms in line with the course rosters: invites missing learners, removes
+    unenrolled ones and fixes room owners (see reconciliation.py). Meant to run periodically,
+    e.g. nightly from cron.
+
+    Only the differences cost calls to Rocket.Chat. The report compares the calls made with
+    the calls the same roster would cost if each user were provisioned on its own.
+
+    Examples:
+        ./manage.py lms rocketchat_reconcile course-v1:NAU+IT_IS+2022_SUMMER --dry-run
+        ./manage.py lms rocketchat_reconcile --all --workers 16
+    """
+
+    help = "Reconciles Rocket.Chat room members and owners with course rosters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', help='Course IDs to reconcile')
+        parser.add_argument('--all', action='store_true',
+                            help="Reconcile every course with 'rocketchat-tab' in its advanced modules")
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of changes applied at a time')
+        parser.add_argument('--page-size', type=int, default=500,
+                            help='Number of room members read per groups.members call')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of changes applied at the same time')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the changes without applying them')
+
+    def handle(self, *args, **options):
+
+        if(options['all']):
+            course_keys = courses.get_chat_course_keys()
+        elif(options['course_ids']):
+            course_keys = [self.parse_course_key(course_id) for course_id in options['course_ids']]
+        else:
+            raise CommandError('Specify one or more course IDs or --all')
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for course_key in course_keys:
+                self.reconcile_course(course_key, executor, options)
+
+    def parse_course_key(self, course_id):
+        try:
+            return CourseKey.from_string(course_id)
+        except InvalidKeyError:
+            raise CommandError('Invalid course ID: {0}'.format(course_id))
+
+    def reconcile_course(self, course_key, executor, options):
+        """Reconciles the room of one course and prints the report
+
+        Args:
+            course_key (CourseKey): The course to reconcile
+            executor (ThreadPoolExecutor): The pool bounding the concurrent changes
+            options (dict): The command options
+        """
+
+        reconciler = Reconciler(course_key, executor, batch_size=options['batch_size'],
+                                page_size=options['page_size'], dry_run=options['dry_run'])
+        started = time.monotonic()
+
+        try:
+            report = reconciler.run()
+        except RocketChatError as e:
+            self.stderr.write('{0}: {1}'.format(course_key, str(e).strip()))
+            return
+
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            '{0}: {1} in the roster, {2} in the room, {3} unchanged. '
+            'Invited {4}, removed {5}, promoted {6}, demoted {7}, {8} failed, {9} not LMS users{10}'.format(
+                course_key, report['roster'], report['members'], report['unchanged'],
+                report['invite'], report['remove'], report['promote'], report['demote'],
+                report['failed'], report['unmanaged'], ' (dry run)' if options['dry_run'] else ''))
+
+        if(not options['dry_run']):
+            saved = report['baseline_calls'] - report['calls']
+            self.stdout.write(self.style.SUCCESS(
+                '{0}: done in {1:.1f}s. {2} calls to Rocket.Chat instead of {3} with per-user '
+                'provisioning ({4} saved)'.format(
+                    course_key, elapsed, report['calls'], report['baseline_calls'], saved)))
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Metrics for the Rocket.Chat calls and the provisioning of the Chat tab.
+
+Set ROCKETCHAT_METRICS to choose where the metrics go:
+    - None (default): disabled. Instrumented code only checks 'metrics.enabled'
+    - 'prometheus': aggregated in each worker process and exported as text by MetricsView
+    - 'statsd': sent as statsd UDP packets to ROCKETCHAT_STATSD_HOST:ROCKETCHAT_STATSD_PORT
+    - A dotted path to a sink class with timing(name, seconds, labels) and
+      increment(name, labels) methods
+
+Metrics:
+    rocketchat_api_request_seconds{endpoint}: latency of each call (groups.info, users.create...)
+    rocketchat_api_errors_total{endpoint, error_type}: failed calls by Rocket.Chat 'errorType'
+    rocketchat_provisioning_seconds{path}: Chat tab provisioning time, 'cold' when at least one
+        call was made to Rocket.Chat, 'warm' when everything came from the caches
+"""
+
+import bisect, socket, threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+API_REQUEST_SECONDS = 'rocketchat_api_request_seconds'
+API_ERRORS_TOTAL = 'rocketchat_api_errors_total'
+PROVISIONING_SECONDS = 'rocketchat_provisioning_seconds'
+
+# Histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Set by configure(). Checked by the instrumented code before measuring anything
+enabled = False
+sink = None
+
+
+class PrometheusSink(object):
+    """Aggregates histograms and counters in the worker process, exported as Prometheus text.
+
+    Each worker process has its own values. Scrape every worker, or use the 'statsd' sink to
+    aggregate across processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def timing(self, name, seconds, labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if (histogram is None):
+                # [count per bucket..., +Inf count, sum]
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+
+            histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    def increment(self, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def export(self):
+        """Formats the metrics in the Prometheus text exposition format
+
+        Returns:
+            string: The metrics
+        """
+
+        with self._lock:
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        typed = set()
+
+        for (name, labels), values in sorted(histograms.items()):
+            if (name not in typed):
+                lines.append('# TYPE {0} histogram'.format(name))
+                typed.add(name)
+
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, format_labels(labels + (('le', str(bound)),)), cumulative))
+
+            lines.append('{0}_sum{1} {2}'.format(name, format_labels(labels), values[-1]))
+            lines.append('{0}_count{1} {2}'.format(name, format_labels(labels), cumulative))
+
+        for (name, labels), value in sorted(counters.items()):
+            if (name not in typed):
+                lines.append('# TYPE {0} counter'.format(name))
+                typed.add(name)
+
+            lines.append('{0}{1} {2}'.format(name, format_labels(labels), value))
+
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdSink(object):
+    """Sends each measurement as a statsd UDP packet (fire and forget)"""
+
+    def __init__(self):
+        self.address = (getattr(settings, 'ROCKETCHAT_STATSD_HOST', 'localhost'),
+                        getattr(settings, 'ROCKETCHAT_STATSD_PORT', 8125))
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def timing(self, name, seconds, labels):
+        self.send('{0}:{1:.3f}|ms'.format(self.make_name(name, labels), seconds * 1000))
+
+    def increment(self, name, labels):
+        self.send('{0}:1|c'.format(self.make_name(name, labels)))
+
+    def make_name(self, name, labels):
+        # rocketchat_api_request_seconds{endpoint="groups.info"} --> rocketchat.api_request_seconds.groups_info
+        parts = [name.replace('rocketchat_', 'rocketchat.', 1)]
+        parts.extend(str(value).replace('.', '_') for key, value in sorted(labels.items()))
+        return '.'.join(parts)
+
+    def send(self, packet):
+        try:
+            self.socket.sendto(packet.encode('utf-8'), self.address)
+        except OSError:
+            pass
+
+
+def format_labels(labels):
+    if (not labels):
+        return ''
+
+    return '{' + ','.join('{0}="{1}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels) + '}'
+
+
+def configure():
+    """Creates the sink selected by ROCKETCHAT_METRICS. Called when the app is loaded"""
+
+    global enabled, sink
+
+    name = getattr(settings, 'ROCKETCHAT_METRICS', None)
+
+    if (not name):
+        sink = None
+    elif (name == 'prometheus'):
+        sink = PrometheusSink()
+    elif (name == 'statsd'):
+        sink = StatsdSink()
+    else:
+        sink = import_string(name)()
+
+    enabled = sink is not None
+
+
+def record_api_call(endpoint, seconds, resp):
+    """Records the latency and the error type (if any) of a Rocket.Chat call
+
+    Args:
+        endpoint (string): The endpoint name, e.g. groups.info
+        seconds (float): The time the call took, including retries and waiting in line
+        resp (ApiResponse): The response of the call
+    """
+
+    sink.timing(API_REQUEST_SECONDS, seconds, {"endpoint": endpoint})
+
+    if (resp.success == True):
+        return
+
+    if (resp.error_type):
+        error_type = resp.error_type
+    elif (resp.status_code):
+        # Some errors have no 'errorType', e.g. users.info: {"success": false, "error": "User not found."}
+        error_type = 'http_{0}'.format(resp.status_code)
+    else:
+        # No answer: connection error, timeout, open circuit or full queue
+        error_type = 'connection'
+
+    sink.increment(API_ERRORS_TOTAL, {"endpoint": endpoint, "error_type": error_type})
+
+
+def record_provisioning(seconds, cold):
+    """Records the provisioning time of a Chat tab view
+
+    Args:
+        seconds (float): The time provisioning took
+        cold (bool): True if at least one call was made to Rocket.Chat
+    """
+
+    sink.timing(PROVISIONING_SECONDS, seconds, {"path": 'cold' if cold else 'warm'})
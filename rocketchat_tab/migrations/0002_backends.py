@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations, models
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rocketchat_tab', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rocketchatroom',
+            name='backend',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='rocketchatuser',
+            name='backend',
+            field=models.CharField(default='default', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='rocketchatroom',
+            name='course_id',
+            field=opaque_keys.edx.django.models.CourseKeyField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='rocketchatroom',
+            name='group_name',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='rocketchatuser',
+            name='username',
+            field=models.CharField(max_length=150),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rocketchatroom',
+            unique_together={('backend', 'group_name')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='rocketchatuser',
+            unique_together={('backend', 'username')},
+        ),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+
+from django.db import migrations, models
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rocketchat_tab', '0002_backends'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RocketChatDailyActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_id', models.CharField(max_length=64)),
+                ('day', models.DateField()),
+                ('messages', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Rocket chat daily activities',
+                'unique_together': {('room_id', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RocketChatParticipant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_id', models.CharField(max_length=64)),
+                ('user_id', models.CharField(max_length=64)),
+                ('username', models.CharField(max_length=150)),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'unique_together': {('room_id', 'user_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RocketChatRoomActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend', models.CharField(default='default', max_length=64)),
+                ('course_id', opaque_keys.edx.django.models.CourseKeyField(db_index=True, max_length=255)),
+                ('room_id', models.CharField(max_length=64)),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('participants', models.PositiveIntegerField(default=0)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('synced_until', models.DateTimeField(blank=True, null=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Rocket chat room activities',
+                'unique_together': {('backend', 'room_id')},
+            },
+        ),
+    ]
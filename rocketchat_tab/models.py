@@ -1,6 +1,230 @@
 # -*- coding: utf-8 -*-
 
 
+"""
+Durable records of the Rocket.Chat rooms, users and memberships created for edX courses and
+users, so they are known again after a deploy or a cache flush without asking Rocket.Chat.
+
+They are the last tier of the ID cache and the membership ledger (see RocketChatCache), filled
+by provisioning and in bulk by the rocketchat_backfill management command.
+"""
+
+from datetime import timedelta
+
 from django.db import models
+from django.utils import timezone
+from opaque_keys.edx.django.models import CourseKeyField
+
+# Membership states (same values as RocketChatCache.MEMBER and RocketChatCache.OWNER)
+MEMBERSHIP_STATES = (
+    ('member', 'Member'),
+    ('owner', 'Owner'),
+)
+
+
+def upsert(model, key_field, rows, touch=False, **scope):
+    """Inserts or updates many rows at once: one query to read them and one per kind of write
+
+    Args:
+        model (Model): RocketChatRoom, RocketChatUser or RocketChatMembership
+        key_field (string): The field the rows are found by (unique within 'scope')
+        rows (dict): The field values of each row, by key
+        touch (bool): Updates the 'modified' time of unchanged rows too (e.g. confirmed memberships)
+        scope: Fields shared by all the rows (e.g. the room_id of memberships)
+
+    Returns:
+        int: The number of rows inserted or changed
+    """
+
+    existing = {
+        getattr(row, key_field): row
+        for row in model.objects.filter(**scope).filter(**{key_field + '__in': list(rows)})
+    }
+    now = timezone.now()
+
+    changed = []
+    fields = set()
+    for key, row in existing.items():
+        updates = {field: value for field, value in rows[key].items() if getattr(row, field) != value}
+        if(updates or touch):
+            for field, value in updates.items():
+                setattr(row, field, value)
+            row.modified = now
+            changed.append(row)
+            fields.update(updates)
+
+    created = [model(**dict(scope, **{key_field: key}, **values))
+               for key, values in rows.items() if key not in existing]
+
+    if(changed):
+        model.objects.bulk_update(changed, list(fields) + ['modified'])
+
+    # A row created meanwhile by provisioning is left as is
+    model.objects.bulk_create(created, ignore_conflicts=True)
+    return len(changed) + len(created)
+
+
+class RocketChatRoom(models.Model):
+    """The Rocket.Chat room (private group) of a course on a backend (see backends)"""
+
+    # Name of the Rocket.Chat server the room is on
+    backend = models.CharField(max_length=64, default='default')
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    # Room name, see RocketChat.build_group_name
+    group_name = models.CharField(max_length=255)
+    # Rocket.Chat '_id' of the room
+    room_id = models.CharField(max_length=64, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'rocketchat_tab'
+        unique_together = (('backend', 'group_name'),)
+
+    def __str__(self):
+        return '{0} ({1} on {2})'.format(self.group_name, self.room_id, self.backend)
+
+    @classmethod
+    def get_room_id(cls, backend, group_name):
+        return cls.objects.filter(backend=backend, group_name=group_name).values_list('room_id', flat=True).first()
+
+    @classmethod
+    def set_room_id(cls, backend, group_name, room_id, course_id):
+        cls.objects.update_or_create(
+            backend=backend, group_name=group_name, defaults={'room_id': room_id, 'course_id': course_id})
+
+    @classmethod
+    def delete_room_id(cls, backend, group_name):
+        cls.objects.filter(backend=backend, group_name=group_name).delete()
+
+
+class RocketChatUser(models.Model):
+    """The Rocket.Chat user of an edX user on a backend (see backends)
+
+    The Rocket.Chat username is the edX username in lowercase (see RocketChat).
+    """
+
+    # Name of the Rocket.Chat server the user is on
+    backend = models.CharField(max_length=64, default='default')
+    username = models.CharField(max_length=150)
+    # Rocket.Chat '_id' of the user
+    user_id = models.CharField(max_length=64, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'rocketchat_tab'
+        unique_together = (('backend', 'username'),)
+
+    def __str__(self):
+        return '{0} ({1} on {2})'.format(self.username, self.user_id, self.backend)
+
+    @classmethod
+    def get_user_id(cls, backend, username):
+        return cls.objects.filter(backend=backend, username=username).values_list('user_id', flat=True).first()
+
+    @classmethod
+    def set_user_id(cls, backend, username, user_id):
+        cls.objects.update_or_create(backend=backend, username=username, defaults={'user_id': user_id})
+
+    @classmethod
+    def delete_user_id(cls, backend, username):
+        cls.objects.filter(backend=backend, username=username).delete()
+
+
+class RocketChatMembership(models.Model):
+    """A user's membership (member or owner) of a room, by their Rocket.Chat IDs
+
+    A membership is trusted for ROCKETCHAT_MEMBERSHIP_TIMEOUT seconds after it was last
+    confirmed, like the membership ledger, so a user removed from a room directly in
+    Rocket.Chat is invited again.
+    """
+
+    room_id = models.CharField(max_length=64)
+    user_id = models.CharField(max_length=64, db_index=True)
+    state = models.CharField(max_length=16, choices=MEMBERSHIP_STATES)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'rocketchat_tab'
+        unique_together = (('room_id', 'user_id'),)
+
+    def __str__(self):
+        return '{0} in {1}: {2}'.format(self.user_id, self.room_id, self.state)
+
+    @classmethod
+    def get_state(cls, room_id, user_id, timeout):
+        return cls.objects.filter(
+            room_id=room_id, user_id=user_id, modified__gte=timezone.now() - timedelta(seconds=timeout),
+        ).values_list('state', flat=True).first()
+
+    @classmethod
+    def set_state(cls, room_id, user_id, state):
+        cls.objects.update_or_create(room_id=room_id, user_id=user_id, defaults={'state': state})
+
+    @classmethod
+    def delete_state(cls, room_id, user_id):
+        cls.objects.filter(room_id=room_id, user_id=user_id).delete()
+
+
+class RocketChatRoomActivity(models.Model):
+    """How active the room of a course is: message and participant counts (see activity)
+
+    Filled incrementally by the rocketchat_activity management command. 'synced_until' is the
+    high-water mark: the messages up to that time are counted, the next sync reads the newer ones.
+    """
+
+    # Name of the Rocket.Chat server the room is on
+    backend = models.CharField(max_length=64, default='default')
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    # Rocket.Chat '_id' of the room
+    room_id = models.CharField(max_length=64)
+    # User messages (system messages, such as "user joined", are not counted)
+    messages = models.PositiveIntegerField(default=0)
+    # Users who posted at least one message
+    participants = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    synced_until = models.DateTimeField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'rocketchat_tab'
+        unique_together = (('backend', 'room_id'),)
+        verbose_name_plural = 'Rocket chat room activities'
+
+    def __str__(self):
+        return '{0}: {1} messages by {2} participants'.format(self.course_id, self.messages, self.participants)
+
+
+class RocketChatParticipant(models.Model):
+    """The messages a user posted in a room (see RocketChatRoomActivity)"""
+
+    room_id = models.CharField(max_length=64)
+    user_id = models.CharField(max_length=64)
+    # The Rocket.Chat username (the edX username in lowercase for the users of this plugin)
+    username = models.CharField(max_length=150)
+    messages = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'rocketchat_tab'
+        unique_together = (('room_id', 'user_id'),)
+
+    def __str__(self):
+        return '{0} in {1}: {2} messages'.format(self.username, self.room_id, self.messages)
+
+
+class RocketChatDailyActivity(models.Model):
+    """The messages posted in a room on a day (UTC) (see RocketChatRoomActivity)"""
+
+    room_id = models.CharField(max_length=64)
+    day = models.DateField()
+    messages = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        app_label = 'rocketchat_tab'
+        unique_together = (('room_id', 'day'),)
+        verbose_name_plural = 'Rocket chat daily activities'
 
-# Create your models here.
+    def __str__(self):
+        return '{0} on {1}: {2} messages'.format(self.room_id, self.day, self.messages)
@@ -1,15 +1,43 @@
 # -*- coding: utf-8 -*-
 
 
+from crum import get_current_request
 from django.conf import settings
+from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_noop
 
 from lms.djangoapps.courseware.tabs import EnrolledTab
 from xmodule.tabs import TabFragmentViewMixin
 
+from . import unread
+
+class UnreadTitle(object):
+    """
+    The tab title with the unread messages of the current user in the course room (see unread),
+    e.g. "Chat (3)". It is read when the course tabs are rendered, and only the cache is read: the
+    course navigation never waits for Rocket.Chat.
+
+    The tab name (tab equality, to_json, Studio) is never changed. The class attribute is the
+    plain title.
+    """
+
+    def __init__(self, title):
+        self.title = title
+
+    def __get__(self, tab, owner):
+        if(tab is None):
+            return self.title
+
+        count = tab.get_unread_count() if unread.is_enabled() else None
+        if(not count):
+            return self.title
+
+        return '{0} ({1})'.format(_(self.title), count)
+
+
 class RocketChatTab(TabFragmentViewMixin, EnrolledTab):
     type = 'rocketchat_tab'
-    title = ugettext_noop('Chat')
+    title = UnreadTitle(ugettext_noop('Chat'))
     priority = None
     view_name = 'rocketchat_view'
     is_hideable = True
@@ -19,10 +47,34 @@ class RocketChatTab(TabFragmentViewMixin, EnrolledTab):
     # True if this tab should be displayed only for instructors
     # course_staff_only = True
 
+    def __init__(self, tab_dict):
+        super().__init__(tab_dict)
+        # A tab saved without a name defaults to the plain title, never the unread messages
+        self.name = tab_dict.get('name', type(self).title)
+
     @classmethod
     def is_enabled(cls, course, user=None):
         """
         Returns true if the specified user has staff access.
         """
         return True
-       
+
+    def get_unread_count(self):
+        """Gets the unread messages of the user of the current LMS course page, if any"""
+
+        # Studio lists the tabs with their plain titles
+        if(getattr(settings, 'ROOT_URLCONF', None) != 'lms.urls'):
+            return None
+
+        request = get_current_request()
+        user = getattr(request, 'user', None)
+        if(user is None or not user.is_authenticated):
+            return None
+
+        # The course pages and the course home API of the Learning MFE
+        kwargs = getattr(getattr(request, 'resolver_match', None), 'kwargs', None) or {}
+        course_id = kwargs.get('course_id') or kwargs.get('course_key_string')
+        if(not course_id):
+            return None
+
+        return unread.get_unread_count(user.username, course_id)
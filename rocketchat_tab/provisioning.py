@@ -0,0 +1,712 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio, logging, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from . import metrics
+from .RocketChatError import RocketChatError
+from .RocketChat import RocketChat
+from .RocketChatCache import KEY_PREFIX
+
+log = logging.getLogger(__name__)
+
+# Provisioning states stored for each (course, user)
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+UNKNOWN = 'unknown'
+
+# A pending state expires so that a provisioning lost with its worker is started again
+PENDING_TIMEOUT = 60 * 2
+# A failed state is kept briefly so the next visit tries again
+FAILED_TIMEOUT = 30
+
+_executor = None
+_lookup_executor = None
+_event_loop = None
+_executor_lock = threading.Lock()
+
+
+def build_edx_info(user, course_id, course_name, is_staff, is_enrolled=True):
+    """Builds the edx_info dict used by RocketChat from a Django user
+
+    Args:
+        user (User): The edX user
+        course_id (string): The course ID
+        course_name (string): The course display name
+        is_staff (bool): Adds the user as a room owner if True
+        is_enrolled (bool): Whether the user is enrolled in the course
+
+    Returns:
+        dict: The essential user and course information (same format as RocketChatView)
+    """
+
+    profile = getattr(user, 'profile', None)
+
+    return {
+        "user": {
+            "username": user.username,
+            "email": user.email,
+            "display_name": getattr(profile, 'name', '') or user.username,
+            "is_staff": is_staff,
+            "is_enrolled": is_enrolled,
+        },
+        "course": {
+            "name": course_name,
+            "key": str(course_id),
+        }
+    }
+
+
+def provision_room(edx_info):
+    """Initializes the chat room using the edX course and user information
+        - Creates the room (if it does not exist)
+        - Creates the user (if they do not exist)
+        - Add the user to the room
+
+    Args:
+        edx_info (dict): The essential user and course information
+
+    Returns:
+        string: The URL to the RocketChat room
+    """
+
+    rocketChat = RocketChat(edx_info)
+
+    if(not metrics.enabled):
+        return provision_steps(rocketChat)
+
+    # Cold: at least one call was made to Rocket.Chat. Warm: everything came from the caches
+    started = time.monotonic()
+    try:
+        return provision_steps(rocketChat)
+    finally:
+        metrics.record_provisioning(time.monotonic() - started, rocketChat.api_call.calls > 0)
+
+
+def provision_steps(rocketChat):
+    """Runs the provisioning steps of provision_room
+
+    Args:
+        rocketChat (RocketChat): The client for the user and course
+
+    Returns:
+        string: The URL to the RocketChat room
+    """
+
+    def add_user(group_info, user_info):
+        user_id = user_info.get('user', {}).get('_id')
+        group_id = group_info.get('group', {}).get('_id')
+        return rocketChat.add_user_to_group(group_id, user_id)
+
+    try:
+        run_graph([
+            # 1) Get the room info
+            #    The room will be created if it does not exist
+            ('group_info', (), rocketChat.get_group_info),
+
+            # 2) Get the user info (runs at the same time as 1)
+            #    The user will be created if they do not exist
+            ('user_info', (), rocketChat.get_user_info),
+
+            # 3) Add the user to the group once both IDs are known
+            #   is_staff users will be added as room owers
+            ('membership', ('group_info', 'user_info'), add_user),
+        ])
+    except RocketChatError as e:
+        # A cached room or user ID may be stale (e.g. deleted in Rocket.Chat).
+        # If so, it was dropped from the cache: resolve both again and retry once
+        if(not isinstance(e.json_dict, dict) or not rocketChat.invalidate_ids(e.json_dict)):
+            raise
+
+        user_id = rocketChat.get_user_info().get('user', {}).get('_id')
+        group_id = rocketChat.get_group_info().get('group', {}).get('_id')
+        rocketChat.add_user_to_group(group_id, user_id)
+
+    return rocketChat.get_room_url()
+
+
+async def aprovision_room(edx_info):
+    """The asyncio counterpart of provision_room
+
+    The room and user lookups run at the same time on the event loop instead of a thread pool,
+    so one worker can provision many users at once (e.g. under ASGI).
+
+    Args:
+        edx_info (dict): The essential user and course information
+
+    Returns:
+        string: The URL to the RocketChat room
+    """
+
+    from .AsyncRocketChat import AsyncRocketChat
+
+    rocketChat = AsyncRocketChat(edx_info)
+    started = time.monotonic()
+
+    try:
+        return await aprovision_steps(rocketChat)
+    finally:
+        if(metrics.enabled):
+            metrics.record_provisioning(time.monotonic() - started, rocketChat.api_call.calls > 0)
+
+
+def provision_room_async(edx_info):
+    """Runs aprovision_room on the worker's event loop and waits for the room URL
+
+    Views are synchronous: a new event loop for each of them (async_to_sync) would also
+    open new connections to Rocket.Chat each time. The worker loop keeps them.
+
+    Args:
+        edx_info (dict): The essential user and course information
+
+    Returns:
+        string: The URL to the RocketChat room
+    """
+
+    return asyncio.run_coroutine_threadsafe(aprovision_room(edx_info), get_event_loop()).result()
+
+
+async def aprovision_steps(rocketChat):
+    """Runs the provisioning steps of aprovision_room
+
+    Args:
+        rocketChat (AsyncRocketChat): The client for the user and course
+
+    Returns:
+        string: The URL to the RocketChat room
+    """
+
+    # 1) and 2) Get (or create) the room and the user at the same time.
+    #   On failure, raise the room error first, like a sequential run would
+    results = await asyncio.gather(
+        rocketChat.get_group_info(), rocketChat.get_user_info(), return_exceptions=True)
+
+    for result in results:
+        if(isinstance(result, BaseException)):
+            raise result
+
+    group_info, user_info = results
+
+    # 3) Add the user to the group
+    user_id = user_info.get('user', {}).get('_id')
+    group_id = group_info.get('group', {}).get('_id')
+
+    try:
+        await rocketChat.add_user_to_group(group_id, user_id)
+    except RocketChatError as e:
+        # A cached room or user ID may be stale: resolve both again and retry once
+        if(not isinstance(e.json_dict, dict) or not await sync_to_async(rocketChat.invalidate_ids)(e.json_dict)):
+            raise
+
+        user_id = (await rocketChat.get_user_info()).get('user', {}).get('_id')
+        group_id = (await rocketChat.get_group_info()).get('group', {}).get('_id')
+        await rocketChat.add_user_to_group(group_id, user_id)
+
+    return rocketChat.get_room_url()
+
+
+def get_login_token(edx_info):
+    """Gets a login token for the user (ROCKETCHAT_AUTO_LOGIN), passed to the room by the page
+
+    Only call this once the user is provisioned. Nothing is created here.
+
+    Args:
+        edx_info (dict): The essential user and course information
+
+    Returns:
+        string: The token -OR- None if none could be obtained
+    """
+
+    rocketChat = RocketChat(edx_info, require_enrollment=False)
+
+    user_id = rocketChat.get_user_info(create=False).get('user', {}).get('_id')
+    return rocketChat.get_login_token(user_id) if user_id else None
+
+
+def run_graph(steps):
+    """Runs a small dependency graph of steps on the lookup worker pool
+
+    Each step starts as soon as all of its dependencies are done, so independent
+    steps run at the same time. Once a step fails, no new step is started.
+
+    Args:
+        steps (list): (name, dependencies, function) tuples, in the order a sequential
+            run would use. The function receives the results of its dependencies as
+            keyword arguments
+
+    Returns:
+        dict: The result of each step by name
+
+    Raises:
+        The exception of the first failed step, in the order of 'steps'
+    """
+
+    executor = get_lookup_executor()
+
+    results = {}
+    errors = {}
+    waiting = list(steps)
+    running = {}
+
+    while (waiting or running):
+
+        # Start every step whose dependencies are done (unless something failed)
+        if (not errors):
+            for step in list(waiting):
+                name, dependencies, function = step
+                if (all(dependency in results for dependency in dependencies)):
+                    kwargs = {dependency: results[dependency] for dependency in dependencies}
+                    running[executor.submit(run_step, function, kwargs)] = name
+                    waiting.remove(step)
+
+        if (not running):
+            break
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+
+    for name, dependencies, function in steps:
+        if (name in errors):
+            raise errors[name]
+
+    return results
+
+
+def run_step(function, kwargs):
+    """Runs a step of run_graph on a lookup worker thread
+
+    Steps may query the database (the stored IDs, see IdCache), so the worker releases its
+    connection afterwards like any background thread.
+    """
+
+    try:
+        return function(**kwargs)
+    finally:
+        close_old_connections()
+
+
+def make_status_key(course_id, username):
+    return '{0}:status:{1}:{2}'.format(KEY_PREFIX, course_id, str(username).lower())
+
+
+def get_status(course_id, username):
+    """Gets the provisioning status of a user in a course
+
+    Args:
+        course_id (string): The course ID
+        username (string): The edX username
+
+    Returns:
+        dict: {'state': PENDING|READY|FAILED|UNKNOWN, 'room_url': ..., 'error': ...}
+    """
+
+    status = cache.get(make_status_key(course_id, username))
+    if(status is None):
+        return {"state": UNKNOWN, "room_url": "", "error": ""}
+
+    return status
+
+
+def set_status(course_id, username, state, room_url="", error=""):
+    timeout = {
+        PENDING: PENDING_TIMEOUT,
+        FAILED: FAILED_TIMEOUT,
+    }.get(state, getattr(settings, 'ROCKETCHAT_STATUS_TIMEOUT', 60 * 60 * 24 * 7))
+
+    status = {"state": state, "room_url": room_url, "error": error}
+    cache.set(make_status_key(course_id, username), status, timeout)
+
+    # A room that was just provisioned is fresh (see revalidate_in_background)
+    freshness = get_freshness()
+    if(state == READY and freshness):
+        cache.set(make_fresh_key(course_id, username), True, freshness)
+
+    return status
+
+
+def make_fresh_key(course_id, username):
+    return '{0}:fresh:{1}:{2}'.format(KEY_PREFIX, course_id, str(username).lower())
+
+
+def get_freshness():
+    """Gets the seconds a ready status is served before it is revalidated (ROCKETCHAT_STATUS_FRESHNESS)
+
+    Returns:
+        int: The freshness budget -OR- None if ready statuses are not served stale (provision every view)
+    """
+
+    return getattr(settings, 'ROCKETCHAT_STATUS_FRESHNESS', None)
+
+
+def revalidate_in_background(course_id, username, get_edx_info):
+    """Schedules a revalidation of a ready status whose freshness budget is spent
+
+    The ready status is the last known good room URL: it is served right away while the
+    provisioning runs again on the worker pool (stale-while-revalidate). Only one request per
+    freshness budget schedules it. A revalidation that fails keeps the status as it is, and
+    is tried again after FAILED_TIMEOUT seconds.
+
+    Args:
+        course_id (string): The course ID
+        username (string): The edX username
+        get_edx_info (callable): Returns the edx_info of the user (see build_edx_info), or
+            None if the user should not be provisioned. Only called on the worker pool
+
+    Returns:
+        bool: True if a revalidation was scheduled
+    """
+
+    freshness = get_freshness()
+
+    # cache.add is atomic: only one request (in any process) claims the next budget
+    if(not freshness or not cache.add(make_fresh_key(course_id, username), True, freshness)):
+        return False
+
+    get_executor().submit(run_revalidation, course_id, username, get_edx_info)
+    return True
+
+
+def run_revalidation(course_id, username, get_edx_info):
+    """Provisions the room again and renews the ready status (see revalidate_in_background)"""
+
+    close_old_connections()
+
+    try:
+        edx_info = get_edx_info()
+        if(edx_info is None):
+            return
+
+        room_url = provision_room(edx_info)
+        set_status(course_id, username, READY, room_url=room_url)
+
+    except Exception as e:
+        # The last known good room URL is still served meanwhile
+        cache.set(make_fresh_key(course_id, username), True, FAILED_TIMEOUT)
+        log.warning("Rocket.Chat revalidation failed for %s in %s: %s", username, course_id, e)
+
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    """Gets the worker pool used for background provisioning
+
+    Returns:
+        ThreadPoolExecutor: The process-wide pool
+    """
+
+    global _executor
+
+    if(_executor is None):
+        with _executor_lock:
+            if(_executor is None):
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ROCKETCHAT_PROVISIONING_WORKERS', 4),
+                    thread_name_prefix='rocketchat-provisioning')
+
+    return _executor
+
+
+def get_lookup_executor():
+    """Gets the bounded worker pool that runs the steps of provision_room
+
+    It is separate from the background provisioning pool, so a background job waiting
+    on its own steps can never starve the pool it runs on.
+
+    Returns:
+        ThreadPoolExecutor: The process-wide pool
+    """
+
+    global _lookup_executor
+
+    if(_lookup_executor is None):
+        with _executor_lock:
+            if(_lookup_executor is None):
+                _lookup_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ROCKETCHAT_LOOKUP_WORKERS', 8),
+                    thread_name_prefix='rocketchat-lookup')
+
+    return _lookup_executor
+
+
+def get_event_loop():
+    """Gets the event loop that runs the asyncio client (see provision_room_async)
+
+    Returns:
+        AbstractEventLoop: The process-wide loop, run forever by a daemon thread
+    """
+
+    global _event_loop
+
+    if(_event_loop is None):
+        with _executor_lock:
+            if(_event_loop is None):
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='rocketchat-asyncio', daemon=True).start()
+                _event_loop = loop
+
+    return _event_loop
+
+
+def provision_in_background(edx_info):
+    """Starts provisioning on the worker pool unless it is done or already running
+
+    A failed provisioning is started again right away.
+
+    Args:
+        edx_info (dict): The essential user and course information
+
+    Returns:
+        dict: The provisioning status (see get_status)
+    """
+
+    course_id = edx_info['course']['key']
+    username = edx_info['user']['username']
+
+    status = get_status(course_id, username)
+    if(status['state'] in (READY, PENDING)):
+        return status
+
+    if(status['state'] == FAILED):
+        # The failed state shares the key claimed below: it must not block this retry
+        cache.delete(make_status_key(course_id, username))
+
+    # cache.add is atomic: only one request (in any process) schedules the job
+    pending = {"state": PENDING, "room_url": "", "error": ""}
+    if(not cache.add(make_status_key(course_id, username), pending, PENDING_TIMEOUT)):
+        return get_status(course_id, username)
+
+    get_executor().submit(run_provisioning, edx_info)
+    return pending
+
+
+def run_provisioning(edx_info):
+    """Provisions the room and records the result as the provisioning status
+
+    Args:
+        edx_info (dict): The essential user and course information
+    """
+
+    course_id = edx_info['course']['key']
+    username = edx_info['user']['username']
+
+    # Background threads must not reuse (possibly closed) database connections
+    close_old_connections()
+
+    try:
+        room_url = provision_room(edx_info)
+        set_status(course_id, username, READY, room_url=room_url)
+
+    except RocketChatError as e:
+        set_failed_status(course_id, username, str(e))
+
+    except Exception as e:
+        log.exception("Rocket.Chat provisioning failed for %s in %s", username, course_id)
+        set_failed_status(course_id, username, str(RocketChatError(str(e))))
+
+    finally:
+        close_old_connections()
+
+
+def set_failed_status(course_id, username, error):
+    """Records a failed provisioning, unless the user already has a room (the last known good room is kept)"""
+
+    if(get_status(course_id, username)['state'] != READY):
+        set_status(course_id, username, FAILED, error=error)
+
+
+def make_prewarm_key(course_id):
+    return '{0}:prewarm:{1}'.format(KEY_PREFIX, course_id)
+
+
+def schedule_course_prewarm(course_id):
+    """Queues a background job that creates the course room and makes the course team its owners
+
+    Courses are published often: while a job is queued, further requests for the same
+    course are dropped (the job reads the course team when it runs).
+
+    Args:
+        course_id (CourseKey or string): The course ID
+    """
+
+    if(not cache.add(make_prewarm_key(course_id), True, PENDING_TIMEOUT)):
+        return
+
+    get_executor().submit(prewarm_course, str(course_id))
+
+
+def prewarm_course(course_id):
+    """Creates the room of a course that shows the Chat tab and provisions its course team as owners
+
+    The room ID is recorded (see IdCache) and each owner gets a READY status, so no Chat tab
+    view has to create the room. Already known rooms and owners cost no call to Rocket.Chat.
+
+    Args:
+        course_id (string): The course ID
+
+    Returns:
+        int: The number of owners provisioned -OR- None if the course does not show the Chat tab
+    """
+
+    from django.contrib.auth import get_user_model
+    from opaque_keys.edx.keys import CourseKey
+    from . import courses
+
+    # Release the job first: a publish from now on queues a new job
+    cache.delete(make_prewarm_key(course_id))
+
+    close_old_connections()
+
+    try:
+        course_key = CourseKey.from_string(course_id)
+
+        # The advanced modules may just have changed
+        courses.forget_chat_enabled(course_key)
+        if(not courses.is_chat_enabled(course_key)):
+            return None
+
+        course_name = courses.get_course_name(course_key)
+
+        # The room first, so the owners find it in the ID cache
+        course_info = {
+            "user": {"username": "", "email": "", "display_name": "", "is_staff": False, "is_enrolled": False},
+            "course": {"name": course_name, "key": course_id},
+        }
+        RocketChat(course_info, require_enrollment=False).get_group_info()
+
+        team = get_user_model().objects.select_related('profile').filter(
+            id__in=courses.get_course_staff_ids(course_key))
+
+        owners = 0
+        for user in team:
+            run_provisioning(build_edx_info(user, course_key, course_name, is_staff=True))
+            if(get_status(course_id, user.username)['state'] == READY):
+                owners += 1
+
+        log.info("Rocket.Chat room of %s is ready with %s of %s owners", course_id, owners, len(team))
+        return owners
+
+    except RocketChatError as e:
+        log.warning("Rocket.Chat room creation failed for %s: %s", course_id, e)
+
+    except Exception:
+        log.exception("Rocket.Chat room creation failed for %s", course_id)
+
+    finally:
+        close_old_connections()
+
+
+def make_job_key(course_id, user_id):
+    return '{0}:job:{1}:{2}'.format(KEY_PREFIX, course_id, user_id)
+
+
+def schedule_membership_sync(user_id, course_id, demote=False):
+    """Queues a background job that brings a user's room membership in line with the LMS
+
+    Jobs are deduplicated per (course, user): while a job is queued, further requests for
+    the same user are dropped. The job reads the enrollment and roles when it runs, so the
+    dropped requests are still applied. Role removals (demote) are rare and always queued.
+
+    Args:
+        user_id (int): The edX user ID
+        course_id (CourseKey or string): The course ID
+        demote (bool): Removes the owner role if the user is no longer course staff
+    """
+
+    if(not demote and not cache.add(make_job_key(course_id, user_id), True, PENDING_TIMEOUT)):
+        return
+
+    get_executor().submit(sync_membership, user_id, str(course_id), demote)
+
+
+def sync_membership(user_id, course_id, demote=False):
+    """Provisions an enrolled user, or removes an unenrolled user from the room
+
+    Course staff belong in the room even if not enrolled, as for prewarm_course and the
+    roster reconciliation (see reconciliation.iter_roster).
+
+    Args:
+        user_id (int): The edX user ID
+        course_id (string): The course ID
+        demote (bool): Removes the owner role if the user is no longer course staff
+    """
+
+    from django.contrib.auth import get_user_model
+    from opaque_keys.edx.keys import CourseKey
+    from common.djangoapps.student.models import CourseEnrollment
+    from . import courses
+
+    # Release the job first: a change made from now on queues a new job
+    if(not demote):
+        cache.delete(make_job_key(course_id, user_id))
+
+    close_old_connections()
+
+    try:
+        course_key = CourseKey.from_string(course_id)
+        if(not courses.is_chat_enabled(course_key)):
+            return
+
+        user = get_user_model().objects.select_related('profile').get(id=user_id)
+        is_enrolled = CourseEnrollment.is_enrolled(user, course_key)
+
+        # The same check as the Chat tab. A role change may have been cached before it was
+        #   committed, so it is read again
+        courses.forget_course_staff(user.id, course_key)
+        is_staff = courses.is_course_staff(user, course_key)
+
+        edx_info = build_edx_info(
+            user, course_key, courses.get_course_name(course_key), is_staff, is_enrolled or is_staff)
+
+        if(is_enrolled or is_staff):
+            # Records the READY status, so the Chat tab only has to render the iframe
+            run_provisioning(edx_info)
+
+            if(demote and not is_staff):
+                rocketChat = RocketChat(edx_info)
+                room_id = rocketChat.get_group_info().get('group', {}).get('_id')
+                chat_user_id = rocketChat.get_user_info().get('user', {}).get('_id')
+                rocketChat.remove_owner_from_group(room_id, chat_user_id)
+        else:
+            remove_from_room(edx_info)
+
+    except RocketChatError as e:
+        log.warning("Rocket.Chat membership sync failed for user %s in %s: %s", user_id, course_id, e)
+
+    except Exception:
+        log.exception("Rocket.Chat membership sync failed for user %s in %s", user_id, course_id)
+
+    finally:
+        close_old_connections()
+
+
+def remove_from_room(edx_info):
+    """Removes a user from the course room. Nothing is created if the room or user is missing
+
+    Args:
+        edx_info (dict): The essential user and course information
+    """
+
+    rocketChat = RocketChat(edx_info, require_enrollment=False)
+    cache.delete(make_status_key(edx_info['course']['key'], edx_info['user']['username']))
+
+    group_info = rocketChat.get_group_info(create=False)
+    user_info = rocketChat.get_user_info(create=False)
+
+    room_id = group_info.get('group', {}).get('_id')
+    user_id = user_info.get('user', {}).get('_id')
+
+    if(room_id and user_id):
+        rocketChat.remove_user_from_group(room_id, user_id)
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Brings the members and owners of a course room in line with the course roster.
+
+The roster (active enrollments and course team) and the room members (paginated
+groups.members) are read as two streams sorted by username and merged in a single pass.
+Only the differences cost calls to Rocket.Chat:
+    - enrolled users missing from the room are invited (their user is created if needed)
+    - course staff who are not room owners are promoted
+    - room owners who left the course team are demoted
+    - LMS users who are no longer enrolled are removed from the room
+Members that are already right are recorded in the ID cache and the membership ledger, so
+their next Chat tab view makes no call at all.
+
+Room members that are not LMS users (e.g. the admin user, Rocket.Chat moderators) are
+never changed.
+"""
+
+import collections, logging
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Func, Q
+
+from .RocketChat import RocketChat
+from .RocketChatCache import MEMBER, OWNER
+from .RocketChatError import RocketChatError
+from . import courses, provisioning
+
+log = logging.getLogger(__name__)
+
+# Changes applied to room members
+INVITE = 'invite'
+PROMOTE = 'promote'
+DEMOTE = 'demote'
+REMOVE = 'remove'
+
+# A user of the course roster
+RosterEntry = collections.namedtuple('RosterEntry', 'username user_id is_staff')
+
+
+class CodePointOrder(Func):
+    """Sorts by lowercase username in code point order, as Rocket.Chat (MongoDB) sorts the members
+
+    The default MySQL collation ignores case but also sorts '_' after the letters, so the
+    lowercase usernames are compared as bytes.
+    """
+
+    function = 'LOWER'
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(LOWER(%(expressions)s) AS BINARY)',
+                           **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='LOWER(%(expressions)s) COLLATE "C"',
+                           **extra_context)
+
+
+def iter_roster(course_key):
+    """Gets the users who belong in the course room, sorted by (lowercase) username
+
+    The active enrollments and the course team, streamed from the database in username order.
+
+    Args:
+        course_key (CourseKey): The course ID
+
+    Returns:
+        generator: RosterEntry of each user, in username order
+
+    Raises:
+        RocketChatError: If the database did not sort the usernames as Rocket.Chat does
+    """
+
+    from common.djangoapps.student.models import CourseEnrollment
+
+    staff_ids = courses.get_course_staff_ids(course_key)
+    # The same staff check as the Chat tab, so the view and the reconciliation agree on the owners
+    owner_ids = courses.get_course_owner_ids(course_key)
+
+    enrolled = CourseEnrollment.objects.filter(course_id=course_key, is_active=True).values('user_id')
+
+    # The course team belongs in the room even if not enrolled
+    rows = (
+        get_user_model().objects
+        .filter(Q(id__in=enrolled) | Q(id__in=staff_ids))
+        .order_by(CodePointOrder('username'), 'id')
+        .values_list('id', 'username', 'is_staff')
+        .iterator()
+    )
+
+    previous = None
+
+    for user_id, username, is_staff in rows:
+        username = username.lower()
+
+        # Only the order of the usernames matters to the merge: never remove members on a wrong order
+        if(previous is not None and username < previous):
+            error = "{{'SortError': 'The roster returned {0} after {1}'}}".format(username, previous)
+            raise RocketChatError(error, "The course roster is not sorted by username.")
+
+        previous = username
+        yield RosterEntry(username, user_id, is_staff or user_id in owner_ids)
+
+
+def check_sorted(members):
+    """Passes the room members through, making sure they come in username order
+
+    Usernames with capital letters were not created by this plugin. They are skipped, so
+    the order of the remaining (lowercase) usernames is the same as in the roster.
+
+    Raises:
+        RocketChatError: If Rocket.Chat did not sort the members
+    """
+
+    previous = None
+
+    for username, user_id in members:
+        if(not username or username != username.lower()):
+            continue
+
+        if(previous is not None and username < previous):
+            error = "{{'SortError': 'groups.members returned {0} after {1}'}}".format(username, previous)
+            raise RocketChatError(error, "The room members are not sorted by username.")
+
+        previous = username
+        yield username, user_id
+
+
+def merge(roster, members):
+    """Merges the roster and the room members, both sorted by username, in one pass
+
+    Args:
+        roster (iterable): RosterEntry of each user
+        members (iterable): (username, user_id) of each room member
+
+    Returns:
+        generator: (username, RosterEntry or None, member user ID or None) for each user
+            in the roster, the room, or both
+    """
+
+    roster = iter(roster)
+    members = iter(check_sorted(members))
+
+    entry = next(roster, None)
+    member = next(members, None)
+
+    while (entry is not None or member is not None):
+        if(member is None or (entry is not None and entry.username < member[0])):
+            yield entry.username, entry, None
+            entry = next(roster, None)
+
+        elif(entry is None or member[0] < entry.username):
+            yield member[0], None, member[1]
+            member = next(members, None)
+
+        else:
+            yield entry.username, entry, member[1]
+            entry = next(roster, None)
+            member = next(members, None)
+
+
+class Reconciler(object):
+    """Reconciles one course room with its roster (see the module documentation).
+
+    Changes are applied in batches of 'batch_size', running on 'executor', while the merge goes on.
+
+    Attributes:
+        report -- counts of the users seen, the changes made and the calls made to Rocket.Chat
+    """
+
+    def __init__(self, course_key, executor, batch_size=200, page_size=500, dry_run=False):
+        self.course_key = course_key
+        self.course_id = str(course_key)
+        self.executor = executor
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.dry_run = dry_run
+
+        self.course_name = courses.get_course_name(course_key)
+        self.report = collections.Counter()
+        self.pending = []
+        # Members invited (or, if negative, removed) among the member pages already read
+        self.shift = 0
+
+    def make_edx_info(self, username, is_staff=False, is_enrolled=True):
+        """Builds the edx_info of a user who already exists in Rocket.Chat (nothing is created)"""
+
+        return {
+            "user": {
+                "username": username,
+                "email": "",
+                "display_name": username,
+                "is_staff": is_staff,
+                "is_enrolled": is_enrolled,
+            },
+            "course": {
+                "name": self.course_name,
+                "key": self.course_id,
+            }
+        }
+
+    def run(self):
+        """Reconciles the room
+
+        Returns:
+            collections.Counter: The report
+        """
+
+        rocketChat = RocketChat(self.make_edx_info('', is_enrolled=False), require_enrollment=False)
+        self.admin_user_id = rocketChat.backend.admin_user_id
+        self.room_id = rocketChat.get_group_info().get('group', {}).get('_id')
+        owners = rocketChat.get_group_owners(self.room_id)
+
+        members = rocketChat.get_group_members(self.room_id, self.page_size, shift=lambda: self.shift)
+
+        for username, entry, user_id in merge(iter_roster(self.course_key), members):
+
+            if(entry is not None):
+                self.report['roster'] += 1
+                # Per-user provisioning: users.info and groups.invite (and groups.addOwner for staff)
+                self.report['baseline_calls'] += 3 if entry.is_staff else 2
+
+            if(user_id is not None):
+                self.report['members'] += 1
+
+            if(user_id == self.admin_user_id):
+                continue
+
+            if(user_id is None):
+                self.add(INVITE, username, entry, None)
+
+            elif(entry is None):
+                # Only LMS users are removed (checked in bulk when the batch is applied)
+                self.add(REMOVE, username, None, user_id)
+
+            elif(entry.is_staff and user_id not in owners):
+                self.add(PROMOTE, username, entry, user_id)
+
+            elif(not entry.is_staff and user_id in owners):
+                self.add(DEMOTE, username, entry, user_id)
+
+            else:
+                self.report['unchanged'] += 1
+                if(not self.dry_run):
+                    rocketChat.id_cache.set_user_id(rocketChat.backend.name, username, user_id)
+                    rocketChat.membership.set_state(self.room_id, user_id, OWNER if user_id in owners else MEMBER)
+
+        self.apply_pending()
+
+        # groups.info (or the cache), groups.roles and the groups.members pages
+        self.report['calls'] += rocketChat.api_call.calls
+        self.report['baseline_calls'] += 1
+        return self.report
+
+    def add(self, operation, username, entry, user_id):
+        self.pending.append((operation, username, entry, user_id))
+
+        if(len(self.pending) >= self.batch_size):
+            self.apply_pending()
+
+    def apply_pending(self):
+        """Applies the changes found by the merge so far
+
+        They only concern usernames up to the member page being merged, so the invited and
+        removed members are counted in self.shift: the next groups.members page starts that
+        many members later (or earlier).
+        """
+
+        batch, self.pending = self.pending, []
+
+        if(batch):
+            self.apply_batch(batch)
+
+    def apply_batch(self, batch):
+        """Applies a batch of changes"""
+
+        # Room members who are not LMS users are left alone
+        removals = [username for operation, username, entry, user_id in batch if operation == REMOVE]
+        if(removals):
+            # Case-insensitive under the default MySQL collation, and the index is used
+            known = set(
+                username.lower() for username in
+                get_user_model().objects.filter(username__in=removals).values_list('username', flat=True)
+            )
+            self.report['unmanaged'] += len([username for username in removals if username not in known])
+            batch = [change for change in batch if change[0] != REMOVE or change[1] in known]
+
+        # Invited users may have to be created: they need their full profile
+        invites = [entry.user_id for operation, username, entry, user_id in batch if operation == INVITE]
+        users = get_user_model().objects.select_related('profile').in_bulk(invites) if invites else {}
+
+        for operation, username, entry, user_id in batch:
+            self.report[operation] += 1
+
+            # Per-user removal: groups.info, users.info and groups.kick. Demotion: groups.removeOwner
+            self.report['baseline_calls'] += {REMOVE: 3, DEMOTE: 1}.get(operation, 0)
+
+        if(self.dry_run):
+            return
+
+        changes = [(operation, username, entry, user_id, users.get(entry.user_id) if entry else None)
+                   for operation, username, entry, user_id in batch]
+
+        # Users deleted since the roster was read cannot be invited
+        invitable = [change for change in changes if change[0] != INVITE or change[4] is not None]
+        self.report['failed'] += len(changes) - len(invitable)
+        changes = invitable
+
+        for change, (calls, ok) in zip(changes, self.executor.map(self.apply, changes)):
+            self.report['calls'] += calls
+            if(not ok):
+                self.report['failed'] += 1
+            elif(change[0] in (INVITE, REMOVE)):
+                self.shift += 1 if change[0] == INVITE else -1
+
+    def apply(self, change):
+        """Applies one change
+
+        Returns:
+            tuple: (calls made to Rocket.Chat, True on success)
+        """
+
+        operation, username, entry, user_id, user = change
+        rocketChat = None
+
+        try:
+            if(operation == INVITE):
+                rocketChat = RocketChat(provisioning.build_edx_info(
+                    user, self.course_key, self.course_name, entry.is_staff))
+                user_id = rocketChat.get_user_info().get('user', {}).get('_id')
+
+                # The ledger may wrongly record the membership: that is why the user is missing
+                rocketChat.membership.delete_state(self.room_id, user_id)
+                rocketChat.add_user_to_group(self.room_id, user_id)
+
+            elif(operation == PROMOTE):
+                rocketChat = RocketChat(self.make_edx_info(username, is_staff=True))
+                rocketChat.id_cache.set_user_id(rocketChat.backend.name, username, user_id)
+                rocketChat.membership.set_state(self.room_id, user_id, MEMBER)
+                rocketChat.add_user_to_group(self.room_id, user_id)
+
+            elif(operation == DEMOTE):
+                rocketChat = RocketChat(self.make_edx_info(username))
+                rocketChat.remove_owner_from_group(self.room_id, user_id)
+
+            elif(operation == REMOVE):
+                rocketChat = RocketChat(self.make_edx_info(username, is_enrolled=False), require_enrollment=False)
+                rocketChat.remove_user_from_group(self.room_id, user_id)
+                cache.delete(provisioning.make_status_key(self.course_id, username))
+
+            return rocketChat.api_call.calls, True
+
+        except RocketChatError:
+            return (rocketChat.api_call.calls if rocketChat else 0), False
+
+        except Exception:
+            # One broken change must not stop the reconciliation of the room
+            log.exception("Could not %s %s in %s", operation, username, self.course_id)
+            return (rocketChat.api_call.calls if rocketChat else 0), False
+
+        finally:
+            close_old_connections()
@@ -12,3 +12,85 @@ def plugin_settings(settings):
     settings.ROCKETCHAT_BASE_URL = 'https://your-rocketchat-instance/'
     settings.ROCKETCHAT_ADMIN_TOKEN = "your-admin-token"
     settings.ROCKETCHAT_ADMIN_USER_ID = "your-user-id"
+
+    # Size of the keep-alive connection pool used by each worker process
+    settings.ROCKETCHAT_HTTP_POOL_SIZE = 10
+    # Open the first connection to Rocket.Chat when the app is loaded
+    settings.ROCKETCHAT_HTTP_WARM_UP = False
+    # Room and user IDs kept in each worker's in-process cache
+    settings.ROCKETCHAT_ID_CACHE_SIZE = 2048
+    # Seconds a room or user ID is kept in the Django cache
+    settings.ROCKETCHAT_ID_CACHE_TIMEOUT = 60 * 60 * 24
+    # Seconds a room or user ID is kept in the in-process cache
+    settings.ROCKETCHAT_ID_CACHE_LOCAL_TIMEOUT = 60 * 5
+    # Seconds a room membership is trusted before the user is invited again. A learner removed in Rocket.Chat is only invited again after it (or by rocketchat_reconcile)
+    settings.ROCKETCHAT_MEMBERSHIP_TIMEOUT = 60 * 60
+    # Render the Chat tab right away and provision the room in the background
+    settings.ROCKETCHAT_ASYNC_PROVISIONING = False
+    # Threads in each worker process that run background provisioning
+    settings.ROCKETCHAT_PROVISIONING_WORKERS = 4
+    # Seconds a successful provisioning status (the last known good room URL) is kept
+    settings.ROCKETCHAT_STATUS_TIMEOUT = 60 * 60 * 24 * 7
+    # Threads in each worker process that run the room and user lookups concurrently
+    settings.ROCKETCHAT_LOOKUP_WORKERS = 8
+    # Provision users in the background when they enroll, unenroll or change course roles
+    settings.ROCKETCHAT_PROVISION_ON_ENROLLMENT = False
+    # Seconds to wait for a connection to Rocket.Chat
+    settings.ROCKETCHAT_CONNECT_TIMEOUT = 3.05
+    # Seconds to wait for a response from Rocket.Chat
+    settings.ROCKETCHAT_READ_TIMEOUT = 10
+    # Times a failed lookup (GET) is retried. Other calls are never retried
+    settings.ROCKETCHAT_GET_RETRIES = 2
+    # Base delay in seconds between retries (doubled on each retry, with jitter)
+    settings.ROCKETCHAT_RETRY_BACKOFF = 0.2
+    # Failures within ROCKETCHAT_CIRCUIT_WINDOW seconds that stop all calls to Rocket.Chat
+    settings.ROCKETCHAT_CIRCUIT_FAILURES = 5
+    settings.ROCKETCHAT_CIRCUIT_WINDOW = 30
+    # Seconds calls fail right away before Rocket.Chat is tried again
+    settings.ROCKETCHAT_CIRCUIT_RESET_TIMEOUT = 30
+    # Calls to Rocket.Chat each worker process makes at the same time
+    settings.ROCKETCHAT_MAX_IN_FLIGHT = 10
+    # Seconds a call waits for a free slot or for the rate limit to reset before failing
+    settings.ROCKETCHAT_QUEUE_TIMEOUT = 5
+    # Seconds one request may hold the lock to create a room or user
+    settings.ROCKETCHAT_SINGLE_FLIGHT_LEASE = 15
+    # Seconds other requests wait for that room or user before creating it themselves
+    settings.ROCKETCHAT_SINGLE_FLIGHT_WAIT = 5
+    # Provision rooms with the asyncio client (requires httpx)
+    settings.ROCKETCHAT_ASYNC_CLIENT = False
+    # Where metrics go: None (disabled), 'prometheus', 'statsd' or the dotted path of a sink class
+    settings.ROCKETCHAT_METRICS = None
+    # Bearer token the Prometheus scraper sends. Without it, only global staff can read /rocketchat/metrics
+    settings.ROCKETCHAT_METRICS_TOKEN = None
+    # statsd server used with ROCKETCHAT_METRICS = 'statsd'
+    settings.ROCKETCHAT_STATSD_HOST = 'localhost'
+    settings.ROCKETCHAT_STATSD_PORT = 8125
+    # Log users in to the room with a login token instead of the OAuth/SAML login (requires CREATE_TOKENS_FOR_USERS=true on Rocket.Chat)
+    settings.ROCKETCHAT_AUTO_LOGIN = False
+    # Seconds a login token is reused before it is replaced and revoked. Keep it below Rocket.Chat's 'Login Expiration in Days'.
+    # The tokens are stored in plaintext in the Django cache: restrict access to the cache server
+    settings.ROCKETCHAT_LOGIN_TOKEN_TIMEOUT = 60 * 60 * 24
+    # Load the full course from the modulestore in the Chat tab instead of the cached course overview
+    settings.ROCKETCHAT_LOAD_COURSE = False
+    # Seconds a user's staff access to a course is cached (dropped when a course role changes)
+    settings.ROCKETCHAT_ROLE_CACHE_TIMEOUT = 60 * 5
+    # Seconds clients may reuse a ready room URL from the JSON API before revalidating it
+    settings.ROCKETCHAT_API_MAX_AGE = 60 * 5
+    # Keep room and user IDs and memberships in the database so they survive deploys and cache flushes (run the migrations)
+    settings.ROCKETCHAT_ID_STORE = True
+    # Several Rocket.Chat servers, e.g. {'chat1': {'BASE_URL': ..., 'ADMIN_TOKEN': ..., 'ADMIN_USER_ID': ..., 'WEIGHT': 1}}. None uses ROCKETCHAT_BASE_URL
+    settings.ROCKETCHAT_BACKENDS = None
+    # Course IDs pinned to a backend of ROCKETCHAT_BACKENDS
+    settings.ROCKETCHAT_BACKEND_OVERRIDES = {}
+    # Transport of the admin calls: 'rest', or 'realtime' for one multiplexed DDP/WebSocket connection per worker
+    settings.ROCKETCHAT_TRANSPORT = 'rest'
+    # Seconds the last known good room URL is served before it is revalidated in the background, e.g. 300. None provisions on every view
+    settings.ROCKETCHAT_STATUS_FRESHNESS = None
+    # Create the course room and make the course team its owners when a course is published or created in Studio
+    settings.ROCKETCHAT_PREWARM_ON_PUBLISH = False
+    # Show the unread messages of the course room on the Chat tab (requires CREATE_TOKENS_FOR_USERS=true on Rocket.Chat)
+    settings.ROCKETCHAT_UNREAD_BADGE = False
+    # Seconds a user's unread messages are shown before they are synced again in the background
+    settings.ROCKETCHAT_UNREAD_FRESHNESS = 60
+    # Users synced together by the background unread message sync
+    settings.ROCKETCHAT_UNREAD_BATCH_SIZE = 50
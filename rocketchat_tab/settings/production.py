@@ -18,3 +18,167 @@ def plugin_settings(settings):
         'ROCKETCHAT_ADMIN_USER_ID',
         settings.ROCKETCHAT_ADMIN_USER_ID
     )
+    settings.ROCKETCHAT_HTTP_POOL_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_HTTP_POOL_SIZE',
+        settings.ROCKETCHAT_HTTP_POOL_SIZE
+    )
+    settings.ROCKETCHAT_HTTP_WARM_UP = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_HTTP_WARM_UP',
+        settings.ROCKETCHAT_HTTP_WARM_UP
+    )
+    settings.ROCKETCHAT_ID_CACHE_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_ID_CACHE_SIZE',
+        settings.ROCKETCHAT_ID_CACHE_SIZE
+    )
+    settings.ROCKETCHAT_ID_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_ID_CACHE_TIMEOUT',
+        settings.ROCKETCHAT_ID_CACHE_TIMEOUT
+    )
+    settings.ROCKETCHAT_ID_CACHE_LOCAL_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_ID_CACHE_LOCAL_TIMEOUT',
+        settings.ROCKETCHAT_ID_CACHE_LOCAL_TIMEOUT
+    )
+    settings.ROCKETCHAT_MEMBERSHIP_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_MEMBERSHIP_TIMEOUT',
+        settings.ROCKETCHAT_MEMBERSHIP_TIMEOUT
+    )
+    settings.ROCKETCHAT_ASYNC_PROVISIONING = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_ASYNC_PROVISIONING',
+        settings.ROCKETCHAT_ASYNC_PROVISIONING
+    )
+    settings.ROCKETCHAT_PROVISIONING_WORKERS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_PROVISIONING_WORKERS',
+        settings.ROCKETCHAT_PROVISIONING_WORKERS
+    )
+    settings.ROCKETCHAT_STATUS_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_STATUS_TIMEOUT',
+        settings.ROCKETCHAT_STATUS_TIMEOUT
+    )
+    settings.ROCKETCHAT_LOOKUP_WORKERS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_LOOKUP_WORKERS',
+        settings.ROCKETCHAT_LOOKUP_WORKERS
+    )
+    settings.ROCKETCHAT_PROVISION_ON_ENROLLMENT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_PROVISION_ON_ENROLLMENT',
+        settings.ROCKETCHAT_PROVISION_ON_ENROLLMENT
+    )
+    settings.ROCKETCHAT_CONNECT_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_CONNECT_TIMEOUT',
+        settings.ROCKETCHAT_CONNECT_TIMEOUT
+    )
+    settings.ROCKETCHAT_READ_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_READ_TIMEOUT',
+        settings.ROCKETCHAT_READ_TIMEOUT
+    )
+    settings.ROCKETCHAT_GET_RETRIES = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_GET_RETRIES',
+        settings.ROCKETCHAT_GET_RETRIES
+    )
+    settings.ROCKETCHAT_RETRY_BACKOFF = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_RETRY_BACKOFF',
+        settings.ROCKETCHAT_RETRY_BACKOFF
+    )
+    settings.ROCKETCHAT_CIRCUIT_FAILURES = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_CIRCUIT_FAILURES',
+        settings.ROCKETCHAT_CIRCUIT_FAILURES
+    )
+    settings.ROCKETCHAT_CIRCUIT_WINDOW = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_CIRCUIT_WINDOW',
+        settings.ROCKETCHAT_CIRCUIT_WINDOW
+    )
+    settings.ROCKETCHAT_CIRCUIT_RESET_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_CIRCUIT_RESET_TIMEOUT',
+        settings.ROCKETCHAT_CIRCUIT_RESET_TIMEOUT
+    )
+    settings.ROCKETCHAT_MAX_IN_FLIGHT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_MAX_IN_FLIGHT',
+        settings.ROCKETCHAT_MAX_IN_FLIGHT
+    )
+    settings.ROCKETCHAT_QUEUE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_QUEUE_TIMEOUT',
+        settings.ROCKETCHAT_QUEUE_TIMEOUT
+    )
+    settings.ROCKETCHAT_SINGLE_FLIGHT_LEASE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_SINGLE_FLIGHT_LEASE',
+        settings.ROCKETCHAT_SINGLE_FLIGHT_LEASE
+    )
+    settings.ROCKETCHAT_SINGLE_FLIGHT_WAIT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_SINGLE_FLIGHT_WAIT',
+        settings.ROCKETCHAT_SINGLE_FLIGHT_WAIT
+    )
+    settings.ROCKETCHAT_ASYNC_CLIENT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_ASYNC_CLIENT',
+        settings.ROCKETCHAT_ASYNC_CLIENT
+    )
+    settings.ROCKETCHAT_METRICS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_METRICS',
+        settings.ROCKETCHAT_METRICS
+    )
+    settings.ROCKETCHAT_METRICS_TOKEN = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_METRICS_TOKEN',
+        settings.ROCKETCHAT_METRICS_TOKEN
+    )
+    settings.ROCKETCHAT_STATSD_HOST = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_STATSD_HOST',
+        settings.ROCKETCHAT_STATSD_HOST
+    )
+    settings.ROCKETCHAT_STATSD_PORT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_STATSD_PORT',
+        settings.ROCKETCHAT_STATSD_PORT
+    )
+    settings.ROCKETCHAT_AUTO_LOGIN = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_AUTO_LOGIN',
+        settings.ROCKETCHAT_AUTO_LOGIN
+    )
+    settings.ROCKETCHAT_LOGIN_TOKEN_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_LOGIN_TOKEN_TIMEOUT',
+        settings.ROCKETCHAT_LOGIN_TOKEN_TIMEOUT
+    )
+    settings.ROCKETCHAT_LOAD_COURSE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_LOAD_COURSE',
+        settings.ROCKETCHAT_LOAD_COURSE
+    )
+    settings.ROCKETCHAT_ROLE_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_ROLE_CACHE_TIMEOUT',
+        settings.ROCKETCHAT_ROLE_CACHE_TIMEOUT
+    )
+    settings.ROCKETCHAT_API_MAX_AGE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_API_MAX_AGE',
+        settings.ROCKETCHAT_API_MAX_AGE
+    )
+    settings.ROCKETCHAT_ID_STORE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_ID_STORE',
+        settings.ROCKETCHAT_ID_STORE
+    )
+    settings.ROCKETCHAT_BACKENDS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_BACKENDS',
+        settings.ROCKETCHAT_BACKENDS
+    )
+    settings.ROCKETCHAT_BACKEND_OVERRIDES = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_BACKEND_OVERRIDES',
+        settings.ROCKETCHAT_BACKEND_OVERRIDES
+    )
+    settings.ROCKETCHAT_TRANSPORT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_TRANSPORT',
+        settings.ROCKETCHAT_TRANSPORT
+    )
+    settings.ROCKETCHAT_STATUS_FRESHNESS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_STATUS_FRESHNESS',
+        settings.ROCKETCHAT_STATUS_FRESHNESS
+    )
+    settings.ROCKETCHAT_PREWARM_ON_PUBLISH = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_PREWARM_ON_PUBLISH',
+        settings.ROCKETCHAT_PREWARM_ON_PUBLISH
+    )
+    settings.ROCKETCHAT_UNREAD_BADGE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_UNREAD_BADGE',
+        settings.ROCKETCHAT_UNREAD_BADGE
+    )
+    settings.ROCKETCHAT_UNREAD_FRESHNESS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_UNREAD_FRESHNESS',
+        settings.ROCKETCHAT_UNREAD_FRESHNESS
+    )
+    settings.ROCKETCHAT_UNREAD_BATCH_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'ROCKETCHAT_UNREAD_BATCH_SIZE',
+        settings.ROCKETCHAT_UNREAD_BATCH_SIZE
+    )
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Provisions Rocket.Chat users when they enroll, unenroll or change course roles, so the
+Chat tab has nothing left to do but render the iframe.
+
+Enabled by ROCKETCHAT_PROVISION_ON_ENROLLMENT. The handlers only queue background jobs
+(see provisioning.schedule_membership_sync), after the surrounding transaction commits.
+
+In Studio, publishing or creating a course creates its room and makes the course team its
+owners (ROCKETCHAT_PREWARM_ON_PUBLISH, see provisioning.schedule_course_prewarm).
+"""
+
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+
+from common.djangoapps.student.models import EnrollStatusChange
+from common.djangoapps.student.signals import ENROLL_STATUS_CHANGE
+
+from . import courses, provisioning
+
+# Course roles that are room owners in Rocket.Chat
+OWNER_ROLES = ('staff', 'instructor')
+
+
+def is_enabled():
+    return getattr(settings, 'ROCKETCHAT_PROVISION_ON_ENROLLMENT', False)
+
+
+def is_prewarm_enabled():
+    return getattr(settings, 'ROCKETCHAT_PREWARM_ON_PUBLISH', False)
+
+
+def schedule(user_id, course_id, demote=False):
+    # The job runs in another thread, so it must only start once the change is committed
+    transaction.on_commit(partial(
+        provisioning.schedule_membership_sync, user_id, course_id, demote=demote))
+
+
+@receiver(ENROLL_STATUS_CHANGE)
+def handle_enroll_status_change(sender, event=None, user=None, course_id=None, **kwargs):
+    """Queues provisioning on enrollment and room removal on unenrollment"""
+
+    if(not is_enabled() or user is None or course_id is None):
+        return
+
+    if(event in (EnrollStatusChange.enroll, EnrollStatusChange.unenroll)):
+        schedule(user.id, course_id)
+
+
+def handle_course_access_role_added(signal, sender, course_access_role_data, metadata, **kwargs):
+    """Queues owner promotion when a user joins the course team"""
+
+    courses.forget_course_staff(course_access_role_data.user.id, course_access_role_data.course_key)
+
+    if(not is_enabled() or course_access_role_data.role not in OWNER_ROLES):
+        return
+
+    schedule(course_access_role_data.user.id, course_access_role_data.course_key)
+
+
+def handle_course_access_role_removed(signal, sender, course_access_role_data, metadata, **kwargs):
+    """Queues owner removal when a user leaves the course team"""
+
+    courses.forget_course_staff(course_access_role_data.user.id, course_access_role_data.course_key)
+
+    if(not is_enabled() or course_access_role_data.role not in OWNER_ROLES):
+        return
+
+    schedule(course_access_role_data.user.id, course_access_role_data.course_key, demote=True)
+
+
+def handle_course_published(sender, course_key, **kwargs):
+    """Queues the room creation when a course is published in Studio"""
+
+    if(not is_prewarm_enabled()):
+        return
+
+    transaction.on_commit(partial(provisioning.schedule_course_prewarm, course_key))
+
+
+def handle_course_created(signal, sender, course, metadata, **kwargs):
+    """Queues the room creation when a course (or course run) is created in Studio"""
+
+    if(not is_prewarm_enabled()):
+        return
+
+    transaction.on_commit(partial(provisioning.schedule_course_prewarm, course.course_key))
+
+
+def connect_course_signals():
+    """Connects the course publishing and creation handlers (they are only sent by Studio)"""
+
+    from xmodule.modulestore.django import SignalHandler
+
+    SignalHandler.course_published.connect(handle_course_published)
+
+    try:
+        from openedx_events.content_authoring.signals import COURSE_CREATED
+    except ImportError:
+        # Older releases: the first publish of the new course creates the room
+        return
+
+    COURSE_CREATED.connect(handle_course_created)
+
+
+def connect_role_signals():
+    """Connects the course role handlers if the installed openedx-events sends role events"""
+
+    try:
+        from openedx_events.learning.signals import (
+            COURSE_ACCESS_ROLE_ADDED,
+            COURSE_ACCESS_ROLE_REMOVED,
+        )
+    except ImportError:
+        # Older releases: staff are still promoted when they open the Chat tab
+        return
+
+    COURSE_ACCESS_ROLE_ADDED.connect(handle_course_access_role_added)
+    COURSE_ACCESS_ROLE_REMOVED.connect(handle_course_access_role_removed)
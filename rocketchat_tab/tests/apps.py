@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+
+from django.apps import AppConfig
+
+
+class RocketChatTestConfig(AppConfig):
+    """The app without its Open edX plugin configuration (see apps.RocketChatConfig), for the tests"""
+
+    name = 'rocketchat_tab'
+    label = 'rocketchat_tab'
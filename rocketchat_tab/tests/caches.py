@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class MemcachedLikeCache(LocMemCache):
+    """The local memory cache with the counters of memcached: decr stops at 0
+
+    https://github.com/memcached/memcached/wiki/Commands#incrdecr
+    """
+
+    def decr(self, key, delta=1, version=None):
+        value = self.get(key, version=version)
+        if (value is None):
+            raise ValueError("Key '%s' not found" % key)
+
+        return self.incr(key, -min(delta, value), version=version)
+
+
+MEMCACHED_LIKE = {
+    'default': {
+        'BACKEND': 'rocketchat_tab.tests.caches.MemcachedLikeCache',
+    }
+}
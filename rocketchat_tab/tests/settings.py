@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Settings for the unit tests, which run without edx-platform (see README).
+"""
+
+import sys
+
+from rocketchat_tab.settings.common import plugin_settings
+
+SECRET_KEY = 'rocketchat-tab-tests'
+USE_TZ = True
+
+INSTALLED_APPS = [
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
+    'rocketchat_tab.tests.apps.RocketChatTestConfig',
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+plugin_settings(sys.modules[__name__])
+
+ROCKETCHAT_BASE_URL = 'http://chat.example.com'
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from opaque_keys.edx.keys import CourseKey
+
+from rocketchat_tab import activity
+from rocketchat_tab.models import RocketChatParticipant, RocketChatRoomActivity
+
+COURSE_KEY = CourseKey.from_string('course-v1:NAU+IT_IS+2022_SUMMER')
+
+
+def build_message(user, sent_at, **fields):
+    return dict({"_id": "m", "u": {"_id": 'id-' + user, "username": user}, "ts": activity.format_time(sent_at)},
+                **fields)
+
+
+class ActivitySyncTest(TestCase):
+
+    def setUp(self):
+        self.messages = []
+        self.history_calls = []
+
+        def get_group_history(room_id, oldest, latest, page_size):
+            self.history_calls.append((oldest, latest))
+            return iter(self.messages)
+
+        self.rocketChat = mock.Mock(course_id=COURSE_KEY, get_group_history=get_group_history)
+        self.rocketChat.backend.name = 'default'
+
+    def sync(self):
+        return activity.sync_room(self.rocketChat, 'room')
+
+    def test_first_sync_reads_the_whole_history(self):
+        now = timezone.now()
+        self.messages = [
+            build_message('ann', now - timedelta(days=1)),
+            build_message('ann', now - timedelta(hours=1)),
+            build_message('bob', now - timedelta(hours=1)),
+            build_message('bob', now - timedelta(hours=1), t='uj'),
+        ]
+
+        self.assertEqual(self.sync(), 3)
+
+        summary = RocketChatRoomActivity.objects.get(room_id='room')
+        self.assertEqual((summary.messages, summary.participants), (3, 2))
+        self.assertEqual(RocketChatParticipant.objects.get(user_id='id-ann').messages, 2)
+        self.assertIsNone(self.history_calls[0][0])
+
+    def test_next_sync_starts_at_the_high_water_mark(self):
+        self.messages = [build_message('ann', timezone.now() - timedelta(hours=1))]
+        self.sync()
+        synced_until = RocketChatRoomActivity.objects.get(room_id='room').synced_until
+
+        # groups.history includes a message at 'oldest': it was counted by the previous sync
+        self.messages = [build_message('ann', synced_until), build_message('bob', synced_until + timedelta(seconds=1))]
+        with mock.patch.object(activity.timezone, 'now', return_value=synced_until + timedelta(minutes=5)):
+            self.assertEqual(self.sync(), 1)
+
+        self.assertEqual(self.history_calls[1][0], activity.format_time(synced_until))
+        summary = RocketChatRoomActivity.objects.get(room_id='room')
+        self.assertEqual((summary.messages, summary.participants), (2, 2))
+        self.assertEqual(summary.synced_until, synced_until + timedelta(seconds=1))
+
+    def test_high_water_mark_is_the_newest_message_time(self):
+        now = timezone.now().replace(microsecond=0)
+        sent_at = now - timedelta(hours=2)
+        self.messages = [build_message('ann', sent_at), build_message('bob', sent_at + timedelta(seconds=1), t='uj')]
+
+        with mock.patch.object(activity.timezone, 'now', return_value=now):
+            self.sync()
+
+        # Not the LMS clock: a message stamped later by a clock behind it is read by the next sync
+        self.assertEqual(RocketChatRoomActivity.objects.get(room_id='room').synced_until,
+                         sent_at + timedelta(seconds=1))
+        self.assertEqual(self.history_calls[0][1], activity.format_time(now - activity.SYNC_LAG))
+
+    def test_concurrent_sync_saves_nothing(self):
+        totals = activity.ActivityTotals(None)
+        totals.add(build_message('ann', timezone.now()))
+
+        self.assertTrue(activity.save_totals('default', COURSE_KEY, 'room', None, timezone.now(), totals))
+        # A second sync that also started from no high-water mark finished later
+        self.assertFalse(activity.save_totals('default', COURSE_KEY, 'room', None, timezone.now(), totals))
+
+        self.assertEqual(RocketChatRoomActivity.objects.get(room_id='room').messages, 1)
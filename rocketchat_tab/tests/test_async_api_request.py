@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncio, time
+from unittest import mock
+
+import httpx
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from rocketchat_tab import AsyncApiRequest as module
+from rocketchat_tab.AsyncApiRequest import AsyncApiRequest
+from rocketchat_tab.RateLimiter import get_rate_limiter
+
+
+@override_settings(ROCKETCHAT_RETRY_BACKOFF=0, ROCKETCHAT_QUEUE_TIMEOUT=0.3)
+class AsyncApiRequestTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.requests = []
+        self.responses = []
+
+    def build_client(self, backend=None):
+        def handler(request):
+            self.requests.append(request)
+            status_code, headers = self.responses.pop(0) if self.responses else (200, {})
+            return httpx.Response(status_code, headers=headers, json={"success": status_code == 200})
+
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def build_api_request(self):
+        api_request = AsyncApiRequest()
+        api_request.client = self.build_client()
+        return api_request
+
+    async def asend(self, api_request, method='GET'):
+        if (method == 'GET'):
+            return await api_request.get('http://chat.example.com/api/v1/groups.info?roomName=a')
+        return await api_request.post('http://chat.example.com/api/v1/groups.create', '{}')
+
+    def send(self, api_request, method='GET'):
+        return async_to_sync(self.asend)(api_request, method)
+
+    def test_success(self):
+        self.assertEqual(self.send(self.build_api_request()).get('success'), True)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_client_is_shared_until_the_loop_shuts_down(self):
+        clients = []
+
+        async def send_twice():
+            for _ in range(2):
+                await self.asend(AsyncApiRequest())
+            clients.extend(client for client, closer in module._clients[asyncio.get_running_loop()].values())
+
+        with mock.patch.object(module, 'build_client', side_effect=self.build_client) as build_client:
+            # async_to_sync runs a new event loop, shut down once the call returns
+            async_to_sync(send_twice)()
+
+        self.assertEqual(build_client.call_count, 1)
+        self.assertEqual(len(self.requests), 2)
+        self.assertTrue(clients[0].is_closed)
+
+    def test_rejected_call_is_repeated_once_after_the_reset(self):
+        reset = str(int((time.time() + 0.1) * 1000))
+        self.responses = [(429, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': reset})]
+
+        self.assertEqual(self.send(self.build_api_request(), 'POST').get('success'), True)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_empty_bucket_is_not_called(self):
+        reset = str(int((time.time() + 5) * 1000))
+        self.responses = [(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': reset})]
+
+        self.send(self.build_api_request())
+        json_resp = self.send(self.build_api_request())
+
+        self.assertEqual(json_resp.get('status'), 'Failure')
+        self.assertEqual(len(self.requests), 1)
+
+    def test_server_errors_are_retried(self):
+        self.responses = [(500, {}), (502, {})]
+
+        self.assertEqual(self.send(self.build_api_request()).get('success'), True)
+        self.assertEqual(len(self.requests), 3)
+
+    def test_in_flight_slot_is_released(self):
+        limiter = get_rate_limiter('default')
+
+        for _ in range(limiter.in_flight._initial_value + 1):
+            self.send(self.build_api_request())
+
+        self.assertTrue(limiter.in_flight.acquire(blocking=False))
+        limiter.release()
+
+    def test_httpx_is_required(self):
+        with mock.patch.object(module, 'httpx', None):
+            with self.assertRaises(ImproperlyConfigured):
+                self.send(AsyncApiRequest())
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from rocketchat_tab import backends
+from rocketchat_tab.backends import HashRing
+
+KEYS = ['edx-NAU-COURSE_{0}-2022_SUMMER'.format(number) for number in range(2000)]
+
+BACKENDS = {
+    'chat1': {'BASE_URL': 'http://chat1.example.com/', 'ADMIN_TOKEN': 't1', 'ADMIN_USER_ID': 'u1'},
+    'chat2': {'BASE_URL': 'http://chat2.example.com/', 'ADMIN_TOKEN': 't2', 'ADMIN_USER_ID': 'u2'},
+}
+
+
+class HashRingTest(SimpleTestCase):
+
+    def test_keys_are_spread_by_weight(self):
+        ring = HashRing({'chat1': 1, 'chat2': 1, 'chat3': 2})
+        counts = {name: 0 for name in ('chat1', 'chat2', 'chat3')}
+        for key in KEYS:
+            counts[ring.get(key)] += 1
+
+        self.assertAlmostEqual(counts['chat3'] / len(KEYS), 0.5, delta=0.1)
+        self.assertAlmostEqual(counts['chat1'] / len(KEYS), 0.25, delta=0.1)
+
+    def test_adding_a_backend_only_moves_its_share(self):
+        before = HashRing({'chat1': 1, 'chat2': 1, 'chat3': 1})
+        after = HashRing({'chat1': 1, 'chat2': 1, 'chat3': 1, 'chat4': 1})
+
+        moved = [key for key in KEYS if before.get(key) != after.get(key)]
+
+        # Only to the new backend, about a quarter of the keys
+        self.assertEqual(set(after.get(key) for key in moved), {'chat4'})
+        self.assertAlmostEqual(len(moved) / len(KEYS), 0.25, delta=0.1)
+
+    def test_same_answer_in_every_process(self):
+        self.assertEqual(backends.hash_key('edx-NAU-IT_IS-2022_SUMMER'), backends.hash_key('edx-NAU-IT_IS-2022_SUMMER'))
+        self.assertEqual(HashRing({'chat1': 1, 'chat2': 1}).get(KEYS[0]), HashRing({'chat2': 1, 'chat1': 1}).get(KEYS[0]))
+
+    def test_no_weight_is_an_error(self):
+        with self.assertRaises(ImproperlyConfigured):
+            HashRing({'chat1': 0})
+
+
+@override_settings(ROCKETCHAT_BACKENDS=BACKENDS,
+                   ROCKETCHAT_BACKEND_OVERRIDES={'course-v1:NAU+IT_IS+2022_SUMMER': 'chat2'})
+class GetBackendTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.multiple(backends, _backends=None, _ring=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_override(self):
+        self.assertEqual(backends.get_backend('edx-NAU-IT_IS-2022_SUMMER', 'course-v1:NAU+IT_IS+2022_SUMMER').name,
+                         'chat2')
+
+    def test_ring(self):
+        ring = HashRing({'chat1': 1, 'chat2': 1})
+        for key in KEYS[:20]:
+            self.assertEqual(backends.get_backend(key).name, ring.get(key))
+
+    @override_settings(ROCKETCHAT_BACKEND_OVERRIDES={'course-v1:NAU+IT_IS+2022_SUMMER': 'chat9'})
+    def test_override_to_an_unknown_backend(self):
+        with self.assertRaises(ImproperlyConfigured):
+            backends.get_backends()
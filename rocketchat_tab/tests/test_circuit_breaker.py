@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from rocketchat_tab.CircuitBreaker import CircuitBreaker
+
+
+@override_settings(ROCKETCHAT_CIRCUIT_FAILURES=3, ROCKETCHAT_CIRCUIT_WINDOW=30, ROCKETCHAT_CIRCUIT_RESET_TIMEOUT=30)
+class CircuitBreakerTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker()
+
+    def end_open_period(self):
+        cache.delete(self.breaker.open_key)
+
+    def test_opens_after_the_threshold(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open())
+
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open())
+
+    def test_success_does_not_close_an_open_circuit(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        # A call that started before the circuit opened
+        self.breaker.record_success()
+
+        self.assertTrue(self.breaker.is_open())
+
+    def test_half_open_lets_one_probe_through(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.end_open_period()
+
+        self.assertFalse(self.breaker.is_open())
+        # The other callers are rejected until the probe finishes
+        self.assertTrue(self.breaker.is_open())
+        self.assertTrue(CircuitBreaker().is_open())
+
+    def test_half_open_success_closes(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.end_open_period()
+
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.record_success()
+        self.breaker.record_failure()
+
+        # Closed again: one failure is counted, it does not reopen the circuit
+        self.assertFalse(self.breaker.is_open())
+        self.assertFalse(self.breaker.is_open())
+
+    def test_half_open_failure_reopens(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.end_open_period()
+
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.record_failure()
+
+        self.assertTrue(self.breaker.is_open())
+
+        # The next open period ends: a new probe goes through
+        self.end_open_period()
+        self.assertFalse(self.breaker.is_open())
+
+    def test_released_probe_is_claimed_again(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.end_open_period()
+
+        self.assertFalse(self.breaker.is_open())
+        self.breaker.release_probe()
+
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.is_open())
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from rocketchat_tab.ApiResponse import ApiResponse
+from rocketchat_tab.RocketChat import RocketChat
+from rocketchat_tab.RocketChatCache import MEMBER, OWNER, MembershipLedger
+
+
+def build_edx_info(is_staff=False):
+    return {
+        "user": {"username": "Learner", "email": "", "display_name": "", "is_staff": is_staff, "is_enrolled": True},
+        "course": {"name": "Course", "key": "course-v1:NAU+IT_IS+2022_SUMMER"},
+    }
+
+
+class MembershipLedgerTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ledger = MembershipLedger()
+
+    def flush_caches(self):
+        cache.clear()
+        self.ledger.members.local.clear()
+
+    def test_state_is_read_from_the_database_after_a_cache_flush(self):
+        self.ledger.set_state('room', 'user', OWNER)
+        self.flush_caches()
+
+        self.assertEqual(self.ledger.get_state('room', 'user'), OWNER)
+
+    def test_deleted_state(self):
+        self.ledger.set_state('room', 'user', MEMBER)
+        self.ledger.delete_state('room', 'user')
+        self.flush_caches()
+
+        self.assertIsNone(self.ledger.get_state('room', 'user'))
+
+    def test_local_tier_only(self):
+        self.ledger.set_state('room', 'user', MEMBER)
+        self.flush_caches()
+
+        self.assertIsNone(self.ledger.get_state('room', 'user', store=False))
+
+    @override_settings(ROCKETCHAT_MEMBERSHIP_TIMEOUT=0)
+    def test_expired_state_is_not_read_from_the_database(self):
+        ledger = MembershipLedger()
+        ledger.set_state('room', 'user', MEMBER)
+        self.flush_caches()
+
+        self.assertIsNone(ledger.get_state('room', 'user'))
+
+
+class AddUserToGroupTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def add_user(self, is_staff, state):
+        rocketChat = RocketChat(build_edx_info(is_staff))
+        rocketChat.membership = mock.Mock(get_state=mock.Mock(return_value=state))
+
+        post = mock.Mock(return_value=ApiResponse({"success": True, "group": {"_id": "room"}}))
+        with mock.patch.object(rocketChat.api_call, 'post', post):
+            rocketChat.add_user_to_group('room', 'user')
+
+        return [call[0][0].rsplit('/', 1)[1] for call in post.call_args_list]
+
+    def test_recorded_member_makes_no_call(self):
+        self.assertEqual(self.add_user(False, MEMBER), [])
+        self.assertEqual(self.add_user(True, OWNER), [])
+
+    def test_new_member_is_invited(self):
+        self.assertEqual(self.add_user(False, None), ['groups.invite'])
+        self.assertEqual(self.add_user(True, None), ['groups.invite', 'groups.addOwner'])
+
+    def test_member_promoted_without_a_new_invite(self):
+        self.assertEqual(self.add_user(True, MEMBER), ['groups.addOwner'])
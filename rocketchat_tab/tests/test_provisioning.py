@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from rocketchat_tab import provisioning
+
+COURSE_ID = 'course-v1:NAU+IT_IS+2022_SUMMER'
+
+
+def build_edx_info(username='Learner'):
+    return {
+        "user": {"username": username, "email": "", "display_name": "", "is_staff": False, "is_enrolled": True},
+        "course": {"name": "Course", "key": COURSE_ID},
+    }
+
+
+class ProvisionInBackgroundTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.executor = mock.Mock()
+        patcher = mock.patch.object(provisioning, 'get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_job_is_scheduled_once(self):
+        self.assertEqual(provisioning.provision_in_background(build_edx_info())['state'], provisioning.PENDING)
+        self.assertEqual(provisioning.provision_in_background(build_edx_info())['state'], provisioning.PENDING)
+
+        self.assertEqual(self.executor.submit.call_count, 1)
+
+    def test_failed_provisioning_is_retried_right_away(self):
+        provisioning.set_failed_status(COURSE_ID, 'Learner', 'Rocket.Chat is down')
+
+        status = provisioning.provision_in_background(build_edx_info())
+
+        self.assertEqual(status['state'], provisioning.PENDING)
+        self.assertEqual(self.executor.submit.call_count, 1)
+
+    def test_ready_room_is_not_provisioned_again(self):
+        provisioning.set_status(COURSE_ID, 'Learner', provisioning.READY, room_url='http://chat.example.com/group/a')
+        provisioning.set_failed_status(COURSE_ID, 'Learner', 'Rocket.Chat is down')
+
+        status = provisioning.provision_in_background(build_edx_info())
+
+        self.assertEqual(status['state'], provisioning.READY)
+        self.executor.submit.assert_not_called()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from rocketchat_tab.RateLimiter import RateLimiter, get_endpoint
+from .caches import MEMCACHED_LIKE
+
+
+def build_response(remaining, reset_in, limit=None, status_code=200):
+    headers = {
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset': str(int((time.time() + reset_in) * 1000)),
+    }
+    if (limit is not None):
+        headers['X-RateLimit-Limit'] = str(limit)
+
+    return SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class RateLimiterTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.limiter = RateLimiter('tests')
+
+    def test_get_endpoint(self):
+        self.assertEqual(get_endpoint('https://my.chat.site//api/v1/groups.info?roomName=a'), 'groups.info')
+
+    def test_unknown_budget_is_not_limited(self):
+        for _ in range(20):
+            self.assertTrue(self.limiter.take_token('groups.info', time.monotonic() + 0.1))
+
+    def test_empty_bucket_waits_for_the_window(self):
+        self.limiter.update('groups.info', build_response(remaining=2, reset_in=5))
+
+        deadline = time.monotonic() + 0.2
+        self.assertTrue(self.limiter.take_token('groups.info', deadline))
+        self.assertTrue(self.limiter.take_token('groups.info', deadline))
+
+        # The window resets after the deadline: the caller gives up without a call
+        self.assertFalse(self.limiter.take_token('groups.info', deadline))
+
+        # Other endpoints have their own budget
+        self.assertTrue(self.limiter.take_token('users.info', deadline))
+
+    def test_bucket_refills_when_the_window_resets(self):
+        self.limiter.update('groups.info', build_response(remaining=0, reset_in=0.5))
+
+        started = time.monotonic()
+        self.assertTrue(self.limiter.take_token('groups.info', started + 5))
+        self.assertGreater(time.monotonic() - started, 0.4)
+
+    def test_new_window_starts_with_the_learned_limit(self):
+        self.limiter.update('groups.info', build_response(remaining=5, reset_in=5, limit=1))
+        cache.delete_many([self.limiter.make_key('groups.info', suffix) for suffix in ('limit', 'used', 'reset')])
+
+        deadline = time.monotonic() + 0.2
+        self.assertTrue(self.limiter.take_token('groups.info', deadline))
+        self.assertFalse(self.limiter.take_token('groups.info', deadline))
+
+    def test_rejected_call_empties_the_bucket(self):
+        self.limiter.update('groups.info', SimpleNamespace(status_code=429, headers={}))
+
+        self.assertFalse(self.limiter.take_token('groups.info', time.monotonic() + 0.2))
+
+    def test_acquire_caps_the_calls_in_flight(self):
+        with self.settings(ROCKETCHAT_MAX_IN_FLIGHT=1):
+            limiter = RateLimiter('tests')
+
+        self.assertTrue(limiter.acquire('groups.info', time.monotonic() + 0.1))
+        self.assertFalse(limiter.acquire('groups.info', time.monotonic() + 0.1))
+        limiter.release()
+        self.assertTrue(limiter.acquire('groups.info', time.monotonic() + 0.1))
+        limiter.release()
+
+
+@override_settings(CACHES=MEMCACHED_LIKE)
+class MemcachedRateLimiterTest(RateLimiterTest):
+    """Same tests with the counters of memcached, the usual Open edX cache"""
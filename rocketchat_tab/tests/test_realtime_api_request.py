@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+
+import json, time
+from concurrent.futures import Future
+
+from django.test import SimpleTestCase
+
+from rocketchat_tab.RealtimeApiRequest import RealtimeConnection, RealtimeConnectionError
+from rocketchat_tab.backends import Backend
+
+
+class FakeWebSocket(object):
+    """A connection that never answers"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+
+    def close(self):
+        self.closed = True
+
+
+class RealtimeConnectionTest(SimpleTestCase):
+
+    def setUp(self):
+        self.connection = RealtimeConnection(Backend('default', 'http://chat.example.com/', 'token', 'admin', 1))
+        self.ws = self.connection.ws = FakeWebSocket()
+
+        # Another call still waiting for its answer
+        self.other = Future()
+        self.connection.pending['other'] = self.other
+
+    def test_timeout_only_fails_its_call(self):
+        with self.assertRaises(RealtimeConnectionError):
+            self.connection.call('createPrivateGroup', ['room', []], 0.01)
+
+        self.assertIs(self.connection.ws, self.ws)
+        self.assertFalse(self.ws.closed)
+        self.assertFalse(self.other.done())
+        self.assertEqual(list(self.connection.pending), ['other'])
+        self.assertEqual(self.ws.sent[-1], {"msg": "ping", "id": "alive"})
+
+    def test_answered_ping_keeps_the_connection(self):
+        with self.assertRaises(RealtimeConnectionError):
+            self.connection.call('createPrivateGroup', ['room', []], 0.01)
+
+        # The reader got the pong
+        self.connection.received_at = time.monotonic()
+
+        with self.assertRaises(RealtimeConnectionError):
+            self.connection.call('createPrivateGroup', ['room', []], 0.01)
+
+        self.assertFalse(self.ws.closed)
+
+    def test_unanswered_ping_closes_the_connection(self):
+        for _ in range(2):
+            with self.assertRaises(RealtimeConnectionError):
+                self.connection.call('createPrivateGroup', ['room', []], 0.01)
+
+        self.assertIsNone(self.connection.ws)
+        self.assertTrue(self.ws.closed)
+        self.assertIsInstance(self.other.exception(), RealtimeConnectionError)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+
+import sys, types
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from opaque_keys.edx.keys import CourseKey
+
+from rocketchat_tab import reconciliation
+from rocketchat_tab.ApiResponse import ApiResponse
+from rocketchat_tab.RocketChat import RocketChat
+from rocketchat_tab.RocketChatError import RocketChatError
+from rocketchat_tab.reconciliation import INVITE, REMOVE, Reconciler, RosterEntry, merge
+
+COURSE_ID = 'course-v1:NAU+IT_IS+2022_SUMMER'
+
+
+class MergeTest(TestCase):
+
+    def test_differences(self):
+        roster = [RosterEntry('ann', 1, False), RosterEntry('bob', 2, True)]
+        members = [('bob', 'b'), ('cid', 'c')]
+
+        self.assertEqual(list(merge(roster, members)), [
+            ('ann', roster[0], None),
+            ('bob', roster[1], 'b'),
+            ('cid', None, 'c'),
+        ])
+
+    def test_members_with_capital_letters_are_skipped(self):
+        self.assertEqual(list(merge([], [('Admin', 'a'), ('bob', 'b')])), [('bob', None, 'b')])
+
+    def test_unsorted_members_are_an_error(self):
+        with self.assertRaises(RocketChatError):
+            list(merge([], [('bob', 'b'), ('ann', 'a')]))
+
+
+class Room(object):
+    """The members of a room, served by groups.members pages (offset and count)"""
+
+    def __init__(self, usernames):
+        self.members = sorted(usernames)
+        self.offsets = []
+
+    def get(self, api_url):
+        query = parse_qs(urlparse(api_url).query)
+
+        if('groups.members' not in api_url):
+            return ApiResponse({"success": True, "roles": []})
+
+        offset, count = int(query['offset'][0]), int(query['count'][0])
+        self.offsets.append(offset)
+        page = self.members[offset:offset + count]
+
+        return ApiResponse({
+            "success": True,
+            "members": [{"username": username, "_id": 'id-' + username} for username in page],
+            "total": len(self.members),
+        })
+
+    def apply(self, change):
+        operation, username = change[0], change[1]
+
+        if(operation == INVITE):
+            self.members = sorted(self.members + [username])
+        elif(operation == REMOVE):
+            self.members.remove(username)
+
+        return 1, True
+
+
+class ReconcilerTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def reconcile(self, room, roster, batch_size=2, page_size=2):
+        executor = mock.Mock(map=map)
+
+        with mock.patch.object(reconciliation, 'iter_roster', return_value=roster), \
+                mock.patch.object(reconciliation.courses, 'get_course_name', return_value='Course'), \
+                mock.patch.object(RocketChat, 'get_group_info',
+                                  return_value=ApiResponse({"success": True, "group": {"_id": 'room'}})), \
+                mock.patch('rocketchat_tab.ApiRequest.ApiRequest.get', side_effect=room.get), \
+                mock.patch.object(Reconciler, 'apply', side_effect=room.apply), \
+                mock.patch('django.db.models.query.QuerySet.select_related', lambda queryset, *fields: queryset):
+            # The LMS user profiles are not installed here
+            reconciler = Reconciler(COURSE_ID, executor, batch_size=batch_size, page_size=page_size)
+            return reconciler.run()
+
+    def test_changes_are_applied_while_paging(self):
+        users = {username: get_user_model().objects.create(username=username)
+                 for username in ('ann', 'bob', 'cid', 'dan', 'eve', 'fay', 'gus')}
+
+        roster = [RosterEntry(username, users[username].id, False) for username in ('ann', 'bob', 'cid', 'gus')]
+        room = Room(['dan', 'eve', 'fay', 'gus', 'hal'])
+
+        report = self.reconcile(room, roster)
+
+        # The first batch invites two users ahead of the next page: it must not be read twice
+        self.assertEqual(room.members, ['ann', 'bob', 'cid', 'gus', 'hal'])
+        self.assertEqual(report['invite'], 3)
+        self.assertEqual(report['remove'], 3)
+        self.assertEqual(report['unchanged'], 1)
+        self.assertEqual(report['unmanaged'], 1)
+        self.assertEqual(report['members'], 5)
+
+    def test_removals_only_concern_lms_users(self):
+        get_user_model().objects.create(username='dan')
+
+        room = Room(['dan', 'moderator'])
+        report = self.reconcile(room, [])
+
+        self.assertEqual(room.members, ['moderator'])
+        self.assertEqual(report['unmanaged'], 1)
+
+
+class ApplyBatchTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        with mock.patch.object(reconciliation.courses, 'get_course_name', return_value='Course'):
+            self.reconciler = Reconciler(COURSE_ID, mock.Mock(map=map))
+        self.reconciler.room_id = 'room'
+
+    def test_user_deleted_since_the_roster_was_read(self):
+        with mock.patch('django.db.models.query.QuerySet.select_related', lambda queryset, *fields: queryset):
+            self.reconciler.apply_batch([(INVITE, 'gone', RosterEntry('gone', 404, False), None)])
+
+        self.assertEqual(self.reconciler.report['failed'], 1)
+        self.assertEqual(self.reconciler.shift, 0)
+
+    def test_unexpected_error_only_fails_its_change(self):
+        changes = [(reconciliation.DEMOTE, 'ann', RosterEntry('ann', 1, False), 'id-ann'),
+                   (reconciliation.DEMOTE, 'bob', RosterEntry('bob', 2, False), 'id-bob')]
+
+        with mock.patch.object(RocketChat, 'remove_owner_from_group', side_effect=[ValueError, None]):
+            self.reconciler.apply_batch(changes)
+
+        self.assertEqual(self.reconciler.report['failed'], 1)
+        self.assertEqual(self.reconciler.report['demote'], 2)
+
+
+class CourseOwnersTest(TestCase):
+
+    def test_owners_are_the_team_members_with_staff_access(self):
+        course_key = CourseKey.from_string(COURSE_ID)
+        users = [get_user_model().objects.create(username=username) for username in ('ann', 'bob', 'cid')]
+
+        # edx-platform is not installed here: the course team is ann, the organization team bob
+        roles = types.ModuleType('common.djangoapps.student.roles')
+        roles.OrgStaffRole = lambda org: mock.Mock(users_with_role=lambda: get_user_model().objects.filter(username='bob'))
+        roles.OrgInstructorRole = lambda org: mock.Mock(users_with_role=lambda: get_user_model().objects.none())
+        modules = {'common': types.ModuleType('common'), 'common.djangoapps': types.ModuleType('common.djangoapps'),
+                   'common.djangoapps.student': types.ModuleType('common.djangoapps.student'),
+                   'common.djangoapps.student.roles': roles}
+
+        with mock.patch.dict(sys.modules, modules), \
+                mock.patch.object(reconciliation.courses, 'get_course_staff_ids', return_value={users[0].id}), \
+                mock.patch.object(reconciliation.courses, 'is_course_staff', return_value=True) as is_course_staff:
+            owner_ids = reconciliation.courses.get_course_owner_ids(course_key)
+
+        self.assertEqual(owner_ids, {users[0].id, users[1].id})
+        self.assertEqual(is_course_staff.call_count, 2)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from rocketchat_tab import provisioning
+from rocketchat_tab.ApiResponse import ApiResponse
+from rocketchat_tab.RocketChat import RocketChat
+from rocketchat_tab.RocketChatCache import get_id_cache, get_login_token_cache
+
+COURSE_ID = 'course-v1:NAU+IT_IS+2022_SUMMER'
+
+
+def build_edx_info(username='Learner', is_staff=False):
+    return {
+        "user": {"username": username, "email": "learner@example.com", "display_name": "Learner",
+                 "is_staff": is_staff, "is_enrolled": True},
+        "course": {"name": "Course", "key": COURSE_ID},
+    }
+
+
+class LoginTokenTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_id_cache().users.local.clear()
+        get_login_token_cache().tokens.local.clear()
+
+    def test_room_url_never_has_the_token(self):
+        rocketChat = RocketChat(build_edx_info())
+
+        self.assertEqual(rocketChat.get_room_url(),
+                         '{0}group/{1}'.format(rocketChat.base_url, rocketChat.group_name))
+
+    def test_login_token_is_created_once(self):
+        get_id_cache().set_user_id('default', 'learner', 'user-id')
+
+        post = mock.Mock(return_value=ApiResponse({"success": True, "data": {"authToken": "secret"}}))
+        with mock.patch('rocketchat_tab.ApiRequest.ApiRequest.post', post):
+            self.assertEqual(provisioning.get_login_token(build_edx_info()), 'secret')
+            self.assertEqual(provisioning.get_login_token(build_edx_info()), 'secret')
+
+        self.assertEqual(post.call_count, 1)
+
+    def test_no_token_for_unknown_users(self):
+        get_ = mock.Mock(return_value=ApiResponse({"success": False, "error": "User not found."}))
+        post = mock.Mock()
+        with mock.patch('rocketchat_tab.ApiRequest.ApiRequest.get', get_), \
+                mock.patch('rocketchat_tab.ApiRequest.ApiRequest.post', post):
+            self.assertIsNone(provisioning.get_login_token(build_edx_info()))
+
+        post.assert_not_called()
+
+    def test_expired_token_is_revoked_when_replaced(self):
+        get_id_cache().set_user_id('default', 'learner', 'user-id')
+        tokens = get_login_token_cache()
+        tokens.tokens.set('user-id', ('old', time.time() - tokens.timeout))
+
+        post = mock.Mock(return_value=ApiResponse({"success": True, "data": {"authToken": "new"}}))
+        with mock.patch('rocketchat_tab.ApiRequest.ApiRequest.post', post):
+            self.assertEqual(provisioning.get_login_token(build_edx_info()), 'new')
+
+        self.assertEqual(tokens.get_token('user-id'), 'new')
+        self.assertTrue(post.call_args_list[1][0][0].endswith('/api/v1/logout'))
+        self.assertEqual(post.call_count, 2)
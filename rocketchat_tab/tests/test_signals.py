@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+
+import importlib, sys, types
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.dispatch import Signal
+from django.test import TestCase, override_settings
+from opaque_keys.edx.keys import CourseKey
+
+from rocketchat_tab import courses, provisioning
+
+COURSE_KEY = CourseKey.from_string('course-v1:NAU+IT_IS+2022_SUMMER')
+
+
+def build_student_modules(enrolled):
+    """The edx-platform modules imported by the signal handlers (edx-platform is not installed here)"""
+
+    models = types.ModuleType('common.djangoapps.student.models')
+    models.EnrollStatusChange = mock.Mock(enroll='enroll', unenroll='unenroll')
+    models.CourseEnrollment = mock.Mock(is_enrolled=mock.Mock(return_value=enrolled))
+
+    signals = types.ModuleType('common.djangoapps.student.signals')
+    signals.ENROLL_STATUS_CHANGE = Signal()
+
+    return {
+        'common': types.ModuleType('common'),
+        'common.djangoapps': types.ModuleType('common.djangoapps'),
+        'common.djangoapps.student': types.ModuleType('common.djangoapps.student'),
+        'common.djangoapps.student.models': models,
+        'common.djangoapps.student.signals': signals,
+    }
+
+
+@override_settings(ROCKETCHAT_PROVISION_ON_ENROLLMENT=True)
+class MembershipSyncTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create(username='instructor')
+
+    def sync(self, enrolled, is_staff, role='instructor', added=True):
+        executor = mock.Mock(submit=lambda function, *args: function(*args))
+
+        with mock.patch.dict(sys.modules, build_student_modules(enrolled)), \
+                mock.patch.object(provisioning, 'get_executor', return_value=executor), \
+                mock.patch.object(provisioning, 'run_provisioning') as run_provisioning, \
+                mock.patch.object(provisioning, 'remove_from_room') as remove_from_room, \
+                mock.patch.object(courses, 'is_chat_enabled', return_value=True), \
+                mock.patch.object(courses, 'is_course_staff', return_value=is_staff), \
+                mock.patch.object(courses, 'get_course_name', return_value='Course'), \
+                mock.patch('django.db.models.query.QuerySet.select_related', lambda queryset, *fields: queryset):
+            # The LMS user profiles are not installed here
+            signals = importlib.reload(importlib.import_module('rocketchat_tab.signals'))
+            handler = signals.handle_course_access_role_added if added else signals.handle_course_access_role_removed
+            data = mock.Mock(user=self.user, course_key=COURSE_KEY, role=role)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                handler(None, None, course_access_role_data=data, metadata=None)
+
+        return run_provisioning, remove_from_room
+
+    def test_unenrolled_instructor_joins_the_room(self):
+        run_provisioning, remove_from_room = self.sync(enrolled=False, is_staff=True)
+
+        remove_from_room.assert_not_called()
+        edx_info = run_provisioning.call_args[0][0]
+        self.assertTrue(edx_info['user']['is_staff'])
+        self.assertTrue(edx_info['user']['is_enrolled'])
+
+    def test_unenrolled_former_instructor_leaves_the_room(self):
+        run_provisioning, remove_from_room = self.sync(enrolled=False, is_staff=False, added=False)
+
+        run_provisioning.assert_not_called()
+        remove_from_room.assert_called_once()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+
+import threading, time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from rocketchat_tab import backends
+from rocketchat_tab.ApiResponse import ApiResponse
+from rocketchat_tab.RocketChat import RocketChat
+from rocketchat_tab.SingleFlight import SingleFlight
+
+
+def build_edx_info(username='Learner'):
+    return {
+        "user": {"username": username, "email": "", "display_name": "", "is_staff": False, "is_enrolled": True},
+        "course": {"name": "Course", "key": "course-v1:NAU+IT_IS+2022_SUMMER"},
+    }
+
+
+class SingleFlightTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.single_flight = SingleFlight()
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"_id": "room"}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.single_flight.do('group:a', create)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"_id": "room"}] * 5)
+
+    def test_waiter_runs_the_call_when_the_holder_fails(self):
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError('Rocket.Chat is down')
+
+        def holder():
+            with self.assertRaises(RuntimeError):
+                self.single_flight.do('group:a', fail)
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        started.wait()
+
+        self.assertEqual(self.single_flight.do('group:a', lambda: 'mine'), 'mine')
+        thread.join()
+
+    def test_keys_include_the_backend(self):
+        # The same room has another ID on each server: the calls must not be shared
+        keys = []
+
+        def do(key, function):
+            keys.append(key)
+            return ApiResponse({"success": True, "group": {"_id": key}})
+
+        for name in ('chat1', 'chat2'):
+            backend = backends.Backend(name, 'http://{0}.example.com'.format(name), 'token', 'admin', 1)
+            rocketChat = RocketChat(build_edx_info(), backend=backend)
+            rocketChat.id_cache = mock.Mock(get_room_id=mock.Mock(return_value=None),
+                                            get_user_id=mock.Mock(return_value=None))
+            rocketChat.single_flight = mock.Mock(do=do)
+
+            with mock.patch.object(rocketChat, 'find_group', return_value=ApiResponse({"success": False})), \
+                    mock.patch.object(rocketChat, 'find_user', return_value=ApiResponse({"success": False})):
+                rocketChat.get_group_info()
+                rocketChat.get_user_info()
+
+        self.assertEqual(len(set(keys)), 4)
+        self.assertIn('group:chat1:{0}'.format(RocketChat.build_group_name(build_edx_info()['course']['key'])), keys)
+
+    def test_lock_holder_reuses_the_recorded_id(self):
+        # A concurrent request created the user while this one waited for the lock
+        rocketChat = RocketChat(build_edx_info())
+        rocketChat.id_cache = mock.Mock(get_user_id=mock.Mock(return_value='user-id'))
+
+        with mock.patch.object(rocketChat, 'find_user') as find_user, \
+                mock.patch.object(rocketChat, 'create_user') as create_user:
+            json_resp = rocketChat.find_or_create_user()
+
+        self.assertEqual(json_resp.get('user', {}).get('_id'), 'user-id')
+        find_user.assert_not_called()
+        create_user.assert_not_called()
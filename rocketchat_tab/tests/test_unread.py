@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from rocketchat_tab import backends, unread
+from rocketchat_tab.ApiResponse import ApiResponse
+from rocketchat_tab.RocketChat import RocketChat
+from rocketchat_tab.RocketChatCache import get_id_cache, get_login_token_cache
+
+COURSE_ID = 'course-v1:NAU+IT_IS+2022_SUMMER'
+
+
+@override_settings(ROCKETCHAT_UNREAD_BADGE=True)
+class UnreadSyncTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_id_cache().users.local.clear()
+        get_login_token_cache().tokens.local.clear()
+
+        self.group_name = RocketChat.build_group_name(COURSE_ID)
+        self.backend = backends.get_backend(self.group_name, COURSE_ID)
+        self.responses = []
+        self.urls = []
+
+    def get(self, api_url):
+        self.urls.append(api_url)
+        return ApiResponse(dict(self.responses.pop(0), success=True))
+
+    def sync(self, username='learner'):
+        with mock.patch('rocketchat_tab.ApiRequest.ApiRequest.get', side_effect=self.get), \
+                mock.patch('rocketchat_tab.ApiRequest.ApiRequest.post') as post:
+            updated = unread.sync_users([(self.backend.name, username)])
+
+        # Browsing the course never creates a login token
+        post.assert_not_called()
+        return updated
+
+    def test_users_without_a_token_are_not_called(self):
+        get_id_cache().set_user_id(self.backend.name, 'learner', 'user-id')
+
+        self.assertEqual(self.sync(), 1)
+        self.assertEqual(self.urls, [])
+        self.assertEqual(unread.get_unread_count('learner', COURSE_ID), 0)
+
+    def test_sync_is_incremental(self):
+        get_id_cache().set_user_id(self.backend.name, 'learner', 'user-id')
+        get_login_token_cache().set_token('user-id', 'token')
+
+        self.responses = [
+            {"update": [{"_id": "s1", "t": "p", "name": self.group_name, "unread": 2,
+                         "_updatedAt": "2026-10-01T10:00:00.000Z"},
+                        {"_id": "s2", "t": "d", "name": "direct", "unread": 5,
+                         "_updatedAt": "2026-10-01T11:00:00.000Z"}],
+             "remove": []},
+            {"update": [{"_id": "s1", "t": "p", "name": self.group_name, "unread": 3,
+                         "_updatedAt": "2026-10-02T10:00:00.000Z"}],
+             "remove": []},
+        ]
+
+        self.sync()
+        self.assertEqual(unread.get_unread_count('learner', COURSE_ID), 2)
+
+        self.sync()
+        self.assertEqual(unread.get_unread_count('learner', COURSE_ID), 3)
+
+        # The second call only asks for what changed after the newest subscription seen
+        self.assertNotIn('updatedSince', self.urls[0])
+        self.assertEqual(parse_qs(urlparse(self.urls[1]).query)['updatedSince'], ['2026-10-01T11:00:00.000Z'])
+
+    def test_mark_read(self):
+        get_id_cache().set_user_id(self.backend.name, 'learner', 'user-id')
+        get_login_token_cache().set_token('user-id', 'token')
+        self.responses = [{"update": [{"_id": "s1", "t": "p", "name": self.group_name, "unread": 2,
+                                       "_updatedAt": "2026-10-01T10:00:00.000Z"}], "remove": []}]
+
+        self.sync()
+        unread.mark_read('Learner', COURSE_ID)
+
+        self.assertEqual(unread.get_unread_count('learner', COURSE_ID), 0)
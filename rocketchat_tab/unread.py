@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Unread message counts of the course rooms, shown on the Chat tab (ROCKETCHAT_UNREAD_BADGE).
+
+Rendering the course navigation never calls Rocket.Chat: the tab reads the user's subscription
+state from the cache. When that state is missing or older than ROCKETCHAT_UNREAD_FRESHNESS
+seconds, the user is queued and a background thread syncs the queued users in batches of
+ROCKETCHAT_UNREAD_BATCH_SIZE: one cache read and one cache write per batch, with the calls to
+Rocket.Chat of the batch made concurrently.
+
+A sync is incremental: Rocket.Chat is asked (subscriptions.get, as the user, with a login
+token) only for the subscriptions updated or removed since the newest one already seen.
+Only users who already have a login token are synced: it is created when they open the Chat
+tab (see RocketChatRoomMixin.get_login_token), never for a learner who only browses the
+course. This requires CREATE_TOKENS_FOR_USERS=true in the Rocket.Chat server environment, as
+for ROCKETCHAT_AUTO_LOGIN.
+"""
+
+# subscriptions.get https://developer.rocket.chat/reference/api/rest-api/endpoints/core-endpoints/subscriptions-endpoints/get-all-subscriptions
+
+import itertools, logging, threading, time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from . import backends
+from .ApiRequest import ApiRequest
+from .RocketChat import RocketChat
+from .RocketChatCache import KEY_PREFIX, get_id_cache, get_login_token_cache
+from .provisioning import get_executor, get_lookup_executor
+
+log = logging.getLogger(__name__)
+
+# Seconds a subscription state is kept. Once it is dropped, the next sync reads every subscription
+STATE_TIMEOUT = 60 * 60 * 24
+
+# Users waiting for a sync, as an ordered set of (backend name, username)
+_pending = {}
+_pending_lock = threading.Lock()
+_running = False
+
+
+def is_enabled():
+    return getattr(settings, 'ROCKETCHAT_UNREAD_BADGE', False)
+
+
+def get_freshness():
+    """Gets the number of seconds a subscription state is shown before the user is synced again"""
+
+    return getattr(settings, 'ROCKETCHAT_UNREAD_FRESHNESS', 60)
+
+
+def make_state_key(backend_name, username):
+    return '{0}:unread:{1}:{2}'.format(KEY_PREFIX, backend_name, username)
+
+
+def make_queued_key(backend_name, username):
+    return '{0}:unread-queued:{1}:{2}'.format(KEY_PREFIX, backend_name, username)
+
+
+def get_unread_count(username, course_id):
+    """Gets the number of unread messages of a user in the course room, from the cache only
+
+    A user whose subscription state is missing or stale is queued for a sync (see schedule_sync).
+
+    Args:
+        username (string): The edX username
+        course_id (string): The course ID
+
+    Returns:
+        int: The unread messages -OR- None if they are not known yet
+    """
+
+    username = str(username).lower()
+    group_name = RocketChat.build_group_name(course_id)
+    backend = backends.get_backend(group_name, course_id)
+
+    state = cache.get(make_state_key(backend.name, username))
+    if(state is None or time.time() - state['checked'] > get_freshness()):
+        schedule_sync(backend.name, username)
+
+    if(state is None):
+        return None
+
+    return sum(unread for name, unread in state['rooms'].values() if name == group_name)
+
+
+def mark_read(username, course_id):
+    """Clears the unread messages of the course room when the user opens the Chat tab
+
+    The next sync brings the count Rocket.Chat has, so a room left unread only stays
+    hidden until then.
+    """
+
+    username = str(username).lower()
+    group_name = RocketChat.build_group_name(course_id)
+    backend = backends.get_backend(group_name, course_id)
+    key = make_state_key(backend.name, username)
+
+    state = cache.get(key)
+    if(state is None):
+        return
+
+    rooms = {
+        subscription_id: [name, 0 if name == group_name else unread]
+        for subscription_id, (name, unread) in state['rooms'].items()
+    }
+    cache.set(key, dict(state, rooms=rooms), STATE_TIMEOUT)
+
+
+def schedule_sync(backend_name, username):
+    """Queues a user for a sync, unless any worker process did so in the last freshness period"""
+
+    global _running
+
+    # cache.add is atomic: only one request (in any process) queues the user
+    if(not cache.add(make_queued_key(backend_name, username), True, get_freshness())):
+        return
+
+    with _pending_lock:
+        _pending[(backend_name, username)] = None
+        if(_running):
+            return
+        _running = True
+
+    get_executor().submit(run_pending)
+
+
+def run_pending():
+    """Syncs the queued users, a batch at a time, until the queue is empty"""
+
+    global _running
+
+    batch_size = getattr(settings, 'ROCKETCHAT_UNREAD_BATCH_SIZE', 50)
+
+    while True:
+        with _pending_lock:
+            batch = list(itertools.islice(_pending, batch_size))
+            for key in batch:
+                del _pending[key]
+
+            if(not batch):
+                _running = False
+                return
+
+        try:
+            sync_users(batch)
+        except Exception:
+            log.exception('Could not sync the unread messages of %d users', len(batch))
+        finally:
+            close_old_connections()
+
+
+def sync_users(users):
+    """Syncs the subscription state of users
+
+    Args:
+        users (list): (backend name, username) of each user
+
+    Returns:
+        int: The number of users whose state was saved
+    """
+
+    configured = backends.get_backends()
+    users = [(name, username) for name, username in users if name in configured]
+    states = cache.get_many([make_state_key(name, username) for name, username in users])
+
+    executor = get_lookup_executor()
+    futures = {
+        make_state_key(name, username): executor.submit(
+            sync_user, configured[name], username, states.get(make_state_key(name, username)))
+        for name, username in users
+    }
+
+    updated = {key: future.result() for key, future in futures.items()}
+    updated = {key: state for key, state in updated.items() if state is not None}
+
+    cache.set_many(updated, STATE_TIMEOUT)
+    return len(updated)
+
+
+def sync_user(backend, username, state):
+    """Reads the subscriptions of a user updated since the last sync and applies them to the state
+
+    Args:
+        backend (Backend): The Rocket.Chat server
+        username (string): The (lowercase) username
+        state (dict): {'checked', 'updated_since', 'rooms': {subscription ID: [room name, unread]}}
+            -OR- None to read every subscription
+
+    Returns:
+        dict: The new state -OR- None if Rocket.Chat could not be read (the state is kept).
+            A user without a login token keeps the state, checked again after the freshness period
+    """
+
+    try:
+        state = state or {"checked": 0, "updated_since": None, "rooms": {}}
+
+        user_id = get_id_cache().get_user_id(backend.name, username)
+        if(not user_id):
+            # Never provisioned on this server: no rooms yet
+            return dict(state, checked=time.time())
+
+        # No token is created here: that would be one users.createToken per learner of the course
+        token = get_login_token_cache().get_token(user_id)
+        if(not token):
+            return dict(state, checked=time.time())
+
+        api_url = '{0}/api/v1/subscriptions.get'.format(backend.base_url)
+        if(state['updated_since']):
+            api_url += '?updatedSince={0}'.format(quote(state['updated_since']))
+
+        json_resp = ApiRequest(backend, auth=(user_id, token)).get(api_url)
+
+        if(json_resp.get('success') != True):
+            if(json_resp.status_code == 401):
+                # Logged out or expired: a new token is created when the user opens the Chat tab
+                get_login_token_cache().delete_token(user_id)
+            return None
+
+        rooms = dict(state['rooms'])
+        times = [state['updated_since']]
+
+        # JSON response {"update": [{"_id": ..., "t": "p", "name": ..., "unread": 2, "_updatedAt": ...}],
+        #                "remove": [{"_id": ..., "_deletedAt": ...}], "success": true}
+        for subscription in json_resp.get('update', []):
+            times.append(subscription.get('_updatedAt'))
+            if(subscription.get('t') == 'p'):
+                rooms[subscription['_id']] = [subscription.get('name'), subscription.get('unread', 0)]
+            else:
+                rooms.pop(subscription['_id'], None)
+
+        for subscription in json_resp.get('remove', []):
+            times.append(subscription.get('_deletedAt'))
+            rooms.pop(subscription['_id'], None)
+
+        # ISO 8601 times in UTC compare in time order
+        return {
+            "checked": time.time(),
+            "updated_since": max(filter(None, times), default=None),
+            "rooms": rooms,
+        }
+
+    finally:
+        close_old_connections()
+
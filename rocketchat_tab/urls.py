@@ -3,7 +3,9 @@
 
 from django.conf.urls import url
 from django.conf import settings
-from .views import RocketChatView
+from .views import (
+    RocketChatView, RocketChatStatusView, RocketChatActivityView, RocketChatApiView, RocketChatMetricsView,
+)
 
 
 urlpatterns = (
@@ -14,4 +16,30 @@ urlpatterns = (
         RocketChatView.as_view(),
         name='rocketchat_view',
     ),
+    url(
+        r'courses/{}/chat/status$'.format(
+            settings.COURSE_ID_PATTERN,
+        ),
+        RocketChatStatusView.as_view(),
+        name='rocketchat_status',
+    ),
+    url(
+        r'courses/{}/chat/activity$'.format(
+            settings.COURSE_ID_PATTERN,
+        ),
+        RocketChatActivityView.as_view(),
+        name='rocketchat_activity',
+    ),
+    url(
+        r'api/rocketchat/v1/courses/{}/room$'.format(
+            settings.COURSE_ID_PATTERN,
+        ),
+        RocketChatApiView.as_view(),
+        name='rocketchat_api_room',
+    ),
+    url(
+        r'rocketchat/metrics$',
+        RocketChatMetricsView.as_view(),
+        name='rocketchat_metrics',
+    ),
 )
@@ -1,33 +1,99 @@
 # -*- coding: utf-8 -*-
 
+import hashlib, hmac
 from django.conf import settings
-from lms.djangoapps.courseware.courses import get_course_with_access
+from lms.djangoapps.courseware.courses import get_course_overview_with_access, get_course_with_access
 from django.template.loader import render_to_string
 from web_fragments.fragment import Fragment
 from openedx.core.djangoapps.plugin_api.views import EdxFragmentView
 from xblock.fields import Scope
 from opaque_keys.edx.keys import CourseKey
-from lms.djangoapps.courseware.access import has_access
 from common.djangoapps.student.models import CourseEnrollment
 from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
 from django.utils.translation import ugettext_noop
+from django.views.generic import View
 
+from .ApiResponse import dumps
 from .RocketChatError import RocketChatError
-from .RocketChat import RocketChat
+from . import activity, backends, courses, metrics, provisioning, unread
 
 # Create your views here.
 
 
-class RocketChatView(EdxFragmentView):
+class RocketChatRoomMixin(object):
+    """Provisioning shared by the Chat tab and the JSON API"""
+
+    def init_rocket_chat_room(self, edx_info):
+        """Initializes the chat room using the edX course and user information
+            - Creates the room (if it does not exist)
+            - Creates the user (if they do not exist)
+            - Add the user to the room
+
+        Args:
+            edx_info (dict): The essential user and course information
+
+        Returns:
+            string: The URL to the RocketChat room
+        """
+
+        if(getattr(settings, 'ROCKETCHAT_ASYNC_CLIENT', False)):
+            # The calls run on the worker's event loop, which keeps its connections open
+            return provisioning.provision_room_async(edx_info)
+
+        return provisioning.provision_room(edx_info)
+
+
+    def get_login_token(self, edx_info):
+        """Gets a login token for the user if ROCKETCHAT_AUTO_LOGIN is set
+
+        The page passes it to the room (postMessage), which then opens right away instead of
+        going through the OAuth/SAML login. It is never put in a URL.
+
+        With ROCKETCHAT_UNREAD_BADGE, the token is also created (and kept on the server) so the
+        unread messages of the user can be synced (see unread).
+
+        Args:
+            edx_info (dict): The essential user and course information
+
+        Returns:
+            string: The token -OR- None. The user then logs in inside the iframe
+        """
+
+        auto_login = getattr(settings, 'ROCKETCHAT_AUTO_LOGIN', False)
+        if(not auto_login and not unread.is_enabled()):
+            return None
+
+        try:
+            token = provisioning.get_login_token(edx_info)
+        except RocketChatError:
+            return None
+
+        return token if auto_login else None
+
+
+class RocketChatView(RocketChatRoomMixin, EdxFragmentView):
     def render_to_fragment(self, request, course_id, **kwargs):
 
         course_key = CourseKey.from_string(course_id)
-        course = get_course_with_access(request.user, "load", course_key)
         user = request.user
+
+        if(getattr(settings, 'ROCKETCHAT_LOAD_COURSE', False)):
+            # The full course from the modulestore, for templates that need its content
+            course = get_course_with_access(user, "load", course_key)
+        else:
+            # The cached course overview: same access check, without loading the course
+            course = get_course_overview_with_access(user, "load", course_key)
+
         display_name_course = course.display_name
         
-        staff_access = bool(has_access(request.user, 'staff', course))
-        user_is_enrolled = CourseEnrollment.is_enrolled(user, course.id)
+        staff_access = courses.is_course_staff(user, course_key)
+        user_is_enrolled = CourseEnrollment.is_enrolled(user, course_key)
 
         # Check for AnonymousUser user
         if(isinstance(user, AnonymousUser)):
@@ -40,6 +106,9 @@ class RocketChatView(EdxFragmentView):
             # Additional profile fields
             # https://github.com/openedx/edx-platform/blob/master/common/djangoapps/student/models.py
         
+        # The Rocket.Chat server of the course (see backends)
+        base_url = backends.get_course_backend(course_id).base_url
+
         # For rocket_chat.html
         context = {
             "course": course,           # must in the root level to avoid "proctored exam error"
@@ -57,9 +126,13 @@ class RocketChatView(EdxFragmentView):
                 "key": course_key,
             },
             "rocket_chat": {
-                "base_url": settings.ROCKETCHAT_BASE_URL,
-                "room_url": settings.ROCKETCHAT_BASE_URL,
+                "base_url": base_url,
+                "room_url": base_url,
                 "error": "",
+                "pending": False,
+                "status_url": "",
+                "auto_login": getattr(settings, 'ROCKETCHAT_AUTO_LOGIN', False),
+                "login_token": None,
             }
         }
 
@@ -71,14 +144,47 @@ class RocketChatView(EdxFragmentView):
                 "key": course_id,
             }
         }
-          
-        try:
-            # Set the room_url if everything processed correctly
-            context["rocket_chat"]['room_url'] = self.init_rocket_chat_room(edx_info)
-        except RocketChatError as e:
-            # Oops
-            # Set error field and use the base RocketChat URL
-            context["rocket_chat"]['error'] = str(e)
+
+        if(user_is_enrolled and unread.is_enabled()):
+            # The room is read in this view: no badge on the tab until the next sync
+            unread.mark_read(user.username, course_id)
+
+        # The last known good room of the user (see provisioning.revalidate_in_background)
+        status = provisioning.get_status(course_id, user.username) if user_is_enrolled else None
+
+        if(status and status['state'] == provisioning.READY and provisioning.get_freshness() is not None):
+            # Render at cache speed, even if Rocket.Chat is slow or down. Once the freshness
+            #   budget is spent, the room is provisioned again in the background
+            provisioning.revalidate_in_background(course_id, user.username, lambda: edx_info)
+
+            context["rocket_chat"]['room_url'] = status['room_url']
+            context["rocket_chat"]['login_token'] = self.get_login_token(edx_info)
+
+        elif(getattr(settings, 'ROCKETCHAT_ASYNC_PROVISIONING', False) and user_is_enrolled):
+            # Render right away and let the page poll for the room URL
+            status = provisioning.provision_in_background(edx_info)
+
+            if(status['state'] == provisioning.READY):
+                context["rocket_chat"]['room_url'] = status['room_url']
+                context["rocket_chat"]['login_token'] = self.get_login_token(edx_info)
+            else:
+                context["rocket_chat"]['pending'] = True
+                context["rocket_chat"]['status_url'] = reverse(
+                    'rocketchat_status', kwargs={'course_id': course_id})
+
+        else:
+            try:
+                # Set the room_url if everything processed correctly
+                room_url = self.init_rocket_chat_room(edx_info)
+                context["rocket_chat"]['room_url'] = room_url
+                context["rocket_chat"]['login_token'] = self.get_login_token(edx_info)
+
+                # Lets the JSON API answer from the cache
+                provisioning.set_status(course_id, user.username, provisioning.READY, room_url=room_url)
+            except RocketChatError as e:
+                # Oops
+                # Set error field and use the base RocketChat URL
+                context["rocket_chat"]['error'] = str(e)
 
         html = render_to_string(
             'rocket_chat/rocket_chat.html', context, )
@@ -87,33 +193,179 @@ class RocketChatView(EdxFragmentView):
         return fragment
 
 
-    def init_rocket_chat_room(self, edx_info):
-        """Initializes the chat room using the edX course and user information
-            - Creates the room (if it does not exist)
-            - Creates the user (if they do not exist)
-            - Add the user to the room
+@method_decorator(login_required, name='dispatch')
+class RocketChatActivityView(EdxFragmentView):
+    """Shows the course team how active the course room is.
 
-        Args:
-            edx_info (dict): The essential user and course information
+    Only reads the summary tables filled by the rocketchat_activity management command
+    (see activity): Rocket.Chat is never called.
+    """
+
+    def render_to_fragment(self, request, course_id, **kwargs):
+
+        course_key = CourseKey.from_string(course_id)
+        user = request.user
+
+        if(not courses.is_course_staff(user, course_key)):
+            raise PermissionDenied
+
+        context = {
+            "course": get_course_overview_with_access(user, "load", course_key),
+            "activity": activity.get_course_activity(course_key),
+        }
+
+        html = render_to_string('rocket_chat/activity.html', context)
+        return Fragment(html)
+
+
+@method_decorator(login_required, name='dispatch')
+class RocketChatStatusView(RocketChatRoomMixin, View):
+    """Reports the background provisioning status of the current user.
+
+    Polled by rocket_chat.html when ROCKETCHAT_ASYNC_PROVISIONING is set. Only reads the cache
+    (and creates a login token with ROCKETCHAT_AUTO_LOGIN).
+    """
+
+    def get(self, request, course_id, **kwargs):
+
+        status = provisioning.get_status(course_id, request.user.username)
+
+        if(status['state'] == provisioning.READY and getattr(settings, 'ROCKETCHAT_AUTO_LOGIN', False)):
+            edx_info = provisioning.build_edx_info(request.user, course_id, '', is_staff=False)
+            status = dict(status, login_token=self.get_login_token(edx_info))
+
+        response = JsonResponse(status)
+        patch_cache_control(response, private=True, no_store=True)
+        return response
+
+
+@method_decorator(login_required, name='dispatch')
+class RocketChatApiView(RocketChatRoomMixin, View):
+    """Returns the room URL and provisioning status of the current user as JSON.
+
+    For frontends such as the Learning MFE:
+        {"state": "ready", "room_url": "https://my.chat.site/group/edx-...", "error": ""}
+
+    With ROCKETCHAT_AUTO_LOGIN, a ready status also has the user's "login_token". The client
+    passes it to the room iframe with postMessage ({"externalCommand": "login-with-token",
+    "token": ...}), never in the URL.
+
+    Once the room is ready, the answer comes from the provisioning status cache without
+    loading the course or calling Rocket.Chat (it is revalidated in the background once
+    ROCKETCHAT_STATUS_FRESHNESS is spent); only the enrollment is checked. Responses carry an
+    ETag, so a client revalidates with If-None-Match and gets a 304 while nothing changed. A
+    ready room may be reused for ROCKETCHAT_API_MAX_AGE seconds; pending and failed states must
+    be revalidated. Responses with a login token are never stored.
+    """
+
+    def get(self, request, course_id, **kwargs):
+
+        course_key = CourseKey.from_string(course_id)
+        user = request.user
+
+        # Also for a cached ready status: the learner may have unenrolled since
+        if(not CourseEnrollment.is_enrolled(user, course_key)):
+            return JsonResponse(
+                {"state": provisioning.FAILED, "room_url": "",
+                 "error": "Enrollment in the course is required to access the group chat."},
+                status=403)
+
+        status = provisioning.get_status(course_id, user.username)
+
+        if(status['state'] == provisioning.READY):
+            # Answered from the cache. Once the freshness budget is spent, revalidated in the background
+            def get_edx_info():
+                if(not CourseEnrollment.is_enrolled(user, course_key)):
+                    return None
+                return self.build_edx_info(user, course_key)
+
+            provisioning.revalidate_in_background(course_id, user.username, get_edx_info)
+
+        else:
+
+            edx_info = self.build_edx_info(user, course_key)
+
+            if(getattr(settings, 'ROCKETCHAT_ASYNC_PROVISIONING', False)):
+                # Poll this endpoint until the state is 'ready'
+                status = provisioning.provision_in_background(edx_info)
+            else:
+                try:
+                    room_url = self.init_rocket_chat_room(edx_info)
+                    status = provisioning.set_status(course_id, user.username, provisioning.READY, room_url=room_url)
+                except RocketChatError as e:
+                    status = provisioning.set_status(course_id, user.username, provisioning.FAILED, error=str(e))
+
+        if(status['state'] == provisioning.READY and getattr(settings, 'ROCKETCHAT_AUTO_LOGIN', False)):
+            # Passed to the room by the client (postMessage), never in the room URL
+            edx_info = provisioning.build_edx_info(user, course_id, '', is_staff=False)
+            status = dict(status, login_token=self.get_login_token(edx_info))
+
+        return self.make_response(request, status)
+
+
+    def build_edx_info(self, user, course_key):
+        return provisioning.build_edx_info(
+            user, course_key, courses.get_course_name(course_key), courses.is_course_staff(user, course_key))
+
+
+    def make_response(self, request, status):
+        """Builds the JSON response with the ETag and Cache-Control headers of the state
+
+        A status with a login token is never stored: it changes with every new token, so it
+        gets no ETag either.
 
         Returns:
-            string: The URL to the RocketChat room
+            HttpResponse: The status -OR- 304 Not Modified if the client's copy is current
         """
-        
-        rocketChat = RocketChat(edx_info)
-        
-        # 1) Get the room info
-        #    The room will be created if it does not exist
-        group_info = rocketChat.get_group_info()
-
-        # 2) Get the user info and add user to group
-        #    The user will be created if they do not exist
-        user_info = rocketChat.get_user_info()
-
-        # 3) Add the user to the group
-        #   is_staff users will be added as room owers
-        user_id = user_info.get('user', {}).get('_id')
-        group_id = group_info.get('group', {}).get('_id')
-        rocketChat.add_user_to_group(group_id, user_id)
-        
-        return rocketChat.get_room_url()
+
+        body = dumps(status)
+
+        if('login_token' in status):
+            response = HttpResponse(body, content_type='application/json')
+            patch_cache_control(response, private=True, no_store=True)
+            return response
+
+        etag = '"{0}"'.format(hashlib.md5(body).hexdigest())
+
+        response = get_conditional_response(request, etag=etag)
+        if(response is None):
+            response = HttpResponse(body, content_type='application/json')
+
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Cookie',))
+
+        if(status['state'] == provisioning.READY):
+            patch_cache_control(response, private=True, max_age=getattr(settings, 'ROCKETCHAT_API_MAX_AGE', 60 * 5))
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+
+        return response
+
+
+class RocketChatMetricsView(View):
+    """Exports the metrics of this worker process in the Prometheus text format.
+
+    Only available with ROCKETCHAT_METRICS = 'prometheus'. The scraper sends
+    'Authorization: Bearer <ROCKETCHAT_METRICS_TOKEN>'. Without a token, only global staff
+    can read the metrics.
+    """
+
+    def get(self, request, **kwargs):
+
+        if(not isinstance(metrics.sink, metrics.PrometheusSink)):
+            raise Http404
+
+        token = getattr(settings, 'ROCKETCHAT_METRICS_TOKEN', None)
+
+        if(token):
+            # Constant time, so the token cannot be guessed from the response times.
+            # As bytes: compare_digest rejects strings with non-ASCII characters
+            expected = 'Bearer {0}'.format(token).encode('utf-8')
+            allowed = hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode('utf-8'), expected)
+        else:
+            allowed = request.user.is_authenticated and request.user.is_staff
+
+        if(not allowed):
+            return HttpResponseForbidden()
+
+        return HttpResponse(metrics.sink.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -14,6 +14,12 @@ setuptools.setup(
     url="https://github.com/tony-h/rocketchat-tab",
     packages=setuptools.find_packages(),
     include_package_data=True,
+    extras_require={
+        # asyncio Rocket.Chat client (ROCKETCHAT_ASYNC_CLIENT)
+        "async": ["httpx"],
+        # Realtime (DDP/WebSocket) transport (ROCKETCHAT_TRANSPORT = 'realtime')
+        "realtime": ["websocket-client"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -26,6 +32,9 @@ setuptools.setup(
         "lms.djangoapp": [
             "rocketchat_tab = rocketchat_tab.apps:RocketChatConfig",
         ],
+        "cms.djangoapp": [
+            "rocketchat_tab = rocketchat_tab.apps:RocketChatConfig",
+        ],
         "openedx.course_tab": [
             "rocketchat_tab = rocketchat_tab.plugins:RocketChatTab",
         ]